@@ -30,6 +30,7 @@ def generate_clinvar_table(
     clinvar_folder: Path,
     snv_vcf: Path,
     date: str | None = None,
+    previous_table: Path | None = None,
 ):
     """
     set up the job that does de novo clinvar summary
@@ -39,6 +40,7 @@ def generate_clinvar_table(
         clinvar_folder (Path): where to write all clinvar files
         snv_vcf (Path): SNV VCF to generate
         date (str): date for submission filtering, optional
+        previous_table (Path): decisions from a previous run to update, optional
     """
 
     bash_job = get_batch().new_bash_job(name='copy clinvar files to local')
@@ -63,16 +65,25 @@ def generate_clinvar_table(
     summarise = get_batch().new_job(name='summarise clinvar')
     summarise.depends_on(bash_job)
 
-    summarise.cpu(2).image(get_config()['workflow']['driver_image']).storage('20G')
+    # optionally parse the submissions in parallel, one process per core
+    workers = get_config()['workflow'].get('clinvar_workers', 1)
+    summarise.cpu(max(2, workers)).image(
+        get_config()['workflow']['driver_image']
+    ).storage('20G')
     authenticate_cloud_credentials_in_job(summarise)
     command_options = (
         f'-s {bash_job.subs} '
         f'-v {bash_job.vars} '
         f'-o {clinvar_table_path} '
         f'--path_snv {snv_vcf} '
+        f'--workers {workers} '
     )
+    if get_config()['workflow'].get('clinvar_columnar', False):
+        command_options += ' --columnar'
     if date:
         command_options += f' -d {date}'
+    if previous_table:
+        command_options += f' --previous {previous_table}'
     summarise.command(f'python3 {get_git_root_relative_path_from_absolute(summarise_clinvar_entries.__file__)} {command_options}')
 
     return summarise
@@ -137,7 +148,14 @@ def generate_annotated_data(
 @click.command
 @click.option('--date', help='Submission cut-off date, optional', default=None)
 @click.option('--folder', help='Folder to write to, optional', default=None)
-def main(date: str | None = None, folder: str | None = None):
+@click.option(
+    '--previous',
+    help='Folder of a previous run, only changed decisions are updated',
+    default=None,
+)
+def main(
+    date: str | None = None, folder: str | None = None, previous: str | None = None
+):
     """
     run the clinvar summary, output to common path
     folder argument can override the common bucket output path
@@ -145,6 +163,7 @@ def main(date: str | None = None, folder: str | None = None):
     Args:
         date (str | None): a cut-off data for Clinvar subs
         folder (str | None): a folder to write to, optional
+        previous (str | None): folder of a previous run, optional
     """
 
     if folder is None:
@@ -185,7 +204,15 @@ def main(date: str | None = None, folder: str | None = None):
 
     # generate a new round of clinva decisions
     if not all(output.exists() for output in [clinvar_table_path, snv_vcf]):
-        dependency = generate_clinvar_table(clinvar_table_path, folder, snv_vcf, date)
+        dependency = generate_clinvar_table(
+            clinvar_table_path,
+            folder,
+            snv_vcf,
+            date,
+            previous_table=(
+                to_path(previous) / 'clinvar_decisions.ht' if previous else None
+            ),
+        )
 
     # create the annotation job(s)
     if not annotated_clinvar.exists():
@@ -5,22 +5,26 @@ Read, filter, annotate, classify, and write Genetic data
 - hard-filter (FILTERS, AC)
 - extract generic fields
 - remove all rows and consequences not relevant to GREEN genes
-- extract vep data into CSQ string(s)
+- extract vep data into CSQ string(s), or per-transcript structs
 - annotate with categories 1, 2, 3, 4, 5, and Support
 - remove un-categorised variants
-- write as VCF
+- write as VCF, or as a Hail Table
 """
 
 # pylint: disable=too-many-lines
 
 
 import os
+import hashlib
+import json
 import logging
 import sys
 from argparse import ArgumentParser
 from datetime import datetime
+from typing import Callable
 
 import hail as hl
+from hail.utils.java import FatalError
 from peddy import Ped
 
 from cpg_utils import to_path
@@ -49,6 +53,26 @@ LOFTEE_HC = hl.str('HC')
 PATHOGENIC = hl.str('pathogenic')
 
 
+def log_diagnostic_count(description: str, counter: Callable[[], int]) -> int | None:
+    """
+    counts are only used for logging, and each one re-runs the upstream
+    pipeline - only run them when diagnostic counts are enabled in config
+
+    Args:
+        description (str): what is being counted
+        counter (Callable): a zero-argument callable which triggers the count
+
+    Returns:
+        the count, or None if diagnostic counts are disabled
+    """
+    if not get_config()['workflow'].get('diagnostic_counts', False):
+        return None
+
+    count = counter()
+    logging.info(f'{description}: {count}')
+    return count
+
+
 def get_clinvar_table(key: str = 'clinvar_decisions') -> str | None:
     """
     try and identify the clinvar table to use
@@ -185,25 +209,15 @@ def annotate_codon_clinvar(mt: hl.MatrixTable):
     takes the protein indexed clinvar results and matches up against
     the variant data
 
-    this might be a grossly inefficient method...
-
     The process is:
     1. load up the hail table of all clinvar annotations indexed by residue
-    2. re-shuffle the current variant MT to be similarly indexed on residue
-    3. match the datasets across to get residues, clinvar, and corresponding
-        loci within this callset
-    4. explode that back out to index all the clinvar alleles directly on the
-        loci relevant to this callset
-    5. use that final table to annotate all relevant clinvar allele IDs as a
-        flag, indicating when a variant in this callset creates a residue change
-        seen in clinvar
-
-    Note - this might include more munging than necessary, but frankly, I'm not
-    smart enough to simplify it. I'll bookmark it for future consideration.
-
-    "Everyone knows that debugging is twice as hard as writing a program in the
-    first place. So if you're as clever as you can be when you write it, how will
-    you ever debug it?” ― Brian Kernighan
+    2. collect that (small) table into a dictionary, broadcast as a literal
+    3. for each SNV row, form the Transcript::Residue key for each missense
+        transcript consequence, and look those up in the dictionary
+    4. annotate all relevant clinvar allele IDs as a flag, indicating when a
+        variant in this callset creates a residue change seen in clinvar
+
+    No re-keying or shuffling of the variant data is required
 
     This matching is universal, i.e. if a variant is the exact position and change
     creating a known pathogenic missense, this method should always find that
@@ -228,81 +242,45 @@ def annotate_codon_clinvar(mt: hl.MatrixTable):
             info=mt.info.annotate(categorydetailsPM5=MISSING_STRING)
         )
 
-    # read in the codon table
+    # read in the codon table, and collect as {Transcript::Residue: alleles}
     logging.info(f'Reading clinvar alleles by codon from {codon_table_path}')
     codon_clinvar = hl.read_table(str(codon_table_path))
-
-    # boom those variants out by consequence
-    codon_variants = mt.explode_rows(mt.vep.transcript_consequences).rows()
-
-    # filter for missense, no indels (don't trust VEP)
-    codon_variants = codon_variants.filter(
-        (hl.len(codon_variants.alleles[0]) == ONE_INT)
-        & (hl.len(codon_variants.alleles[1]) == ONE_INT)
-        & (
-            codon_variants.vep.transcript_consequences.consequence_terms.contains(
-                'missense_variant'
-            )
+    codon_dict = dict(
+        codon_clinvar.aggregate(
+            hl.agg.collect((codon_clinvar.key[0], codon_clinvar.clinvar_alleles))
         )
     )
+    logging.info(f'{len(codon_dict)} residues with ClinVar missense variants')
+    codon_lookup = hl.literal(codon_dict, dtype=hl.tdict(hl.tstr, hl.tstr))
 
-    # set the protein residue as an attribute
-    codon_variants = codon_variants.annotate(
-        residue_affected=hl.str('::').join(
-            [
-                codon_variants.vep.transcript_consequences.protein_id,
-                hl.str(codon_variants.vep.transcript_consequences.protein_start),
-            ]
+    # all clinvar entries at residues affected by a missense consequence
+    clinvar_variations = hl.set(
+        mt.vep.transcript_consequences.filter(
+            lambda x: x.consequence_terms.contains('missense_variant')
         )
-    )
-
-    # 4. re-key the table on Transcript::Codon
-    codon_variants = codon_variants.key_by(codon_variants.residue_affected)
-
-    # 5. extract the position table (protein change linked to all loci)
-    codon_variants = codon_variants.select(
-        codon_variants.locus, codon_variants.alleles
-    ).collect_by_key(name='positions')
-
-    # join the real variant positions with aggregated clinvar
-    # 'values' here is the array of all positions
-    codon_variants = codon_variants.join(codon_clinvar)
-
-    # explode back out to release the positions
-    codon_variants = codon_variants.explode(codon_variants.positions)
-
-    # annotate positions back to normal names (not required?)
-    codon_variants = codon_variants.transmute(
-        locus=codon_variants.positions.locus, alleles=codon_variants.positions.alleles
-    )
-
-    # re-key by locus/allele
-    codon_variants = codon_variants.key_by(codon_variants.locus, codon_variants.alleles)
-
-    # aggregate back to position and alleles
-    codon_variants = codon_variants.select(
-        codon_variants.clinvar_alleles
-    ).collect_by_key(name='clinvar_variations')
-
-    codon_variants = codon_variants.annotate(
-        clinvar_variations=hl.str('+').join(
-            hl.set(
-                hl.map(lambda x: x.clinvar_alleles, codon_variants.clinvar_variations)
+        .map(
+            lambda x: codon_lookup.get(
+                hl.str('::').join([x.protein_id, hl.str(x.protein_start)])
             )
         )
+        .filter(hl.is_defined)
     )
 
-    # conditional annotation back into the original MT
-    mt = mt.annotate_rows(
+    # annotate SNVs only (don't trust VEP on indels), else 'missing'
+    return mt.annotate_rows(
         info=mt.info.annotate(
             categorydetailsPM5=hl.or_else(
-                codon_variants[mt.row_key].clinvar_variations, MISSING_STRING
+                hl.or_missing(
+                    (hl.len(mt.alleles[0]) == ONE_INT)
+                    & (hl.len(mt.alleles[1]) == ONE_INT)
+                    & (hl.len(clinvar_variations) > 0),
+                    hl.str('+').join(clinvar_variations),
+                ),
+                MISSING_STRING,
             )
         )
     )
 
-    return mt
-
 
 def filter_matrix_by_ac(
     mt: hl.MatrixTable, ac_threshold: float | None = 0.01
@@ -355,6 +333,174 @@ def filter_to_well_normalised(mt: hl.MatrixTable) -> hl.MatrixTable:
     return mt.filter_rows((hl.len(mt.alleles) == 2) & (mt.alleles[1] != '*'))
 
 
+def transcript_category_flags(
+    transcripts: hl.ArrayExpression,
+    flag_names: tuple[str, ...] = ('critical', 'loftee', 'sift', 'polyphen'),
+) -> hl.ArrayExpression:
+    """
+    evaluates each per-transcript predicate used by the categories once,
+    giving one struct of flags per transcript
+    missing predicates are treated as False, as a filter would drop them
+
+    Args:
+        transcripts (): the vep.transcript_consequences array
+        flag_names (): the flags to build, only these fields are read
+    Returns:
+        array of structs, one boolean field per requested flag
+    """
+
+    filter_config = get_config()['filter']
+    critical_consequences = hl.set(filter_config['critical_csq'])
+    predicates = {
+        'critical': lambda x: hl.len(
+            critical_consequences.intersection(hl.set(x.consequence_terms))
+        )
+        > 0,
+        'loftee': lambda x: (x.lof == LOFTEE_HC) | (hl.is_missing(x.lof)),
+        'sift': lambda x: hl.or_else(x.sift_score, MISSING_FLOAT_HI)
+        <= filter_config.get('sift'),
+        'polyphen': lambda x: hl.or_else(x.polyphen_score, MISSING_FLOAT_LO)
+        >= filter_config.get('polyphen'),
+    }
+
+    return transcripts.map(
+        lambda x: hl.struct(
+            **{name: hl.or_else(predicates[name](x), False) for name in flag_names}
+        )
+    )
+
+
+def category_1_expression(mt: hl.MatrixTable) -> hl.Int32Expression:
+    """
+    Category1 flag: clinvar_aip_strong, as set in annotate_aip_clinvar
+
+    Args:
+        mt ():
+    Returns:
+        1 or missing, per row
+    """
+
+    return hl.if_else(mt.info.clinvar_aip_strong == ONE_INT, ONE_INT, MISSING_INT)
+
+
+def category_2_expression(
+    mt: hl.MatrixTable,
+    new_genes: hl.SetExpression | None,
+    flags: hl.ArrayExpression,
+) -> hl.Int32Expression:
+    """
+    Category2 flag: gene is new in PanelApp, and clinvar pathogenic,
+    a critical consequence, or a high in silico prediction
+
+    Args:
+        mt ():
+        new_genes (): the new genes in this panelapp content
+        flags (): per-transcript flags, from transcript_category_flags
+    Returns:
+        1 or missing, per row
+    """
+
+    # permit scenario with no new genes
+    if new_genes is None:
+        return MISSING_INT
+
+    filter_config = get_config()['filter']
+
+    # check for new - if new, allow for in silico, CSQ, or clinvar to confirm
+    return hl.if_else(
+        (new_genes.contains(mt.geneIds))
+        & (
+            flags.any(lambda x: x.critical)
+            | (mt.info.clinvar_aip == ONE_INT)
+            | (
+                (mt.info.cadd > filter_config['cadd'])
+                | (mt.info.revel > filter_config['revel'])
+            )
+        ),
+        ONE_INT,
+        MISSING_INT,
+    )
+
+
+def category_3_expression(
+    mt: hl.MatrixTable, flags: hl.ArrayExpression
+) -> hl.Int32Expression:
+    """
+    Category3 flag: a critical consequence on at least one transcript, and
+    either a LOFTEE HC critical transcript or pathogenic in Clinvar
+
+    Args:
+        mt ():
+        flags (): per-transcript flags, from transcript_category_flags
+    Returns:
+        1 or missing, per row
+    """
+
+    # First check if we have any HIGH consequences
+    # then explicitly link the LOFTEE check with HIGH consequences
+    # OR allow for a pathogenic ClinVar, any Stars
+    return hl.if_else(
+        flags.any(lambda x: x.critical)
+        & (
+            flags.any(lambda x: x.critical & x.loftee)
+            | (mt.info.clinvar_aip == ONE_INT)
+        ),
+        ONE_INT,
+        MISSING_INT,
+    )
+
+
+def category_5_expression(mt: hl.MatrixTable) -> hl.Int32Expression:
+    """
+    Category5 flag: SpliceAI delta above threshold
+
+    Args:
+        mt ():
+    Returns:
+        1 or missing, per row
+    """
+
+    return hl.if_else(
+        mt.info.splice_ai_delta >= get_config()['filter']['spliceai'],
+        ONE_INT,
+        MISSING_INT,
+    )
+
+
+def category_support_expression(
+    mt: hl.MatrixTable, flags: hl.ArrayExpression
+) -> hl.Int32Expression:
+    """
+    CategorySupport flag: CADD & REVEL above threshold, or sift, polyphen,
+    and mutationtaster all in agreement
+
+    Args:
+        mt ():
+        flags (): per-transcript flags, from transcript_category_flags
+    Returns:
+        1 or missing, per row
+    """
+
+    filter_config = get_config()['filter']
+
+    return hl.if_else(
+        (
+            (mt.info.cadd > filter_config.get('cadd'))
+            & (mt.info.revel > filter_config.get('revel'))
+        )
+        | (
+            flags.any(lambda x: x.sift)
+            & flags.any(lambda x: x.polyphen)
+            & (
+                (mt.info.mutationtaster.contains('D'))
+                | (mt.info.mutationtaster == 'missing')
+            )
+        ),
+        ONE_INT,
+        MISSING_INT,
+    )
+
+
 def annotate_category_1(mt: hl.MatrixTable) -> hl.MatrixTable:
     """
     Applies the boolean Category1 annotation
@@ -368,13 +514,7 @@ def annotate_category_1(mt: hl.MatrixTable) -> hl.MatrixTable:
     """
 
     return mt.annotate_rows(
-        info=mt.info.annotate(
-            categoryboolean1=hl.if_else(
-                mt.info.clinvar_aip_strong == ONE_INT,
-                ONE_INT,
-                MISSING_INT,
-            )
-        )
+        info=mt.info.annotate(categoryboolean1=category_1_expression(mt))
     )
 
 
@@ -394,40 +534,10 @@ def annotate_category_2(
         same variants, categoryboolean2 set to 1 or 0
     """
 
-    critical_consequences = hl.set(get_config()['filter']['critical_csq'])
-
-    # permit scenario with no new genes
-    if new_genes is None:
-        return mt.annotate_rows(info=mt.info.annotate(categoryboolean2=MISSING_INT))
-
-    # check for new - if new, allow for in silico, CSQ, or clinvar to confirm
+    flags = transcript_category_flags(mt.vep.transcript_consequences, ('critical',))
     return mt.annotate_rows(
         info=mt.info.annotate(
-            categoryboolean2=hl.if_else(
-                (new_genes.contains(mt.geneIds))
-                & (
-                    (
-                        hl.len(
-                            mt.vep.transcript_consequences.filter(
-                                lambda x: hl.len(
-                                    critical_consequences.intersection(
-                                        hl.set(x.consequence_terms)
-                                    )
-                                )
-                                > 0
-                            )
-                        )
-                        > 0
-                    )
-                    | (mt.info.clinvar_aip == ONE_INT)
-                    | (
-                        (mt.info.cadd > get_config()['filter']['cadd'])
-                        | (mt.info.revel > get_config()['filter']['revel'])
-                    )
-                ),
-                ONE_INT,
-                MISSING_INT,
-            )
+            categoryboolean2=category_2_expression(mt, new_genes, flags)
         )
     )
 
@@ -445,52 +555,11 @@ def annotate_category_3(mt: hl.MatrixTable) -> hl.MatrixTable:
         same variants, categoryboolean3 set to 1 or 0
     """
 
-    critical_consequences = hl.set(get_config()['filter']['critical_csq'])
-
-    # First check if we have any HIGH consequences
-    # then explicitly link the LOFTEE check with HIGH consequences
-    # OR allow for a pathogenic ClinVar, any Stars
+    flags = transcript_category_flags(
+        mt.vep.transcript_consequences, ('critical', 'loftee')
+    )
     return mt.annotate_rows(
-        info=mt.info.annotate(
-            categoryboolean3=hl.if_else(
-                (
-                    hl.len(
-                        mt.vep.transcript_consequences.filter(
-                            lambda x: (
-                                hl.len(
-                                    critical_consequences.intersection(
-                                        hl.set(x.consequence_terms)
-                                    )
-                                )
-                                > 0
-                            )
-                        )
-                    )
-                    > 0
-                )
-                & (
-                    (
-                        hl.len(
-                            mt.vep.transcript_consequences.filter(
-                                lambda x: (
-                                    hl.len(
-                                        critical_consequences.intersection(
-                                            hl.set(x.consequence_terms)
-                                        )
-                                    )
-                                    > 0
-                                )
-                                & ((x.lof == LOFTEE_HC) | (hl.is_missing(x.lof)))
-                            )
-                        )
-                        > 0
-                    )
-                    | (mt.info.clinvar_aip == ONE_INT)
-                ),
-                ONE_INT,
-                MISSING_INT,
-            )
-        )
+        info=mt.info.annotate(categoryboolean3=category_3_expression(mt, flags))
     )
 
 
@@ -531,6 +600,43 @@ def filter_by_consequence(mt: hl.MatrixTable) -> hl.MatrixTable:
     )
 
 
+def filter_to_de_novo_candidates(
+    mt: hl.MatrixTable, pedigree: hl.Pedigree
+) -> hl.MatrixTable:
+    """
+    reduce the MT to the trio members, and to rows where the variant could
+    be de novo in at least one trio - the child has a non-ref call, and
+    at least one parent is called hom-ref (only one parent is checked by
+    hl.de_novo for hemizygous regions)
+
+    Args:
+        mt ():
+        pedigree (): the parsed PLINK pedigree, with at least one complete trio
+
+    Returns:
+        the MT with only trio columns and candidate de novo rows
+    """
+
+    trios = pedigree.complete_trios()
+    trio_samples = hl.literal(
+        {sample for trio in trios for sample in [trio.s, trio.pat_id, trio.mat_id]}
+    )
+    mt = mt.filter_cols(trio_samples.contains(mt.s))
+
+    # one row-level aggregation to find the non-ref & hom-ref samples
+    mt = mt.annotate_rows(
+        non_ref=hl.agg.filter(mt.GT.is_non_ref(), hl.agg.collect_as_set(mt.s)),
+        hom_ref=hl.agg.filter(mt.GT.is_hom_ref(), hl.agg.collect_as_set(mt.s)),
+    )
+    mt = mt.filter_rows(
+        hl.literal([(trio.s, trio.pat_id, trio.mat_id) for trio in trios]).any(
+            lambda trio: mt.non_ref.contains(trio[0])
+            & (mt.hom_ref.contains(trio[1]) | mt.hom_ref.contains(trio[2]))
+        )
+    )
+    return mt.drop('non_ref', 'hom_ref')
+
+
 def annotate_category_4(mt: hl.MatrixTable, plink_family_file: str) -> hl.MatrixTable:
     """
     Category based on de novo MOI, restricted to a group of consequences
@@ -546,11 +652,19 @@ def annotate_category_4(mt: hl.MatrixTable, plink_family_file: str) -> hl.Matrix
         where de novo inheritance is seen
     """
 
+    pedigree = hl.Pedigree.read(plink_family_file)
+
+    # singletons & incomplete families can't have a de novo call
+    if not pedigree.complete_trios():
+        logging.info('No complete trios in the pedigree, skipping de novo search')
+        return mt.annotate_rows(info=mt.info.annotate(categorysample4=MISSING_STRING))
+
     logging.info('Running de novo search')
 
     de_novo_matrix = filter_by_consequence(mt)
 
-    pedigree = hl.Pedigree.read(plink_family_file)
+    # in-sample AF is ignored below, so dropping non-trio columns is safe
+    de_novo_matrix = filter_to_de_novo_candidates(de_novo_matrix, pedigree)
 
     logging.info('Updating synthetic PL values for WT calls where missing')
 
@@ -587,14 +701,14 @@ def annotate_category_4(mt: hl.MatrixTable, plink_family_file: str) -> hl.Matrix
     )
 
     # log the number of variants found this way
-    logging.info(f'{dn_table.count()} variants showed de novo inheritance')
+    log_diagnostic_count('Variants showing de novo inheritance', dn_table.count)
 
     # annotate those values as a flag if relevant, else 'missing'
     return mt.annotate_rows(
         info=mt.info.annotate(
             **{
                 'categorysample4': hl.or_else(
-                    dn_table[mt.row_key].values, MISSING_STRING
+                    dn_table[mt.row_key]['values'], MISSING_STRING
                 )
             }
         )
@@ -612,13 +726,7 @@ def annotate_category_5(mt: hl.MatrixTable) -> hl.MatrixTable:
     """
 
     return mt.annotate_rows(
-        info=mt.info.annotate(
-            categoryboolean5=hl.if_else(
-                mt.info.splice_ai_delta >= get_config()['filter']['spliceai'],
-                ONE_INT,
-                MISSING_INT,
-            )
-        )
+        info=mt.info.annotate(categoryboolean5=category_5_expression(mt))
     )
 
 
@@ -642,34 +750,42 @@ def annotate_category_support(mt: hl.MatrixTable) -> hl.MatrixTable:
         same variants, categorysupport set to 0 or 1
     """
 
+    flags = transcript_category_flags(
+        mt.vep.transcript_consequences, ('sift', 'polyphen')
+    )
     return mt.annotate_rows(
-        info=mt.info.annotate(
-            categorysupport=hl.if_else(
-                (
-                    (mt.info.cadd > get_config()['filter'].get('cadd'))
-                    & (mt.info.revel > get_config()['filter'].get('revel'))
-                )
-                | (
-                    (
-                        mt.vep.transcript_consequences.any(
-                            lambda x: hl.or_else(x.sift_score, MISSING_FLOAT_HI)
-                            <= get_config()['filter'].get('sift')
-                        )
-                    )
-                    & (
-                        mt.vep.transcript_consequences.any(
-                            lambda x: hl.or_else(x.polyphen_score, MISSING_FLOAT_LO)
-                            >= get_config()['filter'].get('polyphen')
-                        )
-                    )
-                    & (
-                        (mt.info.mutationtaster.contains('D'))
-                        | (mt.info.mutationtaster == 'missing')
-                    )
-                ),
-                ONE_INT,
-                MISSING_INT,
-            )
+        info=mt.info.annotate(categorysupport=category_support_expression(mt, flags))
+    )
+
+
+def annotate_categories(
+    mt: hl.MatrixTable, new_genes: hl.SetExpression | None
+) -> hl.MatrixTable:
+    """
+    applies Categories 1, 2, 3, 5, and Support in a single row projection
+    uses the same category expressions as the individual annotate_category_*
+    methods, but each per-transcript predicate is evaluated once per
+    transcript and shared between all the categories which use it
+
+    Args:
+        mt ():
+        new_genes (): the new genes in this panelapp content
+    Returns:
+        same variants, with all these category flags set to 1 or 0
+    """
+
+    def categorise(flags: hl.ArrayExpression) -> hl.StructExpression:
+        return mt.info.annotate(
+            categoryboolean1=category_1_expression(mt),
+            categoryboolean2=category_2_expression(mt, new_genes, flags),
+            categoryboolean3=category_3_expression(mt, flags),
+            categoryboolean5=category_5_expression(mt),
+            categorysupport=category_support_expression(mt, flags),
+        )
+
+    return mt.annotate_rows(
+        info=hl.rbind(
+            transcript_category_flags(mt.vep.transcript_consequences), categorise
         )
     )
 
@@ -732,9 +848,174 @@ def split_rows_by_gene_and_filter_to_green(
     return mt
 
 
-def vep_struct_to_csq(vep_expr: hl.expr.StructExpression) -> hl.expr.ArrayExpression:
+def filter_rows_to_candidates(
+    mt: hl.MatrixTable, green_genes: hl.SetExpression | None = None
+) -> hl.Table:
+    """
+    row-only filtering phase, run before any entry data is touched
+    applies the clinvar, quality, normalisation, AC, population-rare, and
+    green-gene filters to the rows of the MT alone
+
+    the rows are placed in a column-less MatrixTable so the same filter
+    methods apply, without reading or carrying any entries
+
+    Args:
+        mt (): the MT being analysed
+        green_genes (): set of all relevant genes
+
+    Returns:
+        a key-only Table of the rows which pass all row filters
+    """
+
+    row_mt = hl.MatrixTable.from_rows_table(mt.rows())
+    row_mt = annotate_aip_clinvar(mt=row_mt)
+    row_mt = filter_on_quality_flags(mt=row_mt)
+    row_mt = filter_to_well_normalised(mt=row_mt)
+    row_mt = extract_annotations(mt=row_mt)
+    row_mt = filter_matrix_by_ac(mt=row_mt)
+    row_mt = filter_to_population_rare(mt=row_mt)
+
+    # any green gene, without exploding the rows by gene
+    if green_genes is not None:
+        row_mt = row_mt.filter_rows(row_mt.geneIds.any(green_genes.contains))
+
+    return row_mt.rows().select()
+
+
+def prefilter_annotated_matrix(
+    mt: hl.MatrixTable, green_genes: hl.SetExpression | None = None
+) -> hl.MatrixTable:
+    """
+    reduce the MT to candidate rows, then apply the clinvar & generic
+    annotations. Without green genes this is independent of the panels
+    and pedigree, so the result can be cached and reused between runs
+
+    Args:
+        mt (): the annotated MT
+        green_genes (): set of all relevant genes, or None to keep all genes
+
+    Returns:
+        the MT reduced to candidate rows, with annotations in INFO
+    """
+
+    # find the rows passing all row-level filters, without touching entries
+    # write those keys as a compact table, then reduce the MT to them once
+    candidate_rows = filter_rows_to_candidates(mt=mt, green_genes=green_genes)
+    candidate_rows = candidate_rows.checkpoint(
+        output_path('candidate_rows.ht', 'tmp'), overwrite=True
+    )
+
+    # die if there are no variants remaining, count is from table metadata
+    if candidate_rows.count() == 0:
+        raise ValueError('No remaining rows to process!')
+
+    mt = mt.semi_join_rows(candidate_rows)
+
+    # the remaining rows already pass the quality, normalisation, and
+    # frequency filters - re-apply the row annotations those filters used
+    # swap out the default clinvar annotations with private clinvar
+    mt = annotate_aip_clinvar(mt=mt)
+
+    # shrink the time taken to write checkpoints
+    mt = drop_useless_fields(mt=mt)
+
+    return extract_annotations(mt=mt)
+
+
+def annotation_cache_path(mt_path: str) -> str | None:
+    """
+    the pre-filtered MT depends only on the input MT, the ClinVar table, and
+    the rare-variant threshold - not on the panels or pedigree. Digest those
+    inputs into a content-addressed path within the configured cache
+
+    the source of this module and the Hail version are part of the digest,
+    so a change to the annotation code or schema is never served stale
+
+    Args:
+        mt_path (str): the input MT
+
+    Returns:
+        the path for the cached MT, or None if no cache is configured
+    """
+    cache_root = get_config()['workflow'].get('annotation_cache')
+    if not cache_root:
+        return None
+
+    def table_version(table_path: str | None) -> str | None:
+        if table_path is None:
+            return None
+        return str(
+            hl.hadoop_stat(os.path.join(table_path, 'metadata.json.gz'))[
+                'modification_time'
+            ]
+        )
+
+    mt_path = mt_path.rstrip('/')
+    clinvar = get_clinvar_table()
+    with open(__file__, 'rb') as handle:
+        code_version = hashlib.sha256(handle.read()).hexdigest()
+    cache_key = {
+        'code_version': code_version,
+        'hail_version': hl.__version__,
+        'mt': mt_path,
+        'mt_version': table_version(mt_path),
+        'clinvar': clinvar,
+        'clinvar_version': table_version(clinvar),
+        'af_semi_rare': get_config()['filter']['af_semi_rare'],
+    }
+    digest = hashlib.sha256(
+        json.dumps(cache_key, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+    return os.path.join(cache_root, f'{digest[:16]}.mt')
+
+
+def csq_values_from_struct(
+    element: hl.expr.StructExpression, vep_expr: hl.expr.StructExpression
+) -> dict[str, hl.expr.StringExpression]:
     """
     Taken shamelessly from the gnomad library source code
+    Given one transcript consequence from a VEP Struct, returns the values
+    of each field in `csq_fields`, formatted as their VEP CSQ counterparts
+
+    Args:
+        element (hl.Struct): one transcript consequence
+        vep_expr (hl.Struct): the whole VEP struct, for per-variant fields
+    Returns:
+        an ordered dict of {CSQ field: formatted String}
+    """
+    # Most fields are 1-1, just lowercase
+    fields = dict(element)
+
+    # Add general exceptions
+    fields.update(
+        {
+            'consequence': hl.delimit(element.consequence_terms, delimiter='&'),
+            'feature': element.transcript_id,
+            'variant_class': vep_expr.variant_class,
+            'ensp': element.protein_id,
+            'gene': element.gene_id,
+            'symbol': element.gene_symbol,
+            'sift': element.sift_prediction
+            + '('
+            + hl.format('%.3f', element.sift_score)
+            + ')',
+            'polyphen': element.polyphen_prediction
+            + '('
+            + hl.format('%.3f', element.polyphen_score)
+            + ')',
+            'mane_select': element.mane_select,
+        }
+    )
+
+    # pull the required fields and ordering from config
+    return {
+        f: hl.or_else(hl.str(fields.get(f, '')), '')
+        for f in get_config()['csq']['csq_string']
+    }
+
+
+def vep_struct_to_csq(vep_expr: hl.expr.StructExpression) -> hl.expr.ArrayExpression:
+    """
     Given a VEP Struct, returns an array of VEP VCF CSQ strings
     (1 per csq in the struct).
     Fields & order correspond to those in `csq_fields`, corresponding to the
@@ -748,45 +1029,14 @@ def vep_struct_to_csq(vep_expr: hl.expr.StructExpression) -> hl.expr.ArrayExpres
         generates an array of Strings for each CSQ
     """
 
-    def get_csq_from_struct(
-        element: hl.expr.StructExpression,
-    ) -> hl.expr.StringExpression:
-        # Most fields are 1-1, just lowercase
-        fields = dict(element)
-
-        # Add general exceptions
-        fields.update(
-            {
-                'consequence': hl.delimit(element.consequence_terms, delimiter='&'),
-                'feature': element.transcript_id,
-                'variant_class': vep_expr.variant_class,
-                'ensp': element.protein_id,
-                'gene': element.gene_id,
-                'symbol': element.gene_symbol,
-                'sift': element.sift_prediction
-                + '('
-                + hl.format('%.3f', element.sift_score)
-                + ')',
-                'polyphen': element.polyphen_prediction
-                + '('
-                + hl.format('%.3f', element.polyphen_score)
-                + ')',
-                'mane_select': element.mane_select,
-            }
-        )
-
-        # pull the required fields and ordering from config
-        csq_fields = get_config()['csq']['csq_string']
-
-        return hl.delimit(
-            [hl.or_else(hl.str(fields.get(f, '')), '') for f in csq_fields], '|'
-        )
-
     csq = hl.empty_array(hl.tstr)
-    # pylint: disable=unnecessary-lambda
     csq = csq.extend(
         hl.or_else(
-            vep_expr['transcript_consequences'].map(lambda x: get_csq_from_struct(x)),
+            vep_expr['transcript_consequences'].map(
+                lambda x: hl.delimit(
+                    list(csq_values_from_struct(x, vep_expr).values()), '|'
+                )
+            ),
             hl.empty_array(hl.tstr),
         )
     )
@@ -795,6 +1045,32 @@ def vep_struct_to_csq(vep_expr: hl.expr.StructExpression) -> hl.expr.ArrayExpres
     return hl.or_missing(hl.len(csq) > 0, csq)
 
 
+def vep_struct_to_transcripts(
+    vep_expr: hl.expr.StructExpression,
+) -> hl.expr.ArrayExpression:
+    """
+    Given a VEP Struct, returns an array of Structs, 1 per transcript
+    consequence, with one field per entry in `csq_fields`
+
+    The values are formatted as in the CSQ string, but are stored as
+    separate fields - no delimiting here, and no string splitting to
+    decode them in the MOI stage
+
+    Args:
+        vep_expr (hl.Struct):
+    Returns:
+        an array of per-transcript Structs, empty if there are none
+    """
+    return hl.or_else(
+        vep_expr['transcript_consequences'].map(
+            lambda x: hl.struct(**csq_values_from_struct(x, vep_expr))
+        ),
+        hl.empty_array(
+            hl.tstruct(**{f: hl.tstr for f in get_config()['csq']['csq_string']})
+        ),
+    )
+
+
 def extract_annotations(mt: hl.MatrixTable) -> hl.MatrixTable:
     """
     pull out select fields which aren't per-consequence
@@ -866,31 +1142,83 @@ def write_matrix_to_vcf(mt: hl.MatrixTable):
     write the remaining MatrixTable content to file as a VCF
 
     generate a custom header containing the CSQ contents which
-    were retained during this run
+    were retained during this run - this is passed as export metadata,
+    no separate header file is written
+
+    if sharded_vcf is set in config, write one VCF per partition, each
+    with a full header & index, alongside Hail's shard manifest. The MOI
+    stage reads these shards directly, avoiding a single-file concatenation
 
     Args:
         mt (): the whole MatrixTable
-    Returns:
-        path to write MT out to
     """
 
-    # this temp file needs to be in GCP, not local
-    # otherwise the batch that generates the file won't be able to read
-    additional_cloud_path = output_path('additional_header.txt', 'tmp')
-
     # generate a CSQ string specific to the config file for decoding later
     csq_contents = '|'.join(get_config()['csq']['csq_string'])
-
-    # write this custom header locally
-    with to_path(additional_cloud_path).open('w') as handle:
-        handle.write(
-            f'##INFO=<ID=CSQ,Number=.,Type=String,Description="Format: {csq_contents}">'
-        )
+    metadata = {
+        'info': {
+            'CSQ': {
+                'Description': f'Format: {csq_contents}',
+                'Number': '.',
+                'Type': 'String',
+            }
+        }
+    }
 
     # create output path
     vcf_out = output_path('hail_categorised.vcf.bgz', 'analysis')
+
+    if get_config()['workflow'].get('sharded_vcf', False):
+        logging.info(f'Writing categorised variants out to shards in {vcf_out}')
+        hl.export_vcf(
+            mt,
+            vcf_out,
+            metadata=metadata,
+            parallel='header_per_shard',
+            tabix=True,
+        )
+        return
+
     logging.info(f'Writing categorised variants out to {vcf_out}')
-    hl.export_vcf(mt, vcf_out, append_to_header=additional_cloud_path, tabix=True)
+    hl.export_vcf(mt, vcf_out, metadata=metadata, tabix=True)
+
+
+def write_matrix_to_table(mt: hl.MatrixTable, table_out: str):
+    """
+    write the remaining MatrixTable content to file as a Hail Table
+    an alternative to the VCF, read directly by the MOI stage
+
+    each row holds the INFO struct, the typed per-transcript consequences,
+    and a sparse genotype table - only the non-ref calls are kept, as a
+    struct per carrier indexing into the `samples` global
+
+    Args:
+        mt (): the whole MatrixTable, with a `transcripts` row field
+        table_out (str): where to write the Table
+    """
+
+    mt = mt.add_col_index(name='sample_index')
+
+    carrier_fields = {
+        'sample_index': mt.sample_index,
+        'GT': mt.GT,
+        # alt read fraction, as calculated by cyvcf2 from the AD values
+        'AB': hl.or_missing(hl.sum(mt.AD) > 0, hl.sum(mt.AD[1:]) / hl.sum(mt.AD)),
+        'DP': mt.DP,
+    }
+    if 'PS' in mt.entry:
+        carrier_fields['PS'] = mt.PS
+
+    mt = mt.annotate_rows(
+        carriers=hl.agg.filter(
+            mt.GT.is_non_ref(), hl.agg.collect(hl.struct(**carrier_fields))
+        )
+    )
+    table = mt.rows().select('info', 'transcripts', 'carriers')
+    table = table.select_globals(samples=hl.literal(mt.s.collect()))
+
+    logging.info(f'Writing categorised variants out to {table_out}')
+    table.write(table_out, overwrite=True)
 
 
 def green_and_new_from_panelapp(
@@ -923,39 +1251,183 @@ def green_and_new_from_panelapp(
     return green_gene_set_expression, None
 
 
+def panel_gene_intervals(
+    panel_genes: dict[str, dict], padding: int = 5000
+) -> list[hl.Interval] | None:
+    """
+    use the GRCh38 location recorded for each PanelApp gene
+    to generate a padded interval per gene, merging any overlaps
+
+    Args:
+        panel_genes (): the 'genes' contents from the panelapp dictionary
+        padding (): bases to add on either side of each gene
+
+    Returns:
+        sorted, disjoint intervals covering all genes; or None if any gene
+        doesn't have a usable location, in which case the whole MT is required
+    """
+    reference = hl.get_reference('GRCh38')
+    gene_ranges = []
+    for gene, gene_data in panel_genes.items():
+        try:
+            chrom, positions = gene_data['location'].split(':')
+            start, end = (int(pos) for pos in positions.split('-'))
+        except (AttributeError, KeyError, ValueError):
+            logging.info(f'No usable location for {gene}, using all intervals')
+            return None
+
+        contig = 'chrM' if chrom == 'MT' else f'chr{chrom}'
+        if contig not in reference.lengths:
+            logging.info(f'Unknown contig {chrom} for {gene}, using all intervals')
+            return None
+
+        gene_ranges.append(
+            (
+                reference.contigs.index(contig),
+                max(start - padding, 1),
+                min(end + padding, reference.lengths[contig]),
+            )
+        )
+
+    # merge overlapping or adjacent gene ranges
+    merged: list[list[int]] = []
+    for contig_index, start, end in sorted(gene_ranges):
+        if merged and merged[-1][0] == contig_index and start <= merged[-1][2] + 1:
+            merged[-1][2] = max(merged[-1][2], end)
+        else:
+            merged.append([contig_index, start, end])
+
+    logging.info(f'{len(panel_genes)} genes condensed into {len(merged)} intervals')
+
+    return [
+        hl.Interval(
+            hl.Locus(
+                reference.contigs[contig_index], start, reference_genome=reference
+            ),
+            hl.Locus(reference.contigs[contig_index], end, reference_genome=reference),
+            includes_end=True,
+        )
+        for contig_index, start, end in merged
+    ]
+
+
+def plan_repartition(
+    row_count: int, data_bytes: int | None, current_partitions: int
+) -> tuple[int, bool]:
+    """
+    decide how to repartition a freshly checkpointed MT
+
+    the target partition count is the larger of the row-count estimate and
+    the on-disk size estimate (~10MB per partition by default). Reducing the
+    partition count never needs a shuffle - adjacent partitions are merged.
+    Growing the partition count (skew after heavy filtering) is only done
+    when shuffles are permitted in config
+
+    Kat's thread:
+    https://discuss.hail.is/t/best-way-to-repartition-heavily-filtered-matrix-tables/2140
+
+    Args:
+        row_count (int): rows in the checkpointed MT
+        data_bytes (int | None): size of the checkpoint on disk, if known
+        current_partitions (int): partitions in the checkpointed MT
+
+    Returns:
+        the number of partitions to use, and whether a shuffle is required
+    """
+    checkpoint_config = get_config().get('checkpoints', {})
+    max_partition_rows = checkpoint_config.get('max_partition_rows', 200000)
+    target_bytes = checkpoint_config.get('target_partition_mb', 10) * 1024 * 1024
+
+    partitions = max(
+        -(-row_count // max_partition_rows),
+        -(-data_bytes // target_bytes) if data_bytes else 0,
+        1,
+    )
+
+    if partitions <= current_partitions:
+        return partitions, False
+
+    if checkpoint_config.get('allow_shuffle', False):
+        return partitions, True
+
+    return current_partitions, False
+
+
+def checkpoint_size(checkpoint_path: str) -> int | None:
+    """
+    size of the row and entry data in a checkpointed MT, in bytes
+    a single listing of each parts directory, no data is read
+
+    Args:
+        checkpoint_path (str): path to the checkpointed MT
+
+    Returns:
+        the total size of all data partitions, or None if unavailable
+    """
+    try:
+        return sum(
+            part['size_bytes']
+            for parts_dir in ['rows/rows/parts', 'entries/rows/parts']
+            for part in hl.hadoop_ls(os.path.join(checkpoint_path, parts_dir))
+        )
+    except (FatalError, FileNotFoundError):
+        logging.warning(f'Could not estimate the size of {checkpoint_path}')
+        return None
+
+
 def checkpoint_and_repartition(
     mt: hl.MatrixTable,
     checkpoint_root: str,
-    checkpoint_num: int,
+    stage: str,
     extra_logging: str | None = '',
 ) -> hl.MatrixTable:
     """
-    uses estimated row data size to repartition MT
-    aiming for a target partition size of ~10MB
-    Kat's thread:
-    https://discuss.hail.is/t/best-way-to-repartition-heavily-filtered-matrix-tables/2140
+    if this stage is listed in config, checkpoint the MT and repartition
+    based on the row count and size of the written data
 
     Args:
         mt (): All data
         checkpoint_root (): where to write the checkpoint to
-        checkpoint_num (): the checkpoint increment (insert into file path)
+        stage (): the name of this checkpoint stage (inserted into file path)
         extra_logging (): informative statement to add to logging counts/partitions
     Returns:
         the MT after checkpointing, re-reading, and repartitioning
+        or the same MT if this stage is not selected for checkpointing
     """
-    checkpoint_extended = f'{checkpoint_root}_{checkpoint_num}'
+    if stage not in get_config().get('checkpoints', {}).get('stages', []):
+        logging.info(f'No checkpoint planned at stage {stage!r}')
+        return mt
+
+    checkpoint_extended = f'{checkpoint_root}_{stage}'
     logging.info(f'Checkpointing MT to {checkpoint_extended}')
     mt = mt.checkpoint(checkpoint_extended, overwrite=True)
 
-    # estimate partitions; fall back to 1 if low row count
+    # counts come from the checkpoint metadata, the pipeline is not re-run
     current_rows = mt.count_rows()
-    partitions = current_rows // 200000 or 1
+    current_partitions = mt.n_partitions()
+    data_bytes = checkpoint_size(checkpoint_extended)
+
+    partitions, shuffle = plan_repartition(
+        row_count=current_rows,
+        data_bytes=data_bytes,
+        current_partitions=current_partitions,
+    )
 
     logging.info(
-        f'Re-partitioning {current_rows} into {partitions} partitions {extra_logging}'
+        f'Checkpoint {stage!r}: {current_rows} rows, {data_bytes} bytes, '
+        f'{current_partitions} partitions {extra_logging}'
     )
 
-    return mt.repartition(n_partitions=partitions, shuffle=True)
+    if partitions == current_partitions:
+        logging.info(f'Keeping {current_partitions} partitions')
+        return mt
+
+    if shuffle:
+        logging.info(f'Re-partitioning into {partitions} partitions, with shuffle')
+        return mt.repartition(n_partitions=partitions, shuffle=True)
+
+    logging.info(f'Coalescing into {partitions} partitions, no shuffle')
+    return mt.naive_coalesce(partitions)
 
 
 def subselect_mt_to_pedigree(mt: hl.MatrixTable, pedigree: str) -> hl.MatrixTable:
@@ -975,33 +1447,33 @@ def subselect_mt_to_pedigree(mt: hl.MatrixTable, pedigree: str) -> hl.MatrixTabl
     peddy_ped = Ped(pedigree)
     ped_samples = {individual.sample_id for individual in peddy_ped.samples()}
 
-    # individual IDs from matrix
-    matrix_samples = set(mt.s.collect())
+    ped_expression = hl.literal(ped_samples)
 
-    # find overlapping samples
-    common_samples = ped_samples.intersection(matrix_samples)
+    # count matrix & common samples in a single column aggregation
+    sample_counts = mt.aggregate_cols(
+        hl.struct(
+            matrix=hl.agg.count(),
+            common=hl.agg.count_where(ped_expression.contains(mt.s)),
+        )
+    )
 
     logging.info(
         f"""
     Samples in Pedigree: {len(ped_samples)}
-    Samples in MatrixTable: {len(matrix_samples)}
-    Common Samples: {len(common_samples)}
+    Samples in MatrixTable: {sample_counts.matrix}
+    Common Samples: {sample_counts.common}
     """
     )
 
-    if len(common_samples) == 0:
+    if sample_counts.common == 0:
         raise ValueError('No samples shared between pedigree and MT')
 
     # full overlap = no filtering
-    if common_samples == matrix_samples:
+    if sample_counts.common == sample_counts.matrix:
         return mt
 
     # reduce to those common samples
-    mt = mt.filter_cols(hl.literal(common_samples).contains(mt.s))
-
-    logging.info(f'Remaining MatrixTable columns: {mt.count_cols()}')
-
-    return mt
+    return mt.filter_cols(ped_expression.contains(mt.s))
 
 
 def drop_useless_fields(mt: hl.MatrixTable) -> hl.MatrixTable:
@@ -1033,6 +1505,34 @@ def drop_useless_fields(mt: hl.MatrixTable) -> hl.MatrixTable:
     return mt
 
 
+def read_and_audit_matrix(
+    mt_path: str, intervals: list[hl.Interval] | None = None
+) -> hl.MatrixTable:
+    """
+    read the annotated MT, and check all the required fields are present
+
+    Args:
+        mt_path (str): the input MT
+        intervals (list): optionally, only read partitions overlapping these
+
+    Returns:
+        the MatrixTable
+    """
+    mt = hl.read_matrix_table(mt_path, _intervals=intervals)
+
+    # lookups for required fields all delegated to the hail_audit file
+    if not (
+        fields_audit(
+            mt=mt, base_fields=BASE_FIELDS_REQUIRED, nested_fields=FIELDS_REQUIRED
+        )
+        and vep_audit(mt=mt, expected_fields=VEP_TX_FIELDS_REQUIRED)
+    ):
+        mt.describe()
+        raise KeyError('Fields were missing from the input Matrix')
+
+    return mt
+
+
 def main(mt_path: str, panelapp: str, plink: str):
     """
     Read MT, filter, and apply category annotation
@@ -1042,9 +1542,6 @@ def main(mt_path: str, panelapp: str, plink: str):
     # # initiate Hail with defined driver spec.
     init_batch(driver_cores=8, driver_memory='highmem')
 
-    # checkpoints should be kept independent
-    checkpoint_number = 0
-
     # get the run configuration JSON
     logging.info(f'Reading config dict from {os.getenv("CPG_CONFIG_PATH")}')
 
@@ -1064,91 +1561,85 @@ def main(mt_path: str, panelapp: str, plink: str):
     if not to_path(mt_path.rstrip('/') + '/').exists():
         raise FileExistsError(f'Input MatrixTable doesn\'t exist: {mt_path}')
 
-    mt = hl.read_matrix_table(mt_path)
-
-    # lookups for required fields all delegated to the hail_audit file
-    if not (
-        fields_audit(
-            mt=mt, base_fields=BASE_FIELDS_REQUIRED, nested_fields=FIELDS_REQUIRED
+    # optionally only read the partitions overlapping the panel genes
+    intervals = None
+    if get_config()['filter'].get('restrict_to_panel_intervals', False):
+        intervals = panel_gene_intervals(
+            panelapp, padding=get_config()['filter'].get('interval_padding', 5000)
         )
-        and vep_audit(mt=mt, expected_fields=VEP_TX_FIELDS_REQUIRED)
-    ):
-        mt.describe()
-        raise KeyError('Fields were missing from the input Matrix')
-
-    # subset to currently considered samples
-    mt = subselect_mt_to_pedigree(mt, pedigree=plink)
-
-    logging.debug(
-        f'Loaded annotated MT from {mt_path}, size: {mt.count_rows()}',
-    )
-
-    # filter out quality failures
-    # swap out the default clinvar annotations with private clinvar
-    mt = annotate_aip_clinvar(mt=mt)
-    mt = filter_on_quality_flags(mt=mt)
 
-    # running global quality filter steps
-    mt = filter_to_well_normalised(mt=mt)
+    # optionally reuse the pre-filtered MT from an earlier run on the same data
+    cache_path = annotation_cache_path(mt_path)
 
-    # shrink the time taken to write checkpoints
-    mt = drop_useless_fields(mt=mt)
+    if cache_path is None:
+        mt = read_and_audit_matrix(mt_path, intervals=intervals)
+        mt = prefilter_annotated_matrix(mt=mt, green_genes=green_expression)
 
-    # mt = checkpoint_and_repartition(
-    #     mt=mt,
-    #     checkpoint_root=checkpoint_root,
-    #     checkpoint_num=checkpoint_number,
-    #     extra_logging='after applying quality filters',
-    # )
+    else:
+        # the cache holds all genes & samples, only the read is panel-specific
+        if not to_path(cache_path).joinpath('_SUCCESS').exists():
+            logging.info(f'No cached annotated MT at {cache_path}, generating')
+            mt = read_and_audit_matrix(mt_path)
+            prefilter_annotated_matrix(mt=mt).write(cache_path, overwrite=True)
 
-    # die if there are no variants remaining
-    if mt.count_rows() == 0:
-        raise ValueError('No remaining rows to process!')
+        logging.info(f'Reading cached annotated MT from {cache_path}')
+        mt = hl.read_matrix_table(cache_path, _intervals=intervals)
 
-    # checkpoint_number = checkpoint_number + 1
+    # subset to currently considered samples
+    mt = subselect_mt_to_pedigree(mt, pedigree=plink)
 
-    mt = extract_annotations(mt=mt)
+    log_diagnostic_count(f'Candidate rows from {mt_path}', mt.count_rows)
 
-    # filter variants by frequency
-    mt = filter_matrix_by_ac(mt=mt)
-    mt = filter_to_population_rare(mt=mt)
+    mt = checkpoint_and_repartition(
+        mt=mt,
+        checkpoint_root=checkpoint_root,
+        stage='quality',
+        extra_logging='after applying quality filters',
+    )
 
     # split genes out to separate rows
     mt = split_rows_by_gene_and_filter_to_green(mt=mt, green_genes=green_expression)
 
-    # mt = checkpoint_and_repartition(
-    #     mt=mt,
-    #     checkpoint_root=checkpoint_root,
-    #     checkpoint_num=checkpoint_number,
-    #     extra_logging='after applying Rare & Green-Gene filters',
-    # )
-
-    # checkpoint_number = checkpoint_number + 1
+    mt = checkpoint_and_repartition(
+        mt=mt,
+        checkpoint_root=checkpoint_root,
+        stage='green_genes',
+        extra_logging='after applying Rare & Green-Gene filters',
+    )
 
     # add Classes to the MT
-    # current logic is to apply 1, 2, 3, and 5, then 4 (de novo)
+    # current logic is to apply 1, 2, 3, 5, and support, then 4 (de novo)
     # for cat. 4, pre-filter the variants by tx-consequential or C5==1
     logging.info('Applying categories')
-    mt = annotate_category_1(mt=mt)
-    mt = annotate_category_2(mt=mt, new_genes=new_expression)
-    mt = annotate_category_3(mt=mt)
-    mt = annotate_category_5(mt=mt)
+    mt = annotate_categories(mt=mt, new_genes=new_expression)
 
     # ordering is important - category4 (de novo) makes
     # use of category 5, so it must follow
     mt = annotate_category_4(mt=mt, plink_family_file=plink)
-    mt = annotate_category_support(mt=mt)
 
     # if a clinvar-codon table is supplied, use that for PM5
     mt = annotate_codon_clinvar(mt=mt)
 
     mt = filter_to_categorised(mt=mt)
-    # mt = checkpoint_and_repartition(
-    #     mt=mt,
-    #     checkpoint_root=checkpoint_root,
-    #     checkpoint_num=checkpoint_number,
-    #     extra_logging='after filtering to categorised only',
-    # )
+    mt = checkpoint_and_repartition(
+        mt=mt,
+        checkpoint_root=checkpoint_root,
+        stage='categorised',
+        extra_logging='after filtering to categorised only',
+    )
+
+    # optionally hand the typed transcript consequences to the MOI stage
+    # directly, rather than encoding and decoding a CSQ string
+    if get_config()['workflow'].get('table_handoff', False):
+        mt = mt.annotate_rows(
+            info=mt.info.annotate(gene_id=mt.geneIds),
+            transcripts=vep_struct_to_transcripts(mt.vep),
+        )
+        logging.info('Writing Hail Table')
+        write_matrix_to_table(
+            mt=mt, table_out=output_path('hail_categorised.ht', 'analysis')
+        )
+        return
 
     # obtain the massive CSQ string using method stolen from the Broad's Gnomad library
     # also take the single gene_id (from the exploded attribute)
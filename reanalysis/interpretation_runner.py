@@ -55,6 +55,7 @@ EXECUTION_TIME = f'{datetime.now():%Y-%m-%d_%H:%M}'
 # static paths to write outputs
 ANNOTATED_MT = output_path('annotated_variants.mt')
 HAIL_VCF_OUT = output_path('hail_categorised.vcf.bgz', 'analysis')
+HAIL_TABLE_OUT = output_path('hail_categorised.ht', 'analysis')
 INPUT_AS_VCF = output_path('prior_to_annotation.vcf.bgz')
 PANELAPP_JSON_OUT = output_path('panelapp_data.json', 'analysis')
 
@@ -185,7 +186,7 @@ def handle_results_job(
     one container to run the MOI checks, and the presentation
 
     Args:
-        labelled_vcf (str): path to the VCF created by Hail runtime
+        labelled_vcf (str): path to the VCF (VCF shards, or Table) created by Hail runtime
         pedigree (str): path to the pedigree file
         input_path (str): path to the input file, logged in metadata
         output (str): path to JSON file to write
@@ -196,6 +197,11 @@ def handle_results_job(
     results_job = get_batch().new_job(name='MOI tests')
     set_job_resources(results_job, prior_job=prior_job)
 
+    # optionally fan the per-contig MOI tests out across multiple cores
+    workers = get_config()['workflow'].get('results_workers', 1)
+    if workers > 1:
+        results_job.cpu(workers)
+
     gene_filter_files = (
         f'--participant_panels {participant_panels} ' if participant_panels else ''
     )
@@ -210,6 +216,7 @@ def handle_results_job(
         f'--pedigree {pedigree} '
         f'--out_json {output} '
         f'--input_path {input_path} '
+        f'--workers {workers} '
         f'{gene_filter_files}'
     )
     logging.info(f'Results command: {results_command}')
@@ -484,18 +491,31 @@ def main(
     pedigree_in_batch = get_batch().read_input(pedigree)
 
     # region : hail categorisation
-    if not to_path(HAIL_VCF_OUT).exists():
-        logging.info(f"The Labelled VCF {HAIL_VCF_OUT!r} doesn't exist; regenerating")
+    table_handoff = get_config()['workflow'].get('table_handoff', False)
+    labelled_out = HAIL_TABLE_OUT if table_handoff else HAIL_VCF_OUT
+    if not to_path(labelled_out).exists():
+        logging.info(
+            f"The Labelled output {labelled_out!r} doesn't exist; regenerating"
+        )
         prior_job = handle_hail_filtering(
             prior_job=prior_job, plink_file=pedigree_in_batch
         )
-        output_dict['hail_vcf'] = HAIL_VCF_OUT
+        output_dict['hail_vcf'] = labelled_out
     # endregion
 
     # read VCF into the batch as a local file
-    labelled_vcf_in_batch = (
-        get_batch().read_input_group(vcf=HAIL_VCF_OUT, tbi=HAIL_VCF_OUT + '.tbi').vcf
-    )
+    # or the whole directory, if the VCF was written as indexed shards
+    # or the labelled variants were written as a Hail Table
+    if table_handoff:
+        labelled_vcf_in_batch = get_batch().read_input(HAIL_TABLE_OUT)
+    elif get_config()['workflow'].get('sharded_vcf', False):
+        labelled_vcf_in_batch = get_batch().read_input(HAIL_VCF_OUT)
+    else:
+        labelled_vcf_in_batch = (
+            get_batch()
+            .read_input_group(vcf=HAIL_VCF_OUT, tbi=HAIL_VCF_OUT + '.tbi')
+            .vcf
+        )
 
     # region: run results job
     # pointing this analysis at the updated config file, including input metadata
@@ -7,6 +7,7 @@ We then run a permissive MOI match for the variant
 """
 
 from abc import abstractmethod
+from types import MappingProxyType
 
 from peddy.peddy import Ped, PHENOTYPE
 
@@ -63,12 +64,167 @@ def check_for_second_hit(
     return sample_dict.get(first_variant, [])
 
 
+class FamilyIndex:
+    """
+    immutable integer index over a peddy pedigree, built once per run
+
+    each sample is assigned a position in the cohort, and a rank within its
+    family; family membership and affection status are held as bitmasks over
+    the member ranks, so that the per-variant MOI checks are mask operations
+    on a few bits per family instead of peddy lookups
+    """
+
+    __slots__ = (
+        'sample_ids',
+        'positions',
+        'ranks',
+        'family_ids',
+        'sexes',
+        'mothers',
+        'fathers',
+        'affected',
+        'family_members',
+        'family_affected',
+    )
+
+    def __init__(self, pedigree: Ped):
+        """
+        Args:
+            pedigree (Ped): the peddy pedigree to index
+        """
+        samples = [
+            member for family in pedigree.families.values() for member in family.samples
+        ]
+        sample_ids = tuple(member.sample_id for member in samples)
+        positions = {sample_id: pos for pos, sample_id in enumerate(sample_ids)}
+
+        def parent_position(parent) -> int:
+            if parent is None:
+                return -1
+            return positions.get(parent.sample_id, -1)
+
+        ranks = []
+        family_members: dict[str, tuple[int, ...]] = {}
+        family_affected: dict[str, int] = {}
+        for pos, member in enumerate(samples):
+            members = family_members.get(member.family_id, ())
+            rank = len(members)
+            ranks.append(rank)
+            family_members[member.family_id] = members + (pos,)
+            family_affected[member.family_id] = family_affected.get(
+                member.family_id, 0
+            ) | ((member.affected == PEDDY_AFFECTED) << rank)
+
+        object.__setattr__(self, 'sample_ids', sample_ids)
+        object.__setattr__(self, 'positions', MappingProxyType(positions))
+        object.__setattr__(self, 'ranks', tuple(ranks))
+        object.__setattr__(
+            self, 'family_ids', tuple(member.family_id for member in samples)
+        )
+        object.__setattr__(self, 'sexes', tuple(member.sex for member in samples))
+        object.__setattr__(
+            self, 'mothers', tuple(parent_position(member.mom) for member in samples)
+        )
+        object.__setattr__(
+            self, 'fathers', tuple(parent_position(member.dad) for member in samples)
+        )
+        object.__setattr__(
+            self,
+            'affected',
+            tuple(member.affected == PEDDY_AFFECTED for member in samples),
+        )
+        object.__setattr__(self, 'family_members', MappingProxyType(family_members))
+        object.__setattr__(self, 'family_affected', MappingProxyType(family_affected))
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def is_affected(self, sample_id: str) -> bool:
+        """
+        True if this sample is affected in the pedigree
+        """
+        return self.affected[self.positions[sample_id]]
+
+    def sex(self, sample_id: str) -> str:
+        """
+        peddy sex string for this sample (male/female/unknown)
+        """
+        return self.sexes[self.positions[sample_id]]
+
+    def family_id(self, sample_id: str) -> str:
+        """
+        the family ID containing this sample
+        """
+        return self.family_ids[self.positions[sample_id]]
+
+    def members(self, sample_id: str) -> tuple[int, ...]:
+        """
+        positions of all members of this sample's family, in pedigree order
+        """
+        return self.family_members[self.family_id(sample_id)]
+
+    def parents(self, sample_id: str) -> tuple[int, ...]:
+        """
+        positions of the parents of this sample which are in the pedigree
+        """
+        pos = self.positions[sample_id]
+        return tuple(
+            parent for parent in (self.mothers[pos], self.fathers[pos]) if parent >= 0
+        )
+
+    def family_call_mask(self, sample_id: str, called: set[str]) -> int:
+        """
+        bitmask over member ranks of this sample's family, for members which
+        appear in a called set
+        """
+        mask = 0
+        for rank, pos in enumerate(self.members(sample_id)):
+            if self.sample_ids[pos] in called:
+                mask |= 1 << rank
+        return mask
+
+
+class VariantCarriers:
+    """
+    carrier lookups for a single variant, shared by every model in a runner
+
+    carriers is every sample with a het or hom call; probands are the
+    carriers which are affected and have a sufficient depth of call (or the
+    variant is ClinVar Pathogenic), which each model requires of a proband
+    """
+
+    __slots__ = ('carriers', 'probands')
+
+    def __init__(
+        self, variant: AbstractVariant, family_index: FamilyIndex, minimum_depth: int
+    ):
+        """
+        Args:
+            variant (AbstractVariant): the variant being evaluated
+            family_index (FamilyIndex): the pedigree index for this run
+            minimum_depth (int): minimum read depth for a proband call
+        """
+        self.carriers = variant.het_samples | variant.hom_samples
+        clinvar_path = variant.info.get('categoryboolean1')
+        self.probands = {
+            sample_id
+            for sample_id in self.carriers
+            if family_index.is_affected(sample_id)
+            and (clinvar_path or variant.depths[sample_id] >= minimum_depth)
+        }
+
+
 class MOIRunner:
     """
     pass
     """
 
-    def __init__(self, pedigree: Ped, target_moi: str):
+    def __init__(
+        self,
+        pedigree: Ped,
+        target_moi: str,
+        family_index: FamilyIndex | None = None,
+    ):
         """
         for each possible MOI, choose the appropriate filters to apply
         ran into a situation where the ID of target_moi didn't match the
@@ -78,37 +234,43 @@ class MOIRunner:
 
         :param pedigree:
         :param target_moi:
+        :param family_index: pre-built index, shared across runners if provided
         """
 
+        if family_index is None:
+            family_index = FamilyIndex(pedigree)
+        self.family_index = family_index
+        self.minimum_depth = get_config()['filter'].get('minimum_depth', 10)
+
         # for unknown, we catch all possible options?
         # should we be doing both checks for Monoallelic?
         if target_moi == 'Monoallelic':
             self.filter_list = [
-                DominantAutosomal(pedigree=pedigree),
+                DominantAutosomal(pedigree=pedigree, family_index=family_index),
             ]
         elif target_moi in ['Mono_And_Biallelic', 'Unknown']:
             self.filter_list = [
-                DominantAutosomal(pedigree=pedigree),
-                RecessiveAutosomalHomo(pedigree=pedigree),
-                RecessiveAutosomalCH(pedigree=pedigree),
+                DominantAutosomal(pedigree=pedigree, family_index=family_index),
+                RecessiveAutosomalHomo(pedigree=pedigree, family_index=family_index),
+                RecessiveAutosomalCH(pedigree=pedigree, family_index=family_index),
             ]
         elif target_moi == 'Biallelic':
             self.filter_list = [
-                RecessiveAutosomalHomo(pedigree=pedigree),
-                RecessiveAutosomalCH(pedigree=pedigree),
+                RecessiveAutosomalHomo(pedigree=pedigree, family_index=family_index),
+                RecessiveAutosomalCH(pedigree=pedigree, family_index=family_index),
             ]
 
         elif target_moi == 'Hemi_Mono_In_Female':
             self.filter_list = [
-                XRecessiveMale(pedigree=pedigree),
-                XDominant(pedigree=pedigree),
+                XRecessiveMale(pedigree=pedigree, family_index=family_index),
+                XDominant(pedigree=pedigree, family_index=family_index),
             ]
 
         elif target_moi == 'Hemi_Bi_In_Female':
             self.filter_list = [
-                XRecessiveMale(pedigree=pedigree),
-                XRecessiveFemaleHom(pedigree=pedigree),
-                XRecessiveFemaleCH(pedigree=pedigree),
+                XRecessiveMale(pedigree=pedigree, family_index=family_index),
+                XRecessiveFemaleHom(pedigree=pedigree, family_index=family_index),
+                XRecessiveFemaleCH(pedigree=pedigree, family_index=family_index),
             ]
 
         else:
@@ -119,6 +281,7 @@ class MOIRunner:
         principal_var,
         comp_het: CompHetDict | None = None,
         partial_pen: bool = False,
+        carriers: VariantCarriers | None = None,
     ) -> list[ReportedVariant]:
         """
         run method - triggers each relevant inheritance model
@@ -127,33 +290,87 @@ class MOIRunner:
             principal_var (): the variant we are focused on
             comp_het ():
             partial_pen ():
+            carriers (): carrier lookups for this variant, built if absent
         """
 
         if comp_het is None:
             comp_het = {}
 
+        if carriers is None:
+            carriers = VariantCarriers(
+                principal_var, self.family_index, self.minimum_depth
+            )
+
         moi_matched = []
         for model in self.filter_list:
             moi_matched.extend(
                 model.run(
-                    principal=principal_var, comp_het=comp_het, partial_pen=partial_pen
+                    principal=principal_var,
+                    comp_het=comp_het,
+                    partial_pen=partial_pen,
+                    carriers=carriers,
                 )
             )
         return moi_matched
 
+    def run_gene(
+        self, variants: list[AbstractVariant], comp_het: CompHetDict | None = None
+    ) -> list[list[ReportedVariant]]:
+        """
+        run every model over all the variants in a single gene
+
+        the carrier and affected-proband lookups for each variant are built
+        once here and shared by every model, and variants with no proband
+        are dismissed before any model runs. Partial penetrance is always
+        applied to Category 1 (ClinVar) variants
+
+        Args:
+            variants (list[AbstractVariant]): all variants in this gene
+            comp_het (dict): comp-het partners, shared across all variants
+
+        Returns:
+            list[list[ReportedVariant]]: one result list per input variant
+        """
+
+        if comp_het is None:
+            comp_het = {}
+
+        gene_results = []
+        for variant in variants:
+            carriers = VariantCarriers(variant, self.family_index, self.minimum_depth)
+            if not carriers.probands:
+                gene_results.append([])
+                continue
+
+            gene_results.append(
+                self.run(
+                    principal_var=variant,
+                    comp_het=comp_het,
+                    partial_pen=variant.info.get('categoryboolean1', False),
+                    carriers=carriers,
+                )
+            )
+        return gene_results
+
 
 class BaseMoi:
     """
     Definition of the MOI base class
     """
 
-    def __init__(self, pedigree: Ped, applied_moi: str):
+    def __init__(
+        self,
+        pedigree: Ped,
+        applied_moi: str,
+        family_index: FamilyIndex | None = None,
+    ):
         """
         base class
         """
         if applied_moi is None:
             raise ValueError('An applied MOI needs to reach the Base Class')
         self.pedigree = pedigree
+        self.family_index = family_index or FamilyIndex(pedigree)
         self.applied_moi = applied_moi
         self.minimum_depth = get_config()['filter'].get('minimum_depth', 10)
 
@@ -163,11 +380,22 @@ class BaseMoi:
         principal: AbstractVariant,
         comp_het: CompHetDict | None = None,
         partial_pen: bool = False,
+        carriers: VariantCarriers | None = None,
     ) -> list[ReportedVariant]:
         """
         run all applicable inheritance patterns and finds good fits
         """
 
+    def get_carriers(
+        self, principal: AbstractVariant, carriers: VariantCarriers | None
+    ) -> VariantCarriers:
+        """
+        use the runner's shared carrier lookups, or build them for this variant
+        """
+        if carriers is None:
+            carriers = VariantCarriers(principal, self.family_index, self.minimum_depth)
+        return carriers
+
     def check_familial_inheritance(
         self, sample_id: str, called_variants: set[str], partial_pen: bool = False
     ) -> bool:
@@ -190,24 +418,18 @@ class BaseMoi:
         :param partial_pen: if True, permit unaffected has variant call
         """
 
-        # iterate through all family members, no interested in directionality
+        # all family members, no interested in directionality
         # of relationships at the moment
-        for member in self.pedigree.families[self.pedigree[sample_id].family_id]:
+        index = self.family_index
+        called_mask = index.family_call_mask(sample_id, called_variants)
+        affected_mask = index.family_affected[index.family_id(sample_id)]
 
-            # complete & incomplete penetrance - affected samples must have the variant
-            # complete pen. requires participants to be affected if they have the var
-            # if any of these combinations occur, fail the family
-            if (
-                member.affected == PEDDY_AFFECTED
-                and member.sample_id not in called_variants
-            ) or (
-                member.sample_id in called_variants
-                and not partial_pen
-                and not member.affected == PEDDY_AFFECTED
-            ):
-                return False
-
-        return True
+        # complete & incomplete penetrance - affected samples must have the variant
+        # complete pen. requires participants to be affected if they have the var
+        # if any of these combinations occur, fail the family
+        if affected_mask & ~called_mask:
+            return False
+        return partial_pen or not called_mask & ~affected_mask
 
     def get_family_genotypes(
         self, variant: AbstractVariant, sample_id: str
@@ -251,13 +473,12 @@ class BaseMoi:
 
             return 'WT'
 
-        sample_ped_entry = self.pedigree[sample_id]
-        family = self.pedigree.families[sample_ped_entry.family_id]
+        index = self.family_index
         return {
-            member.sample_id: get_sample_genotype(
-                member_id=member.sample_id, sex=member.sex
+            index.sample_ids[pos]: get_sample_genotype(
+                member_id=index.sample_ids[pos], sex=index.sexes[pos]
             )
-            for member in family.samples
+            for pos in index.members(sample_id)
         }
 
     @staticmethod
@@ -298,16 +519,14 @@ class BaseMoi:
 
         # if both vars are present in a single parent: not a compound het
         # or if the parent is affected: not causative
-        sample_ped_entry = self.pedigree[sample_id]
-        for parent in [sample_ped_entry.mom, sample_ped_entry.dad]:
-            # skip to prevent crashing on !trios
-            if parent is None:
-                continue
-
+        # parents absent from the pedigree are not indexed (!trios)
+        index = self.family_index
+        for parent in index.parents(sample_id):
+            parent_id = index.sample_ids[parent]
             if (
-                (parent.sample_id in variant_1.het_samples)
-                and (parent.sample_id in variant_2.het_samples)
-            ) or parent.affected == PEDDY_AFFECTED:
+                (parent_id in variant_1.het_samples)
+                and (parent_id in variant_2.het_samples)
+            ) or index.affected[parent]:
                 return False
         return True
 
@@ -322,6 +541,7 @@ class DominantAutosomal(BaseMoi):
         self,
         pedigree: Ped,
         applied_moi: str = 'Autosomal Dominant',
+        family_index: FamilyIndex | None = None,
     ):
         """
         Simplest: AD MOI
@@ -329,13 +549,16 @@ class DominantAutosomal(BaseMoi):
         self.ad_threshold = get_config()['moi_tests'][GNOMAD_RARE_THRESHOLD]
         self.ac_threshold = get_config()['moi_tests'][GNOMAD_AD_AC_THRESHOLD]
         self.hom_threshold = get_config()['moi_tests'][GNOMAD_DOM_HOM_THRESHOLD]
-        super().__init__(pedigree=pedigree, applied_moi=applied_moi)
+        super().__init__(
+            pedigree=pedigree, applied_moi=applied_moi, family_index=family_index
+        )
 
     def run(
         self,
         principal: AbstractVariant,
         comp_het: CompHetDict | None = None,
         partial_pen: bool = False,
+        carriers: VariantCarriers | None = None,
     ) -> list[ReportedVariant]:
         """
         Simplest MOI, exclusions based on HOM count and AF
@@ -343,6 +566,7 @@ class DominantAutosomal(BaseMoi):
             principal ():
             comp_het ():
             partial_pen ():
+            carriers ():
         """
 
         classifications = []
@@ -363,18 +587,16 @@ class DominantAutosomal(BaseMoi):
             return classifications
 
         # autosomal dominant doesn't require support, but consider het and hom
-        samples_with_this_variant = principal.het_samples.union(principal.hom_samples)
+        carriers = self.get_carriers(principal, carriers)
+        samples_with_this_variant = carriers.carriers
         for sample_id in samples_with_this_variant:
 
             # skip primary analysis for unaffected members
             # we require this specific sample to be categorised
             # force a minimum depth on the proband call
             if not (
-                self.pedigree[sample_id].affected == PEDDY_AFFECTED
+                sample_id in carriers.probands
                 and principal.sample_category_check(sample_id, allow_support=False)
-            ) or (
-                principal.depths[sample_id] < self.minimum_depth
-                and not principal.info.get('categoryboolean1')
             ):
                 continue
 
@@ -389,7 +611,7 @@ class DominantAutosomal(BaseMoi):
             classifications.append(
                 ReportedVariant(
                     sample=sample_id,
-                    family=self.pedigree[sample_id].family_id,
+                    family=self.family_index.family_id(sample_id),
                     gene=principal.info.get('gene_id'),
                     var_data=MinimalVariant(variant=principal, sample=sample_id),
                     reasons={self.applied_moi},
@@ -413,15 +635,19 @@ class RecessiveAutosomalCH(BaseMoi):
         self,
         pedigree: Ped,
         applied_moi: str = 'Autosomal Recessive Comp-Het',
+        family_index: FamilyIndex | None = None,
     ):
         """ """
-        super().__init__(pedigree=pedigree, applied_moi=applied_moi)
+        super().__init__(
+            pedigree=pedigree, applied_moi=applied_moi, family_index=family_index
+        )
 
     def run(
         self,
         principal: AbstractVariant,
         comp_het: CompHetDict | None = None,
         partial_pen: bool = False,
+        carriers: VariantCarriers | None = None,
     ) -> list[ReportedVariant]:
         """
         valid if present as compound het
@@ -431,6 +657,7 @@ class RecessiveAutosomalCH(BaseMoi):
             principal (AbstractVariant): main variant being evaluated
             comp_het (dict): comp-het partners
             partial_pen (bool):
+            carriers (VariantCarriers): shared carrier lookups, optional
 
         Returns:
             list[ReportedVariant]: data object if RecessiveAutosomal fits
@@ -441,19 +668,16 @@ class RecessiveAutosomalCH(BaseMoi):
 
         classifications = []
 
+        carriers = self.get_carriers(principal, carriers)
+
         # if hets are present, try and find support
         for sample_id in principal.het_samples:
 
             # skip primary analysis for unaffected members
             # this sample must be categorised - check Cat 4 contents
-            if (
-                not (
-                    self.pedigree[sample_id].affected == PEDDY_AFFECTED
-                    and principal.sample_category_check(sample_id, allow_support=True)
-                )
-            ) or (
-                principal.depths[sample_id] < self.minimum_depth
-                and not principal.info.get('categoryboolean1')
+            if not (
+                sample_id in carriers.probands
+                and principal.sample_category_check(sample_id, allow_support=True)
             ):
                 continue
 
@@ -488,7 +712,7 @@ class RecessiveAutosomalCH(BaseMoi):
                 classifications.append(
                     ReportedVariant(
                         sample=sample_id,
-                        family=self.pedigree[sample_id].family_id,
+                        family=self.family_index.family_id(sample_id),
                         gene=principal.info.get('gene_id'),
                         var_data=MinimalVariant(principal, sample_id),
                         reasons={self.applied_moi},
@@ -514,16 +738,20 @@ class RecessiveAutosomalHomo(BaseMoi):
         self,
         pedigree: Ped,
         applied_moi: str = 'Autosomal Recessive Homozygous',
+        family_index: FamilyIndex | None = None,
     ):
         """ """
         self.hom_threshold = get_config()['moi_tests'][GNOMAD_REC_HOM_THRESHOLD]
-        super().__init__(pedigree=pedigree, applied_moi=applied_moi)
+        super().__init__(
+            pedigree=pedigree, applied_moi=applied_moi, family_index=family_index
+        )
 
     def run(
         self,
         principal: AbstractVariant,
         comp_het: CompHetDict | None = None,
         partial_pen: bool = False,
+        carriers: VariantCarriers | None = None,
     ) -> list[ReportedVariant]:
         """
         explicitly tests HOMs
@@ -532,6 +760,7 @@ class RecessiveAutosomalHomo(BaseMoi):
             principal (AbstractVariant): main variant being evaluated
             comp_het (dict): comp-het partners
             partial_pen (bool):
+            carriers (VariantCarriers): shared carrier lookups, optional
 
         Returns:
             list[ReportedVariant]: data object if RecessiveAutosomal fits
@@ -546,19 +775,16 @@ class RecessiveAutosomalHomo(BaseMoi):
         ):
             return classifications
 
+        carriers = self.get_carriers(principal, carriers)
+
         for sample_id in principal.hom_samples:
 
             # skip primary analysis for unaffected members
             # require this sample to be categorised - check Sample contents
             # minimum depth of call
-            if (
-                not (
-                    self.pedigree[sample_id].affected == PEDDY_AFFECTED
-                    and principal.sample_category_check(sample_id, allow_support=False)
-                )
-            ) or (
-                principal.depths[sample_id] < self.minimum_depth
-                and not principal.info.get('categoryboolean1')
+            if not (
+                sample_id in carriers.probands
+                and principal.sample_category_check(sample_id, allow_support=False)
             ):
                 continue
 
@@ -573,7 +799,7 @@ class RecessiveAutosomalHomo(BaseMoi):
             classifications.append(
                 ReportedVariant(
                     sample=sample_id,
-                    family=self.pedigree[sample_id].family_id,
+                    family=self.family_index.family_id(sample_id),
                     gene=principal.info.get('gene_id'),
                     var_data=MinimalVariant(principal, sample_id),
                     genotypes=self.get_family_genotypes(
@@ -597,7 +823,12 @@ class XDominant(BaseMoi):
     re-implement here, but don't permit Male X-Homs
     """
 
-    def __init__(self, pedigree: Ped, applied_moi: str = 'X_Dominant'):
+    def __init__(
+        self,
+        pedigree: Ped,
+        applied_moi: str = 'X_Dominant',
+        family_index: FamilyIndex | None = None,
+    ):
         """
         accept male hets and homs, and female hets without support
         :param pedigree:
@@ -607,13 +838,16 @@ class XDominant(BaseMoi):
         self.ac_threshold = get_config()['moi_tests'][GNOMAD_AD_AC_THRESHOLD]
         self.hom_threshold = get_config()['moi_tests'][GNOMAD_DOM_HOM_THRESHOLD]
         self.hemi_threshold = get_config()['moi_tests'][GNOMAD_HEMI_THRESHOLD]
-        super().__init__(pedigree=pedigree, applied_moi=applied_moi)
+        super().__init__(
+            pedigree=pedigree, applied_moi=applied_moi, family_index=family_index
+        )
 
     def run(
         self,
         principal: AbstractVariant,
         comp_het: CompHetDict | None = None,
         partial_pen: bool = False,
+        carriers: VariantCarriers | None = None,
     ) -> list[ReportedVariant]:
         """
         if variant is present and sufficiently rare, we take it
@@ -623,6 +857,7 @@ class XDominant(BaseMoi):
             principal ():
             comp_het ():
             partial_pen ():
+            carriers ():
         """
 
         classifications = []
@@ -641,21 +876,17 @@ class XDominant(BaseMoi):
             return classifications
 
         # all samples which have a variant call
-        samples_with_this_variant = principal.het_samples.union(principal.hom_samples)
+        carriers = self.get_carriers(principal, carriers)
+        samples_with_this_variant = carriers.carriers
 
         for sample_id in samples_with_this_variant:
 
             # skip primary analysis for unaffected members
             # we require this specific sample to be categorised
             # force minimum depth
-            if (
-                not (
-                    principal.sample_category_check(sample_id, allow_support=False)
-                    and self.pedigree[sample_id].affected == PEDDY_AFFECTED
-                )
-            ) or (
-                principal.depths[sample_id] < self.minimum_depth
-                and not principal.info.get('categoryboolean1')
+            if not (
+                sample_id in carriers.probands
+                and principal.sample_category_check(sample_id, allow_support=False)
             ):
                 continue
 
@@ -670,7 +901,7 @@ class XDominant(BaseMoi):
             classifications.append(
                 ReportedVariant(
                     sample=sample_id,
-                    family=self.pedigree[sample_id].family_id,
+                    family=self.family_index.family_id(sample_id),
                     gene=principal.info.get('gene_id'),
                     var_data=MinimalVariant(principal, sample_id),
                     reasons={self.applied_moi},
@@ -693,6 +924,7 @@ class XRecessiveMale(BaseMoi):
         self,
         pedigree: Ped,
         applied_moi: str = 'X_Male',
+        family_index: FamilyIndex | None = None,
     ):
         """
         set parameters specific to male X tests
@@ -704,19 +936,23 @@ class XRecessiveMale(BaseMoi):
 
         self.hom_dom_threshold = get_config()['moi_tests'][GNOMAD_DOM_HOM_THRESHOLD]
         self.hemi_threshold = get_config()['moi_tests'][GNOMAD_HEMI_THRESHOLD]
-        super().__init__(pedigree=pedigree, applied_moi=applied_moi)
+        super().__init__(
+            pedigree=pedigree, applied_moi=applied_moi, family_index=family_index
+        )
 
     def run(
         self,
         principal: AbstractVariant,
         comp_het: CompHetDict | None = None,
         partial_pen: bool = False,
+        carriers: VariantCarriers | None = None,
     ) -> list[ReportedVariant]:
         """
         Args:
             principal ():
             comp_het ():
             partial_pen ():
+            carriers ():
         """
 
         classifications = []
@@ -734,23 +970,17 @@ class XRecessiveMale(BaseMoi):
         # combine het and hom here, we don't trust the variant callers
         # if hemi count is too high, don't consider males
         # never consider support variants on X for males
+        carriers = self.get_carriers(principal, carriers)
         males = {
-            sam
-            for sam in principal.het_samples.union(principal.hom_samples)
-            if self.pedigree[sam].sex == 'male'
+            sam for sam in carriers.carriers if self.family_index.sex(sam) == 'male'
         }
 
         for sample_id in males:
 
             # specific affected sample category check
-            if (
-                not (
-                    self.pedigree[sample_id].affected == PEDDY_AFFECTED
-                    and principal.sample_category_check(sample_id, allow_support=False)
-                )
-            ) or (
-                principal.depths[sample_id] < self.minimum_depth
-                and not principal.info.get('categoryboolean1')
+            if not (
+                sample_id in carriers.probands
+                and principal.sample_category_check(sample_id, allow_support=False)
             ):
                 continue
 
@@ -765,7 +995,7 @@ class XRecessiveMale(BaseMoi):
             classifications.append(
                 ReportedVariant(
                     sample=sample_id,
-                    family=self.pedigree[sample_id].family_id,
+                    family=self.family_index.family_id(sample_id),
                     gene=principal.info.get('gene_id'),
                     var_data=MinimalVariant(principal, sample_id),
                     genotypes=self.get_family_genotypes(
@@ -787,6 +1017,7 @@ class XRecessiveFemaleHom(BaseMoi):
         self,
         pedigree: Ped,
         applied_moi: str = 'X_Recessive HOM Female',
+        family_index: FamilyIndex | None = None,
     ):
         """
         set parameters specific to recessive tests
@@ -797,13 +1028,16 @@ class XRecessiveFemaleHom(BaseMoi):
         """
 
         self.hom_rec_threshold = get_config()['moi_tests'][GNOMAD_REC_HOM_THRESHOLD]
-        super().__init__(pedigree=pedigree, applied_moi=applied_moi)
+        super().__init__(
+            pedigree=pedigree, applied_moi=applied_moi, family_index=family_index
+        )
 
     def run(
         self,
         principal: AbstractVariant,
         comp_het: CompHetDict | None = None,
         partial_pen: bool = False,
+        carriers: VariantCarriers | None = None,
     ) -> list[ReportedVariant]:
         """
 
@@ -811,6 +1045,7 @@ class XRecessiveFemaleHom(BaseMoi):
             principal ():
             comp_het ():
             partial_pen ():
+            carriers ():
         """
 
         classifications = []
@@ -826,22 +1061,21 @@ class XRecessiveFemaleHom(BaseMoi):
         ):
             return classifications
 
+        carriers = self.get_carriers(principal, carriers)
+
         # never consider support homs
         samples_to_check = {
-            sam for sam in principal.hom_samples if self.pedigree[sam].sex == 'female'
+            sam
+            for sam in principal.hom_samples
+            if self.family_index.sex(sam) == 'female'
         }
 
         for sample_id in samples_to_check:
 
             # specific affected sample category check
-            if (
-                not (
-                    self.pedigree[sample_id].affected == PEDDY_AFFECTED
-                    and principal.sample_category_check(sample_id, allow_support=False)
-                )
-            ) or (
-                principal.depths[sample_id] < self.minimum_depth
-                and not principal.info.get('categoryboolean1')
+            if not (
+                sample_id in carriers.probands
+                and principal.sample_category_check(sample_id, allow_support=False)
             ):
                 continue
 
@@ -856,7 +1090,7 @@ class XRecessiveFemaleHom(BaseMoi):
             classifications.append(
                 ReportedVariant(
                     sample=sample_id,
-                    family=self.pedigree[sample_id].family_id,
+                    family=self.family_index.family_id(sample_id),
                     gene=principal.info.get('gene_id'),
                     var_data=MinimalVariant(principal, sample_id),
                     genotypes=self.get_family_genotypes(
@@ -878,6 +1112,7 @@ class XRecessiveFemaleCH(BaseMoi):
         self,
         pedigree: Ped,
         applied_moi: str = 'X_RecessiveFemaleCompHet',
+        family_index: FamilyIndex | None = None,
     ):
         """
         set parameters specific to recessive tests
@@ -888,13 +1123,16 @@ class XRecessiveFemaleCH(BaseMoi):
         """
 
         self.hom_rec_threshold = get_config()['moi_tests'][GNOMAD_REC_HOM_THRESHOLD]
-        super().__init__(pedigree=pedigree, applied_moi=applied_moi)
+        super().__init__(
+            pedigree=pedigree, applied_moi=applied_moi, family_index=family_index
+        )
 
     def run(
         self,
         principal: AbstractVariant,
         comp_het: CompHetDict | None = None,
         partial_pen: bool = False,
+        carriers: VariantCarriers | None = None,
     ) -> list[ReportedVariant]:
         """
 
@@ -902,6 +1140,7 @@ class XRecessiveFemaleCH(BaseMoi):
             principal ():
             comp_het ():
             partial_pen ():
+            carriers ():
         """
 
         if comp_het is None:
@@ -915,8 +1154,12 @@ class XRecessiveFemaleCH(BaseMoi):
         ) and not principal.info.get('categoryboolean1'):
             return classifications
 
+        carriers = self.get_carriers(principal, carriers)
+
         het_females = {
-            sam for sam in principal.het_samples if self.pedigree[sam].sex == 'female'
+            sam
+            for sam in principal.het_samples
+            if self.family_index.sex(sam) == 'female'
         }
 
         # if het females are present, try and find support
@@ -924,14 +1167,9 @@ class XRecessiveFemaleCH(BaseMoi):
 
             # don't run primary analysis for unaffected
             # we require this specific sample to be categorised - check Cat 4 contents
-            if (
-                not (
-                    self.pedigree[sample_id].affected == PEDDY_AFFECTED
-                    and principal.sample_category_check(sample_id, allow_support=True)
-                )
-            ) or (
-                principal.depths[sample_id] < self.minimum_depth
-                and not principal.info.get('categoryboolean1')
+            if not (
+                sample_id in carriers.probands
+                and principal.sample_category_check(sample_id, allow_support=True)
             ):
                 continue
 
@@ -972,7 +1210,7 @@ class XRecessiveFemaleCH(BaseMoi):
                 classifications.append(
                     ReportedVariant(
                         sample=sample_id,
-                        family=self.pedigree[sample_id].family_id,
+                        family=self.family_index.family_id(sample_id),
                         gene=principal.info.get('gene_id'),
                         var_data=MinimalVariant(principal, sample_id),
                         reasons={self.applied_moi},
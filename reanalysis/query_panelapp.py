@@ -111,6 +111,7 @@ def get_panel_green(
 
         ensg = None
         chrom = None
+        location = None
 
         # for some reason the build is capitalised oddly in panelapp
         # at least one entry doesn't have an ENSG annotation
@@ -119,7 +120,8 @@ def get_panel_green(
                 # the ensembl version may alter over time, but will be singular
                 ensembl_data = content[list(content.keys())[0]]
                 ensg = ensembl_data['ensembl_id']
-                chrom = ensembl_data['location'].split(':')[0]
+                location = ensembl_data['location']
+                chrom = location.split(':')[0]
 
         if (
             ensg is None
@@ -162,6 +164,7 @@ def get_panel_green(
                 'new': [panel_id] if new_gene else [],
                 'panels': [panel_id],
                 'chrom': chrom,
+                'location': location,
             }
 
 
@@ -16,22 +16,27 @@ variant_summary.txt
  - links clinvar AlleleID, Variant ID, position and alleles
 """
 
+import csv
 import gzip
+import hashlib
+import inspect
 import logging
 import json
 import re
+import sys
 from argparse import ArgumentParser
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
+from functools import lru_cache
 
 import hail as hl
 import pandas as pd
 
 from cpg_utils import to_path, CloudPath
-from cpg_utils.hail_batch import output_path, init_batch
-from cpg_utils.config import ConfigError
+from cpg_utils.hail_batch import init_batch
 
 from reanalysis.utils import get_cohort_config
 
@@ -56,9 +61,22 @@ ORDERED_ALLELES = [f'chr{x}' for x in list(range(1, 23))] + ['chrX', 'chrY', 'ch
 # assumed to be influential since 2016
 ACMG_THRESHOLD = datetime(year=2016, month=1, day=1)
 VERY_OLD = datetime(year=1970, month=1, day=1)
+
+# Submission dates are held as day ordinals, see datetime.toordinal
+ACMG_THRESHOLD_DAY = ACMG_THRESHOLD.toordinal()
+VERY_OLD_DAY = VERY_OLD.toordinal()
 LARGEST_COMPLEX_INDELS = 40
 BASES = re.compile(r'[ACGTN]+')
 
+# characters of decompressed text handed to each worker in a parallel ingest
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# per-process state for submission parsing workers, set by the pool initializer
+_WORKER_STATE: dict = {}
+
+# bump when the decisions table schema changes, to force a full rebuild
+DECISION_SCHEMA_VERSION = 1
+
 
 class Consequence(Enum):
     """
@@ -85,18 +103,52 @@ except AssertionError:
     ]
 
 
-@dataclass
+@dataclass(slots=True)
 class Submission:
     """
     POPO to store details on each Submission
+    the date is a day ordinal, and the submitter & review status strings
+    are interned - millions of Submissions share a few thousand values
     """
 
-    date: datetime
+    date: int
     submitter: str
     classification: Consequence
     review_status: str
 
 
+@lru_cache(maxsize=None)
+def parse_submission_date(date: str) -> int:
+    """
+    memoised parse of a submission date to a day ordinal
+    there are only a few thousand distinct dates across all submissions
+
+    Args:
+        date (str): e.g. 'Jul 13, 2021', or '-' if undated
+
+    Returns:
+        the day ordinal, undated submissions are very old
+    """
+    if date == '-':
+        return VERY_OLD_DAY
+    return datetime.strptime(date, '%b %d, %Y').toordinal()
+
+
+@lru_cache(maxsize=None)
+def intern_label(label: str) -> str:
+    """
+    memoised lower-casing of a submitter or review status
+    each distinct value is held once, and shared by all its Submissions
+
+    Args:
+        label (str): the raw value
+
+    Returns:
+        the interned, lower-case value
+    """
+    return sys.intern(label.lower())
+
+
 def get_allele_locus_map(summary_file: str) -> dict:
     """
     Process variant_summary.txt
@@ -153,29 +205,153 @@ def get_allele_locus_map(summary_file: str) -> dict:
     return allele_dict
 
 
-def lines_from_gzip(filename: str) -> str:
+def get_allele_locus_map_columnar(summary_file: str) -> dict:
     """
-    generator for gzip reading, copies file locally before reading
+    columnar equivalent of get_allele_locus_map
+    reads only the required columns of variant_summary.txt, with types,
+    and applies the same filters as vectorised masks
+    relevant fields:
+    0 #AlleleID
+    16 Assembly
+    18 Chromosome
+    30 VariationID
+    31 Start
+    32 ReferenceAllele
+    33 AlternateAllele
 
     Args:
-        filename (str): the gzipped input file
+        summary_file (str): path to the gzipped text file
 
     Returns:
-        generator; yields each line
+        dictionary of each variant ID to the positional details
+    """
+
+    filename = localise_file(summary_file)
+    frame = pd.read_csv(
+        filename,
+        sep='\t',
+        header=None,
+        skiprows=count_comment_lines(filename),
+        usecols=[0, 16, 18, 30, 31, 32, 33],
+        names=['allele', 'assembly', 'chrom', 'var_id', 'pos', 'ref', 'alt'],
+        dtype={
+            'allele': int,
+            'assembly': str,
+            'chrom': str,
+            'var_id': int,
+            'pos': int,
+            'ref': str,
+            'alt': str,
+        },
+        keep_default_na=False,
+        quoting=csv.QUOTE_NONE,
+    )
+    frame = frame[frame['assembly'] != 'GRCh37']
+    frame['chrom'] = frame['chrom'].where(
+        frame['chrom'].str.contains('chr', regex=False), 'chr' + frame['chrom']
+    )
+
+    # skip chromosomal deletions and insertions, mito, or massive indels
+    # and don't include any of the trash bases in ClinVar
+    frame = frame[
+        (frame['ref'] != 'na')
+        & (frame['alt'] != 'na')
+        & (frame['ref'] != frame['alt'])
+        & ~frame['chrom'].str.lower().str.contains('m', regex=False)
+        & ((frame['ref'].str.len() + frame['alt'].str.len()) <= LARGEST_COMPLEX_INDELS)
+        & frame['ref'].str.match(BASES)
+        & frame['alt'].str.match(BASES)
+    ]
+
+    # later rows for the same variant ID replace earlier ones
+    frame = frame.drop_duplicates(subset='var_id', keep='last')
+
+    return {
+        row.var_id: {
+            'allele': row.allele,
+            'chrom': row.chrom,
+            'pos': row.pos,
+            'ref': row.ref,
+            'alt': row.alt,
+        }
+        for row in frame.itertuples(index=False)
+    }
+
+
+def count_comment_lines(filename: str) -> int:
+    """
+    count the '#'-prefixed header lines at the start of a gzipped file
+
+    Args:
+        filename (str): the local gzipped input file
+
+    Returns:
+        the number of lines to skip before the data
+    """
+    comment_lines = 0
+    with gzip.open(filename, 'rt') as handle:
+        for line in handle:
+            if not line.startswith('#'):
+                break
+            comment_lines += 1
+    return comment_lines
+
+
+def localise_file(filename: str) -> str:
+    """
+    copies a cloud file locally before reading
+
+    Args:
+        filename (str): the input file
+
+    Returns:
+        a local path to the same file
     """
 
     if isinstance(to_path(filename), CloudPath):
         tempfile = 'file.txt.gz'
         to_path(filename).copy(tempfile)
-        filename = tempfile
+        return tempfile
+    return filename
 
-    with gzip.open(filename, 'rt') as handle:
+
+def lines_from_gzip(filename: str) -> str:
+    """
+    generator for gzip reading, copies file locally before reading
+
+    Args:
+        filename (str): the gzipped input file
+
+    Returns:
+        generator; yields each line
+    """
+
+    with gzip.open(localise_file(filename), 'rt') as handle:
         for line in handle:
             if line.startswith('#'):
                 continue
             yield line.rstrip().split('\t')
 
 
+def chunks_from_gzip(filename: str, chunk_size: int = CHUNK_SIZE) -> str:
+    """
+    generator for gzip reading in large blocks of whole lines
+    copies file locally before reading
+
+    Args:
+        filename (str): the gzipped input file
+        chunk_size (int): approximate characters per block
+
+    Returns:
+        generator; yields blocks of text, each ending on a line break
+    """
+
+    with gzip.open(localise_file(filename), 'rt') as handle:
+        while chunk := handle.read(chunk_size):
+            # extend to the end of the current line
+            yield chunk + handle.readline()
+
+
 def consequence_decision(subs: list[Submission]) -> Consequence:
     """
     determine overall consequence assignment based on submissions
@@ -280,9 +456,9 @@ def process_line(data: list[str]) -> tuple[int, Submission]:
         classification = Consequence.UNCERTAIN
     else:
         classification = Consequence.UNKNOWN
-    date = datetime.strptime(data[2], '%b %d, %Y') if data[2] != '-' else VERY_OLD
-    sub = data[9].lower()
-    rev_status = data[6].lower()
+    date = parse_submission_date(data[2])
+    sub = intern_label(data[9])
+    rev_status = intern_label(data[6])
 
     return allele_id, Submission(date, sub, classification, rev_status)
 
@@ -290,40 +466,127 @@ def process_line(data: list[str]) -> tuple[int, Submission]:
 def dict_list_to_ht(list_of_dicts: list) -> hl.Table:
     """
     takes the per-allele results and aggregates into a hl.Table
+    rows are parallelized with an explicit schema, without a text round trip
+
+    the decisions are normally already in key order (see sort_decisions),
+    which keeps the keying cheap, but Hail still orders the rows itself
 
     Args:
-        list_of_dicts ():
+        list_of_dicts (): per-allele decisions
 
     Returns:
         Hail table of the same content, indexed on locus & alleles
     """
 
-    # convert list of dictionaries to a DataFrame
-    pdf = pd.DataFrame(list_of_dicts)
+    schema = hl.tstruct(
+        locus=hl.tlocus(hl.default_reference()),
+        alleles=hl.tarray(hl.tstr),
+        id=hl.tint32,
+        clinical_significance=hl.tstr,
+        gold_stars=hl.tint32,
+        allele_id=hl.tint32,
+    )
 
-    # convert DataFrame to a Table, keyed on Locus & Alleles
-    return hl.Table.from_pandas(pdf, key=['locus', 'alleles'])
+    rows = [
+        {
+            'locus': hl.Locus(each['contig'], each['position']),
+            'alleles': each['alleles'],
+            'id': each['id'],
+            'clinical_significance': each['clinical_significance'],
+            'gold_stars': each['gold_stars'],
+            'allele_id': each['allele_id'],
+        }
+        for each in list_of_dicts
+    ]
 
+    # convert to a Table, keyed on Locus & Alleles
+    return hl.Table.parallelize(rows, schema=schema, key=['locus', 'alleles'])
 
-def get_all_decisions(
-    submission_file: str, threshold_date: datetime, allele_ids: set
-) -> dict[str, list[Submission]]:
+
+def keep_submission(
+    a_id: int,
+    line_sub: Submission,
+    allele_ids: set,
+    blacklist: list[str],
+    threshold_day: int,
+) -> bool:
     """
-    obtains all submissions per-allele which pass basic criteria
-        - not a blacklisted submitter
-        - not a csq-specific blacklisted submitter
-        - not after the user-specified date
+    check a single submission against the basic criteria
 
     Args:
-        submission_file (): file containing submission-per-line
-        threshold_date (): ignore submissions after this date
+        a_id (): the allele ID of this submission
+        line_sub (): the Submission
         allele_ids (): only process alleleIDs we have pos data for
+        blacklist (): submitters to remove entirely
+        threshold_day (int): ignore submissions after this date ordinal
 
     Returns:
-        dictionary of alleles and their corresponding submissions
+        True if this submission should be retained
     """
 
+    # skip rows where the variantID isn't in this mapping
+    # this saves a little effort on haplotypes, CNVs, and SVs
+    if (
+        (a_id not in allele_ids)
+        or (line_sub.submitter in blacklist)
+        or (line_sub.date > threshold_day)
+        or (line_sub.review_status in USELESS_RATINGS)
+        or (line_sub.classification == Consequence.UNKNOWN)
+    ):
+        return False
+
+    # screen out some submitters per-consequence
+    for consequence, submitters in QUALIFIED_BLACKLIST:
+        if line_sub.classification == consequence and line_sub.submitter in submitters:
+            continue
+
+    return True
+
+
+def init_chunk_worker(allele_ids: set, blacklist: list[str], threshold_day: int):
+    """
+    pool initializer - runs once in each worker process
+    holds the filtering criteria, so they aren't sent with every chunk
+
+    Args:
+        allele_ids (): only process alleleIDs we have pos data for
+        blacklist (): submitters to remove entirely
+        threshold_day (): ignore submissions after this day ordinal
+    """
+    _WORKER_STATE.update(
+        allele_ids=allele_ids, blacklist=blacklist, threshold_day=threshold_day
+    )
+
+
+def parse_submission_chunk(chunk: str) -> dict[int, list[Submission]]:
+    """
+    parse a block of whole lines from the submission file, in a worker
+
+    Args:
+        chunk (): decompressed text, one submission per line
+
+    Returns:
+        the retained submissions in this block, per allele
+    """
     submission_dict = defaultdict(list)
+    # split on newlines only, as the serial reader does; splitlines would
+    # also break on control characters within free-text fields
+    for line in chunk.split('\n'):
+        if not line or line.startswith('#'):
+            continue
+        a_id, line_sub = process_line(line.rstrip().split('\t'))
+        if keep_submission(a_id, line_sub, **_WORKER_STATE):
+            submission_dict[a_id].append(line_sub)
+    return submission_dict
+
+
+def get_submitter_blacklist() -> list[str]:
+    """
+    submitters whose entries are removed entirely, from the cohort config
+
+    Returns:
+        list of lower-case submitter names
+    """
 
     # remove all entries from these providers
     # for now require a mandatory dataset, may amend later
@@ -333,30 +596,155 @@ def get_all_decisions(
         logging.info(f'Blacklisted sites: {blacklist}')
     except (AssertionError, KeyError):
         blacklist = []
+    return blacklist
 
-    for line in lines_from_gzip(submission_file):
-        a_id, line_sub = process_line(line)
 
-        # skip rows where the variantID isn't in this mapping
-        # this saves a little effort on haplotypes, CNVs, and SVs
-        if (
-            (a_id not in allele_ids)
-            or (line_sub.submitter in blacklist)
-            or (line_sub.date > threshold_date)
-            or (line_sub.review_status in USELESS_RATINGS)
-            or (line_sub.classification == Consequence.UNKNOWN)
-        ):
-            continue
+def get_all_decisions_columnar(
+    submission_file: str, threshold_date: datetime, allele_ids: set
+) -> dict[int, list[Submission]]:
+    """
+    columnar equivalent of get_all_decisions
+    reads only the required columns of submission_summary.txt, classifies
+    and parses dates as whole columns, and filters with vectorised masks.
+    Only the retained rows are built into Submissions, grouped by allele
+    relevant fields:
+    0 VariationID
+    1 ClinicalSignificance
+    2 DateLastEvaluated
+    6 ReviewStatus
+    9 Submitter
 
-        # screen out some submitters per-consequence
-        for consequence, submitters in QUALIFIED_BLACKLIST:
-            if (
-                line_sub.classification == consequence
-                and line_sub.submitter in submitters
-            ):
-                continue
+    Args:
+        submission_file (): file containing submission-per-line
+        threshold_date (): ignore submissions after this date
+        allele_ids (): only process alleleIDs we have pos data for
+
+    Returns:
+        dictionary of alleles and their corresponding submissions
+    """
+
+    filename = localise_file(submission_file)
+    frame = pd.read_csv(
+        filename,
+        sep='\t',
+        header=None,
+        skiprows=count_comment_lines(filename),
+        usecols=[0, 1, 2, 6, 9],
+        names=['allele_id', 'significance', 'date', 'review_status', 'submitter'],
+        dtype={
+            'allele_id': int,
+            'significance': str,
+            'date': str,
+            'review_status': str,
+            'submitter': str,
+        },
+        keep_default_na=False,
+        quoting=csv.QUOTE_NONE,
+    )
+
+    classification = pd.Series(Consequence.UNKNOWN, index=frame.index, dtype=object)
+    for significances, consequence in [
+        (PATH_SIGS, Consequence.PATHOGENIC),
+        (BENIGN_SIGS, Consequence.BENIGN),
+        (UNCERTAIN_SIGS, Consequence.UNCERTAIN),
+    ]:
+        classification[frame['significance'].isin(significances)] = consequence
+    frame['classification'] = classification
+
+    # day ordinals, counting on from the undated default
+    undated = frame['date'] == '-'
+    dates = pd.to_datetime(frame['date'].mask(undated), format='%b %d, %Y')
+    days = (dates - pd.Timestamp(VERY_OLD)).dt.days.fillna(0)
+    frame['date'] = days.astype(int) + VERY_OLD_DAY
+
+    # categoricals hold each distinct string once, shared by every row
+    frame['submitter'] = frame['submitter'].str.lower().astype('category')
+    frame['review_status'] = frame['review_status'].str.lower().astype('category')
+
+    frame = frame[
+        frame['allele_id'].isin(allele_ids)
+        & ~frame['submitter'].isin(get_submitter_blacklist())
+        & (frame['date'] <= threshold_date.toordinal())
+        & ~frame['review_status'].isin(USELESS_RATINGS)
+        & (frame['classification'] != Consequence.UNKNOWN)
+    ]
+
+    # build the retained Submissions column-wise, then group by allele
+    submissions = [
+        Submission(*fields)
+        for fields in zip(
+            frame['date'].tolist(),
+            frame['submitter'],
+            frame['classification'],
+            frame['review_status'],
+        )
+    ]
+    # groupby keys are numpy integers, cast back to match the line parser
+    return {
+        int(allele_id): [submissions[position] for position in positions]
+        for allele_id, positions in frame.groupby('allele_id').indices.items()
+    }
+
+
+def get_all_decisions(
+    submission_file: str,
+    threshold_date: datetime,
+    allele_ids: set,
+    workers: int = 1,
+    chunk_size: int = CHUNK_SIZE,
+) -> dict[str, list[Submission]]:
+    """
+    obtains all submissions per-allele which pass basic criteria
+        - not a blacklisted submitter
+        - not a csq-specific blacklisted submitter
+        - not after the user-specified date
 
-        submission_dict[a_id].append(line_sub)
+    with more than one worker, the decompressed file is split into blocks of
+    whole lines, parsed in a process pool, and merged back in file order
+
+    Args:
+        submission_file (): file containing submission-per-line
+        threshold_date (): ignore submissions after this date
+        allele_ids (): only process alleleIDs we have pos data for
+        workers (): number of processes to parse the file in, 1 = serial
+        chunk_size (): approximate characters of text per parallel block
+
+    Returns:
+        dictionary of alleles and their corresponding submissions
+    """
+
+    submission_dict = defaultdict(list)
+    blacklist = get_submitter_blacklist()
+    threshold_day = threshold_date.toordinal()
+
+    if workers <= 1:
+        for line in lines_from_gzip(submission_file):
+            a_id, line_sub = process_line(line)
+            if keep_submission(a_id, line_sub, allele_ids, blacklist, threshold_day):
+                submission_dict[a_id].append(line_sub)
+
+        return submission_dict
+
+    logging.info(f'Parsing submissions using {workers} workers')
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_chunk_worker,
+        initargs=(allele_ids, blacklist, threshold_day),
+    ) as executor:
+
+        def merge(partial: dict[int, list[Submission]]):
+            for a_id, submissions in partial.items():
+                submission_dict[a_id].extend(submissions)
+
+        # bound the blocks in flight, so the file isn't all held in memory
+        # results are merged in submission order, matching a serial read
+        pending = deque()
+        for chunk in chunks_from_gzip(submission_file, chunk_size=chunk_size):
+            pending.append(executor.submit(parse_submission_chunk, chunk))
+            if len(pending) >= workers * 2:
+                merge(pending.popleft().result())
+        while pending:
+            merge(pending.popleft().result())
 
     return submission_dict
 
@@ -384,7 +772,7 @@ def acmg_filter_submissions(subs: list[Submission]) -> list[Submission]:
     date_filt_subs = [
         sub
         for sub in subs
-        if sub.date >= ACMG_THRESHOLD or sub.review_status in STRONG_REVIEWS
+        if sub.date >= ACMG_THRESHOLD_DAY or sub.review_status in STRONG_REVIEWS
     ]
 
     # if this contains results, return only those
@@ -395,26 +783,28 @@ def acmg_filter_submissions(subs: list[Submission]) -> list[Submission]:
 def sort_decisions(all_subs: list[dict]) -> list[dict]:
     """
     applies dual-layer sorting to the list of all decisions
+    this matches the ordering of the locus & alleles table key
 
     Args:
         all_subs (): list of all submissions
 
     Returns:
-        a list of submissions, sorted hierarchically on chr & pos
+        a list of submissions, sorted hierarchically on chr, pos & alleles
     """
 
     return sorted(
-        all_subs, key=lambda x: (ORDERED_ALLELES.index(x['contig']), x['position'])
+        all_subs,
+        key=lambda x: (ORDERED_ALLELES.index(x['contig']), x['position'], x['alleles']),
     )
 
 
-def parse_into_table(json_path: str, out_path: str) -> hl.Table:
+def parse_into_table(decisions: list[dict], out_path: str) -> hl.Table:
     """
-    takes the file of one clinvar variant per line
-    processes that line into a table based on the schema
+    takes the sorted list of one clinvar decision per variant
+    and writes it out as a Hail table
 
     Args:
-        json_path (): path to the JSON file (temp)
+        decisions (): sorted per-allele decisions
         out_path (): where to write the Hail table
 
     Returns:
@@ -424,32 +814,159 @@ def parse_into_table(json_path: str, out_path: str) -> hl.Table:
     # start a hail runtime
     init_batch()
 
-    # define the schema for each written line
-    schema = hl.dtype(
-        'struct{'
-        'alleles:array<str>,'
-        'contig:str,'
-        'position:int32,'
-        'id:int32,'
-        'clinical_significance:str,'
-        'gold_stars:int32,'
-        'allele_id:int32'
-        '}'
-    )
+    ht = dict_list_to_ht(decisions)
+
+    # write out
+    ht.write(out_path, overwrite=True)
+    return ht
+
 
-    # import the table, and transmute to top-level attributes
-    ht = hl.import_table(json_path, no_header=True, types={'f0': schema})
-    ht = ht.transmute(**ht.f0)
+def patch_table(
+    previous_table: str,
+    decisions: list[dict],
+    replaced_ids: set[int],
+    out_path: str,
+) -> hl.Table:
+    """
+    update the decisions table from a previous run, rather than rebuilding
+    rows for any replaced ID are removed, then all new rows are added
+
+    Args:
+        previous_table (): the decisions table from the previous run
+        decisions (): sorted re-decided rows, may be empty
+        replaced_ids (): IDs of all changed or removed alleles
+        out_path (): where to write the Hail table
 
-    # create a locus and key
-    ht = ht.transmute(locus=hl.locus(ht.contig, ht.position))
-    ht = ht.key_by(ht.locus, ht.alleles)
+    Returns:
+        the Hail Table object created
+    """
+
+    if previous_table.rstrip('/') == out_path.rstrip('/'):
+        raise ValueError(f'Cannot patch the table {out_path} in place')
+
+    # start a hail runtime
+    init_batch()
+
+    ht = hl.read_table(previous_table)
+    if replaced_ids:
+        ht = ht.filter(
+            hl.literal(replaced_ids, dtype=hl.tset(hl.tint32)).contains(ht.id),
+            keep=False,
+        )
+    if decisions:
+        ht = ht.union(dict_list_to_ht(decisions))
 
     # write out
     ht.write(out_path, overwrite=True)
     return ht
 
 
+@lru_cache(maxsize=1)
+def decision_logic_version() -> str:
+    """
+    a digest of the decision logic and the table schema version
+    any change to the rules used to reach a decision changes all digests
+
+    Returns:
+        a short hex digest
+    """
+    logic = [
+        inspect.getsource(function)
+        for function in [acmg_filter_submissions, check_stars, consequence_decision]
+    ]
+    constants = [
+        DECISION_SCHEMA_VERSION,
+        sorted(BENIGN_SIGS),
+        CONFLICTING,
+        sorted(PATH_SIGS),
+        sorted(UNCERTAIN_SIGS),
+        sorted(USELESS_RATINGS),
+        MAJORITY_RATIO,
+        MINORITY_RATIO,
+        STRONG_REVIEWS,
+        ACMG_THRESHOLD_DAY,
+    ]
+    content = json.dumps([logic, constants])
+    return hashlib.blake2b(content.encode('utf-8'), digest_size=10).hexdigest()
+
+
+def submission_digest(submissions: list[Submission], locus: dict) -> str:
+    """
+    a digest of everything the decision for one allele is based on
+    in submission order, as the strongest review found first is used
+    this includes the version of the decision logic itself
+
+    Args:
+        submissions (): all retained submissions for this allele
+        locus (): the allele's positional details
+
+    Returns:
+        a short hex digest
+    """
+    content = json.dumps(
+        [
+            decision_logic_version(),
+            locus,
+            [
+                [sub.date, sub.submitter, sub.classification.value, sub.review_status]
+                for sub in submissions
+            ],
+        ],
+        sort_keys=True,
+    )
+    return hashlib.blake2b(content.encode('utf-8'), digest_size=10).hexdigest()
+
+
+def digests_path(table_path: str) -> str:
+    """
+    the per-allele digests are written alongside the decisions table
+
+    Args:
+        table_path (): path to the decisions table
+
+    Returns:
+        the path of the digest file
+    """
+    return f'{table_path.rstrip("/").removesuffix(".ht")}_digests.json.gz'
+
+
+def read_digests(table_path: str) -> dict[int, str] | None:
+    """
+    read the per-allele digests written with a previous decisions table
+
+    Args:
+        table_path (): path to the previous decisions table
+
+    Returns:
+        the digest per allele ID, or None if unavailable or written by a
+        different version of the decision logic
+    """
+    digest_file = to_path(digests_path(table_path))
+    if not (digest_file.exists() and to_path(table_path).exists()):
+        return None
+    with digest_file.open('rb') as handle, gzip.open(handle, 'rt') as gz_handle:
+        content = json.load(gz_handle)
+    if content.get('version') != decision_logic_version():
+        logging.warning(f'Digests for {table_path} are from other decision logic')
+        return None
+    return {int(key): value for key, value in content['digests'].items()}
+
+
+def write_digests(digests: dict[int, str], table_path: str):
+    """
+    write the per-allele digests alongside the decisions table
+
+    Args:
+        digests (): the digest per allele ID
+        table_path (): path to the decisions table
+    """
+    with to_path(digests_path(table_path)).open('wb') as handle:
+        with gzip.open(handle, 'wt') as gz_handle:
+            json.dump(
+                {'version': decision_logic_version(), 'digests': digests}, gz_handle
+            )
+
+
 def snv_missense_filter(clinvar_table: hl.Table, vcf_path: str):
     """
     takes a clinvar table and a filters to SNV & Pathogenic
@@ -481,7 +998,14 @@ def snv_missense_filter(clinvar_table: hl.Table, vcf_path: str):
 
 
 def main(
-    subs: str, date: datetime, variants: str, out: str, path_snv: str | None = None
+    subs: str,
+    date: datetime,
+    variants: str,
+    out: str,
+    path_snv: str | None = None,
+    workers: int = 1,
+    columnar: bool = False,
+    previous: str | None = None,
 ):
     """
     Redefines what it is to be a clinvar summary
@@ -492,21 +1016,60 @@ def main(
         out (str): path to write JSON out to
         date (str): date threshold to use for filtering submissions
         path_snv (str): if defined, path to write SNV VCF file
+        workers (int): number of processes to parse submissions in
+        columnar (bool): read both files using the vectorised pandas reader
+        previous (str): decisions table from a previous run, to update
     """
 
     logging.info('Getting alleleID-VariantID-Loci from variant summary')
-    allele_map = get_allele_locus_map(variants)
+    if columnar:
+        allele_map = get_allele_locus_map_columnar(variants)
+    else:
+        allele_map = get_allele_locus_map(variants)
 
     logging.info('Getting all decisions, indexed on clinvar AlleleID')
-    decision_dict = get_all_decisions(
-        submission_file=subs, threshold_date=date, allele_ids=set(allele_map.keys())
-    )
+    if columnar:
+        decision_dict = get_all_decisions_columnar(
+            submission_file=subs,
+            threshold_date=date,
+            allele_ids=set(allele_map.keys()),
+        )
+    else:
+        decision_dict = get_all_decisions(
+            submission_file=subs,
+            threshold_date=date,
+            allele_ids=set(allele_map.keys()),
+            workers=workers,
+        )
+
+    # digest the submissions per allele, to compare against later runs
+    digests = {
+        allele_id: submission_digest(submissions, allele_map[allele_id])
+        for allele_id, submissions in decision_dict.items()
+    }
+
+    # if a previous run's digests are available, only re-decide changed alleles
+    previous_digests = read_digests(previous) if previous else None
+    if previous_digests is None:
+        if previous:
+            logging.warning(f'No digests found for {previous}, full rebuild')
+        changed = set(digests)
+    else:
+        changed = {
+            allele_id
+            for allele_id, digest in digests.items()
+            if previous_digests.get(allele_id) != digest
+        }
+        logging.info(f'{len(changed)} of {len(digests)} alleles have changed')
 
     # placeholder to fill wth per-allele decisions
     all_decisions = []
 
     # now filter each set of decisions per allele
     for allele_id, submissions in decision_dict.items():
+        if allele_id not in changed:
+            continue
+
         # filter against ACMG date, if appropriate
         submissions = acmg_filter_submissions(submissions)
 
@@ -535,22 +1098,18 @@ def main(
     # sort all collected decisions, trying to reduce overhead in HT later
     all_decisions = sort_decisions(all_decisions)
 
-    # if there's no defined config, write a local file
-    try:
-        temp_output = output_path(
-            f'{date.strftime("%Y-%m-%d")}_clinvar_table.json', category='tmp'
+    if previous_digests is None:
+        ht = parse_into_table(decisions=all_decisions, out_path=out)
+    else:
+        # replace changed alleles, and remove alleles no longer present
+        ht = patch_table(
+            previous_table=previous,
+            decisions=all_decisions,
+            replaced_ids=changed | (set(previous_digests) - set(digests)),
+            out_path=out,
         )
-    except (ConfigError, KeyError):
-        temp_output = f'{date.strftime("%Y-%m-%d")}_clinvar_table.json'
-
-    logging.info(f'temp JSON location: {temp_output}')
 
-    # open this temp path and write the json contents, line by line
-    with to_path(temp_output).open('w') as handle:
-        for each_dict in all_decisions:
-            handle.write(f'{json.dumps(each_dict)}\n')
-
-    ht = parse_into_table(json_path=temp_output, out_path=out)
+    write_digests(digests, out)
 
     if path_snv:
         logging.info('Writing out SNV VCF')
@@ -573,6 +1132,22 @@ if __name__ == '__main__':
         default=datetime.now(),
     )
     parser.add_argument('--path_snv', help='Output VCF, sites-only, Pathogenic SNVs')
+    parser.add_argument(
+        '--workers',
+        help='number of processes to parse submissions in, 1 = serial',
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        '--previous',
+        help='decisions table from a previous run, only changed alleles are updated',
+        default=None,
+    )
+    parser.add_argument(
+        '--columnar',
+        help='read the NCBI files with the vectorised pandas reader',
+        action='store_true',
+    )
     args = parser.parse_args()
 
     processed_date = (
@@ -587,4 +1162,7 @@ if __name__ == '__main__':
         out=args.o,
         date=processed_date,
         path_snv=args.path_snv,
+        workers=args.workers,
+        columnar=args.columnar,
+        previous=args.previous,
     )
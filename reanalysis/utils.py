@@ -2,11 +2,14 @@
 classes and methods shared across reanalysis components
 """
 
+from array import array
+from bisect import bisect_left
 from collections import defaultdict
+from collections.abc import Mapping, Sequence
 from dataclasses import dataclass, is_dataclass, field
 from datetime import datetime
 from enum import Enum
-from itertools import chain, combinations_with_replacement, islice
+from itertools import chain, combinations, islice
 from pathlib import Path
 from string import punctuation
 from typing import Any
@@ -14,11 +17,18 @@ from typing import Any
 import json
 import logging
 import re
+import numpy as np
 import requests
 
 from cpg_utils import to_path
 from cpg_utils.config import get_config
 
+# optional, faster JSON serialisation of the results file
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # pylint: disable=too-many-lines,too-many-instance-attributes,global-statement
 
 
@@ -143,6 +153,7 @@ def identify_file_type(file_path: str) -> FileTypes | Exception:
         return FileTypes.VCF_BGZ
     raise TypeError(f'File cannot be definitively typed: {str(extensions)}')
 
+
 @dataclass
 class Coordinates:
     """
@@ -193,6 +204,12 @@ class Coordinates:
             and self.alt == other.alt
         )
 
+    def __hash__(self) -> int:
+        """
+        consistent with __eq__, allows Coordinates to key an index
+        """
+        return hash((self.chrom, self.pos, self.ref, self.alt))
+
 
 def get_json_response(url: str) -> Any:
     """
@@ -283,6 +300,170 @@ def get_new_gene_map(
     return pheno_matched_new
 
 
+def get_sample_index(samples: list[str]) -> dict[str, int]:
+    """
+    build the shared sample-index table for a VCF
+    maps each sample ID to its column in the per-sample numpy arrays
+
+    Args:
+        samples (list[str]): ordered sample IDs from the VCF header
+
+    Returns:
+        dict of {sample ID: array index}
+    """
+    return {sample: index for index, sample in enumerate(samples)}
+
+
+class CarrierValues(Mapping):
+    """
+    compact per-variant store of a FORMAT value (AB, DP), carriers only
+    hom-ref and no-call samples are never consulted, so aren't stored
+    values are held in an array('d'), keyed on sorted carrier indices
+    from the shared sample-index table; double precision keeps the AB
+    values cyvcf2 reports exact, so ratio thresholds behave the same
+    """
+
+    __slots__ = ('sample_index', 'indices', 'values')
+
+    def __init__(self, values, carrier_indices, sample_index: dict[str, int]):
+        """
+        Args:
+            values (np.ndarray): one value per sample, in VCF column order
+            carrier_indices (np.ndarray): sorted columns of non-ref samples
+            sample_index (dict): the shared {sample: column} table
+        """
+        self.sample_index = sample_index
+        self.indices = array('i', carrier_indices.tolist())
+        self.values = array('d', np.asarray(values)[carrier_indices].tolist())
+
+    def __getitem__(self, sample: str) -> float:
+        index = self.sample_index[sample]
+        position = bisect_left(self.indices, index)
+        if position == len(self.indices) or self.indices[position] != index:
+            raise KeyError(sample)
+        return self.values[position]
+
+    def __iter__(self):
+        carriers = set(self.indices)
+        return (
+            sample for sample, index in self.sample_index.items() if index in carriers
+        )
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    @classmethod
+    def from_carriers(
+        cls, carrier_values, carrier_indices, sample_index: dict[str, int]
+    ) -> 'CarrierValues':
+        """
+        build from values already aligned with the sorted carrier columns,
+        e.g. from a sparse source with no per-sample arrays
+
+        Args:
+            carrier_values (list[float]): one value per carrier
+            carrier_indices (list[int]): sorted columns of non-ref samples
+            sample_index (dict): the shared {sample: column} table
+        """
+        carrier_store = cls.__new__(cls)
+        carrier_store.sample_index = sample_index
+        carrier_store.indices = array('i', carrier_indices)
+        carrier_store.values = array('d', carrier_values)
+        return carrier_store
+
+
+@dataclass(slots=True)
+class SparseCarriers:
+    """
+    the non-ref calls of one variant, from a source which only holds those
+    (the labelled Hail Table). Samples absent here have no call, they are
+    not read as hom-ref. Each field is aligned with the sorted carrier columns
+    """
+
+    indices: list[int]
+    hom: list[bool]
+    ab: list[float]
+    dp: list[float]
+    phased: dict[int, tuple[int, str]]
+
+    def non_ref_samples(self, samples: list[str]) -> tuple[set[str], set[str]]:
+        """
+        het and hom sample IDs, as get_non_ref_samples
+        """
+        het_samples = {
+            samples[index] for index, hom in zip(self.indices, self.hom) if not hom
+        }
+        hom_samples = {
+            samples[index] for index, hom in zip(self.indices, self.hom) if hom
+        }
+        return het_samples, hom_samples
+
+    def phase_data(self, samples: list[str]) -> dict[str, dict[int, str]]:
+        """
+        {sample: {phase set: genotype}} for the phased carriers, as get_phase_data
+        """
+        return {
+            samples[index]: {phase_set: genotype}
+            for index, (phase_set, genotype) in self.phased.items()
+        }
+
+
+class TranscriptConsequences(Sequence):
+    """
+    columnar store of the CSQ fields for one variant
+    each CSQ field is held once as a tuple with one value per transcript
+    per-transcript dicts are only assembled when read, e.g. in the report
+    """
+
+    __slots__ = ('columns', 'length')
+
+    def __init__(self, csq_contents: str, csq_fields: list[str]):
+        """
+        Args:
+            csq_contents (str): comma-delimited CSQ entries, each '|'-delimited
+            csq_fields (list[str]): ordered names of the '|'-delimited fields
+        """
+        rows = [each_csq.split('|') for each_csq in csq_contents.split(',')]
+        self.columns: dict[str, tuple[str, ...]] = dict(zip(csq_fields, zip(*rows)))
+        self.length = len(rows)
+
+    @classmethod
+    def from_transcripts(
+        cls, transcripts: Sequence[Mapping[str, str]], csq_fields: list[str]
+    ) -> 'TranscriptConsequences':
+        """
+        build directly from per-transcript records, e.g. the typed
+        transcript structs of the labelled Hail Table, with no string parsing
+
+        Args:
+            transcripts (list): one mapping of {CSQ field: value} per transcript
+            csq_fields (list[str]): ordered names of the CSQ fields
+        """
+        consequences = cls.__new__(cls)
+        consequences.columns = {
+            field_name: tuple(transcript[field_name] for transcript in transcripts)
+            for field_name in csq_fields
+        }
+        consequences.length = len(transcripts)
+        return consequences
+
+    def column(self, field_name: str) -> tuple[str, ...]:
+        """
+        all values of a single CSQ field, one per transcript
+        """
+        return self.columns.get(field_name, ())
+
+    def __getitem__(self, index: int) -> dict[str, str]:
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        return {key: values[index] for key, values in self.columns.items()}
+
+    def __len__(self) -> int:
+        return self.length
+
+
 def get_phase_data(samples, var) -> dict[str, dict[int, str]]:
     """
     read phase data from this variant
@@ -293,24 +474,25 @@ def get_phase_data(samples, var) -> dict[str, dict[int, str]]:
     """
     phased_dict = defaultdict(dict)
 
-    # first set the numpy.ndarray to be a list of ints
-    # then zip against ordered sample IDs
+    # mask the phased calls with a real phase set, then only
+    # build genotype strings for those samples
     # this might need to store the exact genotype too
     # i.e. 0|1 and 1|0 can be in the same phase-set
     # but are un-phased variants
 
     try:
-        for sample, phase, genotype in zip(
-            samples, map(int, var.format('PS')), var.genotypes
-        ):
-            # cyvcf2.Variant holds two ints, and a bool
-            allele_1, allele_2, phased = genotype
-            if not phased:
-                continue
-            gt = f'{allele_1}|{allele_2}'
-            # phase set is a number
-            if phase != PHASE_SET_DEFAULT:
-                phased_dict[sample][phase] = gt
+        phase_sets = np.asarray(var.format('PS')).reshape(-1)
+        phased_indices = np.flatnonzero(
+            np.asarray(var.gt_phases) & (phase_sets != PHASE_SET_DEFAULT)
+        )
+        if phased_indices.size:
+            # cyvcf2 genotype array holds two allele ints, and a phased flag
+            genotypes = var.genotype.array()
+            for index in phased_indices:
+                allele_1, allele_2 = genotypes[index][:2]
+                phased_dict[samples[index]][
+                    int(phase_sets[index])
+                ] = f'{allele_1}|{allele_2}'
     except KeyError:
         logging.info('failed to find PS phase attributes')
         try:
@@ -338,6 +520,7 @@ class AbstractVariant:
         samples: list[str],
         as_singletons=False,
         new_genes: dict[str, str] | None = None,
+        sample_index: dict[str, int] | None = None,
     ):
         """
         Args:
@@ -345,6 +528,7 @@ class AbstractVariant:
             samples (list):
             as_singletons (bool):
             new_genes (dict):
+            sample_index (dict): shared {sample: column} table, built if absent
         """
 
         # extract the coordinates into a separate object
@@ -352,11 +536,17 @@ class AbstractVariant:
             var.CHROM.replace('chr', ''), var.POS, var.REF, var.ALT[0]
         )
 
+        # a sparse source holds only the non-ref calls, use those directly
+        sparse = getattr(var, 'sparse_carriers', None)
+
         # get all zygosities once per variant
         # abstraction avoids pulling per-sample calls again later
-        self.het_samples, self.hom_samples = get_non_ref_samples(
-            variant=var, samples=samples
-        )
+        if sparse is None:
+            self.het_samples, self.hom_samples = get_non_ref_samples(
+                variant=var, samples=samples
+            )
+        else:
+            self.het_samples, self.hom_samples = sparse.non_ref_samples(samples)
 
         # overwrite the non-standard cyvcf2 representation
         self.info: dict[str, Any] = {x.lower(): y for x, y in var.INFO}
@@ -409,24 +599,49 @@ class AbstractVariant:
                     else []
                 )
 
-        self.transcript_consequences: list[dict[str, str]] = []
-        if 'csq' in self.info:
-            self.transcript_consequences = extract_csq(
-                csq_contents=self.info.pop('csq')
-            )
+        # hold the raw CSQ string, only parsed if transcript consequences are read
+        self._csq_contents: str | None = self.info.pop('csq', None)
+        self._transcript_consequences: TranscriptConsequences | list | None = None
 
         # identify variant sets phased with this one
         # cyvcf2 uses a default value for the phase set, skip that
         # this is restricted to a single int for phase_set
-        try:
-            self.phased = get_phase_data(samples, var)
-        except KeyError:
-            self.phased = {} 
-
-        self.ab_ratios = dict(zip(samples, map(float, var.gt_alt_freqs)))
-        self.depths = dict(zip(samples, map(float, var.gt_depths)))
+        if sparse is not None:
+            self.phased = sparse.phase_data(samples)
+        else:
+            try:
+                self.phased = get_phase_data(samples, var)
+            except KeyError:
+                self.phased = {}
+
+        # only retain AB & DP for the non-ref carriers
+        if sample_index is None:
+            sample_index = get_sample_index(samples)
+        if sparse is not None:
+            self.ab_ratios = CarrierValues.from_carriers(
+                sparse.ab, sparse.indices, sample_index
+            )
+            self.depths = CarrierValues.from_carriers(
+                sparse.dp, sparse.indices, sample_index
+            )
+        else:
+            genotypes = np.asarray(var.gt_types)
+            carriers = np.flatnonzero((genotypes == HETALT) | (genotypes == HOMALT))
+            self.ab_ratios = CarrierValues(var.gt_alt_freqs, carriers, sample_index)
+            self.depths = CarrierValues(var.gt_depths, carriers, sample_index)
         self.categories = []
 
+    @property
+    def transcript_consequences(self) -> TranscriptConsequences | list:
+        """
+        per-transcript consequences, parsed from the CSQ string on first access
+        only variants which are reported ever pay for this parse
+        """
+        if self._transcript_consequences is None:
+            self._transcript_consequences = extract_csq(csq_contents=self._csq_contents)
+            self._csq_contents = None
+        return self._transcript_consequences
+
     def organise_pm5(self):
         """
         method dedicated to handling the new pm5 annotations
@@ -747,21 +962,89 @@ def canonical_contigs_from_vcf(reader) -> set[str]:
     }
 
 
+def read_blacklist() -> set[str]:
+    """
+    read the variant blacklist named in config, if any
+    intended to be called once per run, not once per contig
+
+    Returns:
+        a set of variant strings (chr-pos-ref-alt) to skip
+    """
+    if 'blacklist' in get_config()['filter'].keys():
+        return set(read_json_from_path(get_config()['filter']['blacklist'], []))
+    return set()
+
+
+def get_category_fields(reader) -> list[str]:
+    """
+    find all the category INFO fields declared in the VCF header
+
+    Args:
+        reader (cyvcf2.VCFReader):
+
+    Returns:
+        the INFO IDs, as written in the header
+    """
+    return [
+        header['ID']
+        for header in reader.header_iter()
+        if header['HeaderType'] == 'INFO'
+        and header['ID'].lower().startswith('category')
+    ]
+
+
+def record_has_categories(
+    variant, category_fields: list[str], singletons: bool = False
+) -> bool:
+    """
+    cheap check of the raw cyvcf2 record, prior to building an AbstractVariant
+    reads only the category INFO fields, and never touches per-sample data
+
+    this is permissive - False means the variant can't be classified, but
+    True may still be rejected by the full AbstractVariant.is_classified
+
+    Args:
+        variant (cyvcf2.Variant):
+        category_fields (list[str]): category INFO IDs from the header
+        singletons (bool): if True, ignore categories removed in singletons
+
+    Returns:
+        True if any category could be assigned to this variant
+    """
+    for category in category_fields:
+        value = variant.INFO.get(category)
+        if value is None:
+            continue
+        name = category.lower()
+        if name.startswith(('categoryboolean', 'categorysupport')):
+            if value == 1:
+                return True
+        elif name.startswith(('categorysample', 'categorydetails')):
+            if value != 'missing' and not (singletons and name in REMOVE_IN_SINGLETONS):
+                return True
+    return False
+
+
 def gather_gene_dict_from_contig(
     contig: str,
     variant_source,
     new_gene_map: dict[str, str],
     singletons: bool = False,
+    blacklist: set[str] | None = None,
 ) -> GeneDict:
     """
     takes a cyvcf2.VCFReader instance, and a specified chromosome
     iterates over all variants in the region, and builds a lookup
 
+    Blacklisted and uncategorised records are dropped using only
+    the coordinates and INFO fields, before any per-sample work
+
     Args:
         contig (): contig name from VCF header
         variant_source (): the VCF reader instance
         new_gene_map ():
         singletons ():
+        blacklist (set): variant strings to skip, read from config if absent
 
     Returns:
         A lookup in the form
@@ -772,31 +1055,42 @@ def gather_gene_dict_from_contig(
         }
     """
 
-    blacklist = []
-    if 'blacklist' in get_config()['filter'].keys():
-        blacklist = read_json_from_path(get_config()['filter']['blacklist'])
+    if blacklist is None:
+        blacklist = read_blacklist()
+
+    category_fields = get_category_fields(variant_source)
 
     # a dict to allow lookup of variants on this whole chromosome
     contig_variants = 0
     contig_dict = defaultdict(list)
 
+    # one sample-index table shared by every variant on this contig
+    sample_index = get_sample_index(variant_source.samples)
+
     # iterate over all variants on this contig and store by unique key
     # if contig has no variants, prints an error and returns []
     for variant in variant_source(contig):
 
+        var_string = (
+            f'{variant.CHROM.replace("chr", "")}-{variant.POS}-'
+            f'{variant.REF}-{variant.ALT[0]}'
+        )
+        if var_string in blacklist:
+            logging.info(f'Skipping blacklisted variant: {var_string}')
+            continue
+
+        # if it can't be classified, skip before any per-sample work
+        if not record_has_categories(variant, category_fields, singletons):
+            continue
+
         abs_var = AbstractVariant(
             var=variant,
             samples=variant_source.samples,
             as_singletons=singletons,
             new_genes=new_gene_map,
+            sample_index=sample_index,
         )
 
-        if abs_var.coords.string_format in blacklist:
-            logging.info(
-                f'Skipping blacklisted variant: {abs_var.coords.string_format}'
-            )
-            continue
-
         # if unclassified, skip the whole variant
         if not abs_var.is_classified:
             continue
@@ -908,23 +1202,15 @@ def get_non_ref_samples(variant, samples: list[str]) -> tuple[set[str], set[str]
     Returns:
         2 sets of strings; het and hom
     """
-    het_samples = set()
-    hom_samples = set()
-
-    # this iteration is based on the cyvcf2 representations
-    for sam, genotype_int in zip(samples, variant.gt_types):
-
-        if genotype_int in BAD_GENOTYPES:
-            continue
-        if genotype_int == 1:
-            het_samples.add(sam)
-        if genotype_int == 3:
-            hom_samples.add(sam)
+    # mask the genotype array, only touch the sample IDs of carriers
+    genotypes = np.asarray(variant.gt_types)
+    het_samples = {samples[index] for index in np.flatnonzero(genotypes == HETALT)}
+    hom_samples = {samples[index] for index in np.flatnonzero(genotypes == HOMALT)}
 
     return het_samples, hom_samples
 
 
-def extract_csq(csq_contents) -> list[dict]:
+def extract_csq(csq_contents) -> TranscriptConsequences | list:
     """
     handle extraction of the CSQ entries based on string in config
 
@@ -936,14 +1222,14 @@ def extract_csq(csq_contents) -> list[dict]:
     if not csq_contents:
         return []
 
-    # break mono-CSQ-string into components
-    csq_categories = get_config()['csq']['csq_string']
+    # already columnar, e.g. read from the labelled Hail Table
+    if isinstance(csq_contents, TranscriptConsequences):
+        return csq_contents
 
-    # iterate over all consequences, and make each into a dict
-    return [
-        dict(zip(csq_categories, each_csq.split('|')))
-        for each_csq in csq_contents.split(',')
-    ]
+    # break mono-CSQ-string into columns
+    return TranscriptConsequences(
+        csq_contents=csq_contents, csq_fields=get_config()['csq']['csq_string']
+    )
 
 
 class CustomEncoder(json.JSONEncoder):
@@ -965,11 +1251,71 @@ class CustomEncoder(json.JSONEncoder):
 
         if is_dataclass(o) or isinstance(o, MinimalVariant):
             return o.__dict__
-        if isinstance(o, set):
+        if isinstance(o, (set, TranscriptConsequences)):
             return list(o)
         return json.JSONEncoder.default(self, o)
 
 
+def orjson_default(o):
+    """
+    orjson handles dataclasses natively, this covers everything else
+    CustomEncoder would otherwise have been called for
+
+    Args:
+        o (): python object being JSON encoded
+    """
+    if isinstance(o, MinimalVariant):
+        return o.__dict__
+    if isinstance(o, (set, TranscriptConsequences)):
+        return list(o)
+    raise TypeError(f'Type is not JSON serializable: {type(o).__name__}')
+
+
+def write_results_json(
+    output_path: str | Path,
+    results: dict,
+    metadata: dict,
+    indent: int | None = None,
+    use_orjson: bool = False,
+):
+    """
+    streams the results file to output, one sample at a time
+    each sample is removed from the results dict once it has been written,
+    so the whole report is never held in memory alongside its encoding
+
+    Args:
+        output_path (): file to write to, local or cloud
+        results (dict): per-sample results, emptied as it is written
+        metadata (dict): the run metadata, written after the results
+        indent (int): optional indentation, compact by default
+        use_orjson (bool): use orjson if installed, falling back to json
+    """
+
+    if use_orjson and orjson is None:
+        logging.warning('orjson is not installed, falling back to json')
+        use_orjson = False
+
+    if use_orjson:
+        options = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+
+        def encode(content) -> str:
+            return orjson.dumps(
+                content, default=orjson_default, option=options
+            ).decode()
+
+    else:
+        encode = CustomEncoder(indent=indent).encode
+
+    logging.info(f'Writing results JSON file to {output_path}')
+    with to_path(output_path).open('w') as handle:
+        handle.write('{"results": {')
+        for index, sample in enumerate(list(results)):
+            if index:
+                handle.write(', ')
+            handle.write(f'{json.dumps(sample)}: {encode(results.pop(sample))}')
+        handle.write(f'}}, "metadata": {encode(metadata)}}}')
+
+
 def find_comp_hets(var_list: list[AbstractVariant], pedigree) -> CompHetDict:
     """
     manual implementation to find compound hets
@@ -992,43 +1338,44 @@ def find_comp_hets(var_list: list[AbstractVariant], pedigree) -> CompHetDict:
     # create an empty dictionary
     comp_het_results = defaultdict(dict)
 
-    # use combinations_with_replacement to find all gene pairs
-    for var_1, var_2 in combinations_with_replacement(var_list, 2):
-        assert var_1.coords.chrom == var_2.coords.chrom
+    # all variants in a gene share a contig, sex & mito are never assessed
+    if not var_list or var_list[0].coords.chrom in NON_HOM_CHROM:
+        return comp_het_results
+    chrom = var_list[0].coords.chrom
+
+    # inverted index of sample: [het variants within this gene]
+    # phase data for each call is reduced to a set of (phase_set, GT) once
+    sample_hets = defaultdict(list)
+    for variant in var_list:
+        assert variant.coords.chrom == chrom
+        for sample in variant.het_samples:
+            sample_hets[sample].append(
+                (variant, set(variant.phased.get(sample, {}).items()))
+            )
 
-        if (var_1.coords == var_2.coords) or var_1.coords.chrom in NON_HOM_CHROM:
+    # only pair up variants within each sample's own het calls
+    for sample, het_variants in sample_hets.items():
+        if len(het_variants) < 2:
             continue
 
-        # iterate over any samples with a het overlap
-        for sample in var_1.het_samples.intersection(var_2.het_samples):
-            phased = False
-            ped_sample = pedigree.get(sample)
+        # don't assess male compound hets on sex chromosomes
+        if pedigree.get(sample).sex == 'male' and chrom in X_CHROMOSOME:
+            continue
 
-            # don't assess male compound hets on sex chromosomes
-            if ped_sample.sex == 'male' and var_1.coords.chrom in X_CHROMOSOME:
+        for (var_1, phase_1), (var_2, phase_2) in combinations(het_variants, 2):
+            if var_1.coords == var_2.coords:
                 continue
 
-            # check for both variants being in the same phase set
-            if sample in var_1.phased and sample in var_2.phased:
+            # both variants share a phase set, with the same phased genotype
+            if phase_1 & phase_2:
+                continue
 
-                # check for presence of the same phase set
-                for phase_set in [
-                    ps
-                    for ps in var_1.phased[sample].keys()
-                    if ps in var_2.phased[sample].keys()
-                ]:
-                    if (
-                        var_1.phased[sample][phase_set]
-                        == var_2.phased[sample][phase_set]
-                    ):
-                        phased = True
-            if not phased:
-                comp_het_results[sample].setdefault(
-                    var_1.coords.string_format, []
-                ).append(var_2)
-                comp_het_results[sample].setdefault(
-                    var_2.coords.string_format, []
-                ).append(var_1)
+            comp_het_results[sample].setdefault(var_1.coords.string_format, []).append(
+                var_2
+            )
+            comp_het_results[sample].setdefault(var_2.coords.string_format, []).append(
+                var_1
+            )
 
     return comp_het_results
 
@@ -14,21 +14,26 @@ for each variant in each participant, check MOI in affected
 participants relative to the MOI described in PanelApp
 """
 
-import json
+import gzip
 import logging
+import os
+import struct
 import sys
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from itertools import chain
 from typing import Union
 
 import click
+import hail as hl
 from cyvcf2 import VCFReader
 from peddy.peddy import Ped
 
 from cpg_utils import to_path
 from cpg_utils.config import get_config
 
-from reanalysis.moi_tests import MOIRunner, PEDDY_AFFECTED
+from reanalysis.moi_tests import FamilyIndex, MOIRunner, PEDDY_AFFECTED
 from reanalysis.utils import (
     canonical_contigs_from_vcf,
     get_cohort_config,
@@ -36,15 +41,308 @@ from reanalysis.utils import (
     find_comp_hets,
     gather_gene_dict_from_contig,
     get_new_gene_map,
+    read_blacklist,
     read_json_from_path,
-    CustomEncoder,
+    write_results_json,
+    Coordinates,
     GeneDict,
     ReportedVariant,
+    SparseCarriers,
+    TranscriptConsequences,
+    PHASE_SET_DEFAULT,
 )
 
 AMBIGUOUS_FLAG = 'Ambiguous Cat.1 MOI'
 MALE_FEMALE = {'male', 'female'}
 
+# per-process state for contig workers, populated once by the pool initializer
+_WORKER_STATE: dict = {}
+
+
+# tabix binning scheme: the first bin ID on each level, from 512Mbp to 16kbp
+TABIX_LEVEL_OFFSETS = (0, 1, 9, 73, 585, 4681)
+TABIX_PSEUDO_BIN = 37450
+
+
+def tabix_contig_bounds(index_path: str) -> dict[str, tuple[int, int]]:
+    """
+    read the span of each contig present in a tabix index, without opening
+    the VCF. Each record is binned in the smallest bin containing it, so the
+    bins present give a span (0-based, half-open) containing every record
+
+    Args:
+        index_path (str): path to a .tbi file
+
+    Returns:
+        {contig: (start, end)} for every contig with records in the file
+    """
+    with gzip.open(index_path, 'rb') as handle:
+        data = handle.read()
+
+    if data[:4] != b'TBI\x01':
+        raise ValueError(f'{index_path} is not a tabix index')
+
+    n_ref = struct.unpack_from('<i', data, 4)[0]
+    name_length = struct.unpack_from('<i', data, 32)[0]
+    names = data[36 : 36 + name_length].split(b'\x00')[:n_ref]
+    offset = 36 + name_length
+
+    bounds = {}
+    for name in names:
+        (n_bin,) = struct.unpack_from('<i', data, offset)
+        offset += 4
+        start, end = None, None
+        for _ in range(n_bin):
+            bin_id, n_chunk = struct.unpack_from('<Ii', data, offset)
+            offset += 8 + 16 * n_chunk
+            if bin_id == TABIX_PSEUDO_BIN:
+                continue
+            level = max(
+                level
+                for level, first_bin in enumerate(TABIX_LEVEL_OFFSETS)
+                if bin_id >= first_bin
+            )
+            size = 1 << (29 - 3 * level)
+            bin_start = (bin_id - TABIX_LEVEL_OFFSETS[level]) * size
+            start = bin_start if start is None else min(start, bin_start)
+            end = bin_start + size if end is None else max(end, bin_start + size)
+        (n_intv,) = struct.unpack_from('<i', data, offset)
+        offset += 4 + 8 * n_intv
+        if start is not None:
+            bounds[name.decode()] = (start, end)
+    return bounds
+
+
+class ShardedVCFReader:
+    """
+    a read-only view across a directory of VCF shards, as written by
+    hl.export_vcf(parallel='header_per_shard'), in the order given by the
+    shard manifest. Provides the parts of the cyvcf2.VCFReader API used here:
+    samples, header_iter, and region queries chained across all shards
+
+    the span of each contig in each shard is read once from the tabix
+    indices; a shard is only opened when it overlaps a queried region,
+    and is closed again once the query is consumed
+    """
+
+    def __init__(self, shard_dir: str):
+        """
+        Args:
+            shard_dir (str): directory containing the shards and their manifest
+        """
+        with open(
+            os.path.join(shard_dir, 'shard-manifest.txt'), encoding='utf-8'
+        ) as handle:
+            shard_names = [line.strip() for line in handle if line.strip()]
+
+        if not shard_names:
+            raise ValueError(f'No VCF shards listed in {shard_dir}')
+
+        self.shards = [
+            os.path.join(shard_dir, shard_name) for shard_name in shard_names
+        ]
+        self.bounds = [tabix_contig_bounds(f'{shard}.tbi') for shard in self.shards]
+
+        # header records are copied out, as they don't outlive their reader
+        first_shard = VCFReader(self.shards[0])
+        self.samples = first_shard.samples
+        self.header = [record.info() for record in first_shard.header_iter()]
+        first_shard.close()
+
+    def header_iter(self):
+        """
+        the header is identical in every shard
+        """
+        return iter(self.header)
+
+    @staticmethod
+    def read_shard(shard: str, region: str | None = None):
+        """
+        open one shard for a single pass, closing it once consumed
+        """
+        reader = VCFReader(shard)
+        try:
+            yield from reader(region) if region else reader
+        finally:
+            reader.close()
+
+    def overlapping_shards(self, region: str) -> list[str]:
+        """
+        the shards with any records in a region, either `contig` or
+        `contig:start-end` (1-based, inclusive)
+        """
+        contig, _, span = region.partition(':')
+        start, end = 1, sys.maxsize
+        if span:
+            start_string, _, end_string = span.replace(',', '').partition('-')
+            start = int(start_string)
+            end = int(end_string) if end_string else sys.maxsize
+
+        return [
+            shard
+            for shard, bounds in zip(self.shards, self.bounds)
+            if contig in bounds
+            and bounds[contig][0] < end
+            and bounds[contig][1] >= start
+        ]
+
+    def __call__(self, region: str):
+        """
+        query the region across every shard which overlaps it
+        """
+        return chain.from_iterable(
+            self.read_shard(shard, region) for shard in self.overlapping_shards(region)
+        )
+
+    def __iter__(self):
+        return chain.from_iterable(self.read_shard(shard) for shard in self.shards)
+
+
+class LabelledTableInfo:
+    """
+    the INFO fields of one labelled Hail Table row, iterated as
+    (key, value) pairs like cyvcf2's INFO. Missing values are skipped,
+    as they would be absent from an exported VCF
+    """
+
+    __slots__ = ('fields',)
+
+    def __init__(self, info, transcripts: TranscriptConsequences):
+        """
+        Args:
+            info (hl.Struct): the info struct from the Table row
+            transcripts (TranscriptConsequences): stands in for the CSQ string
+        """
+        self.fields = {key: value for key, value in info.items() if value is not None}
+        self.fields['CSQ'] = transcripts
+
+    def get(self, key: str, default=None):
+        return self.fields.get(key, default)
+
+    def __iter__(self):
+        return iter(self.fields.items())
+
+
+class LabelledTableRecord:
+    """
+    one row of the labelled Hail Table, presented through the parts of the
+    cyvcf2.Variant API read by AbstractVariant. Only non-ref calls are held
+    in the Table, these are passed on as SparseCarriers - no per-sample
+    arrays are built, and samples without a call are simply absent
+    """
+
+    __slots__ = ('CHROM', 'POS', 'REF', 'ALT', 'INFO', 'sparse_carriers')
+
+    def __init__(self, row, csq_fields: list[str]):
+        """
+        Args:
+            row (hl.Struct): one collected row of the labelled Table
+            csq_fields (list[str]): ordered names of the transcript fields
+        """
+        self.CHROM = row.locus.contig
+        self.POS = row.locus.position
+        self.REF = row.alleles[0]
+        self.ALT = row.alleles[1:]
+        self.INFO = LabelledTableInfo(
+            row.info,
+            TranscriptConsequences.from_transcripts(row.transcripts, csq_fields),
+        )
+
+        carriers = sorted(row.carriers, key=lambda carrier: carrier.sample_index)
+        phased = {}
+        for carrier in carriers:
+            phase_set = carrier.get('PS')
+            if (
+                carrier.GT.phased
+                and phase_set is not None
+                and phase_set != PHASE_SET_DEFAULT
+            ):
+                phased[carrier.sample_index] = (
+                    phase_set,
+                    '|'.join(map(str, carrier.GT.alleles)),
+                )
+
+        self.sparse_carriers = SparseCarriers(
+            indices=[carrier.sample_index for carrier in carriers],
+            hom=[carrier.GT.is_hom_var() for carrier in carriers],
+            ab=[-1.0 if carrier.AB is None else carrier.AB for carrier in carriers],
+            dp=[-1 if carrier.DP is None else carrier.DP for carrier in carriers],
+            phased=phased,
+        )
+
+
+class LabelledTableReader:
+    """
+    reads the labelled Hail Table, written as an alternative to the VCF
+    Rows are collected one contig at a time, as each contig is queried.
+    Provides the parts of the cyvcf2.VCFReader API used here
+    """
+
+    def __init__(self, table_path: str):
+        """
+        Args:
+            table_path (str): path to the labelled Hail Table
+        """
+        self.table = hl.read_table(table_path)
+        self.samples = hl.eval(self.table.samples)
+        self.category_fields = [
+            field
+            for field in self.table.info.dtype
+            if field.lower().startswith('category')
+        ]
+        self.csq_fields = list(self.table.transcripts.dtype.element_type)
+
+        # the contigs with any rows, in reference order
+        present = self.table.aggregate(hl.agg.collect_as_set(self.table.locus.contig))
+        self.contigs = [
+            contig
+            for contig in self.table.locus.dtype.reference_genome.contigs
+            if contig in present
+        ]
+
+    def header_iter(self):
+        """
+        the contigs present, and the category INFO fields
+        """
+        for contig in self.contigs:
+            yield {'HeaderType': 'CONTIG', 'ID': contig}
+        for field in self.category_fields:
+            yield {'HeaderType': 'INFO', 'ID': field}
+
+    def __call__(self, region: str):
+        """
+        only whole-contig queries are supported
+        """
+        if region not in self.contigs:
+            return
+        rows = self.table.filter(self.table.locus.contig == region).collect()
+        for row in rows:
+            yield LabelledTableRecord(row, self.csq_fields)
+
+    def __iter__(self):
+        return chain.from_iterable(self(contig) for contig in self.contigs)
+
+
+def open_labelled_vcf(
+    labelled_vcf: str,
+) -> VCFReader | ShardedVCFReader | LabelledTableReader:
+    """
+    open the Hail-labelled variants, either as a single VCF, as
+    a directory of per-partition VCF shards, or as a Hail Table
+
+    Args:
+        labelled_vcf (str): path to the VCF, the directory of shards, or Table
+
+    Returns:
+        a reader supporting region queries
+    """
+    if os.path.isdir(labelled_vcf):
+        # a Hail Table directory holds its own metadata, shards a manifest
+        if os.path.exists(os.path.join(labelled_vcf, 'metadata.json.gz')):
+            return LabelledTableReader(labelled_vcf)
+        return ShardedVCFReader(labelled_vcf)
+    return VCFReader(labelled_vcf)
+
 
 def set_up_moi_filters(
     panelapp_data: dict,
@@ -81,6 +379,9 @@ def set_up_moi_filters(
 
     moi_dictionary = {}
 
+    # index the pedigree once, all runners share the same lookups
+    family_index = FamilyIndex(pedigree)
+
     # iterate over all genes
     for gene_data in panelapp_data['genes'].values():
 
@@ -90,7 +391,9 @@ def set_up_moi_filters(
         # if we haven't seen this MOI before, set up the appropriate filter
         if gene_moi not in moi_dictionary:
             # get a MOIRunner with the relevant filters
-            moi_dictionary[gene_moi] = MOIRunner(pedigree=pedigree, target_moi=gene_moi)
+            moi_dictionary[gene_moi] = MOIRunner(
+                pedigree=pedigree, target_moi=gene_moi, family_index=family_index
+            )
 
     return moi_dictionary
 
@@ -127,24 +430,18 @@ def apply_moi_to_variants(
             logging.error(f'How did this gene creep in? {gene}')
             continue
 
-        for variant in variants:
-
-            # is this even possible?
-            if not (variant.het_samples or variant.hom_samples):
-                continue
+        # this gene's variants are candidates for MOI checks
+        # - use MOI to get appropriate model
+        # - run all variants together, collect classification(s) per variant
+        # - always run partially penetrant analysis for Category 1 (clinvar)
+        # pass on whether this variant is support only
+        # - no dominant MOI
+        # - discarded if two support-only form a comp-het
+        gene_results = moi_lookup[panel_gene_data.get('moi')].run_gene(
+            variants=variants, comp_het=comp_het_dict
+        )
 
-            # this variant is a candidate for MOI checks
-            # - use MOI to get appropriate model
-            # - run variant, append relevant classification(s) to the results
-            # - always run partially penetrant analysis for Category 1 (clinvar)
-            # pass on whether this variant is support only
-            # - no dominant MOI
-            # - discarded if two support-only form a comp-het
-            variant_results = moi_lookup[panel_gene_data.get('moi')].run(
-                principal_var=variant,
-                comp_het=comp_het_dict,
-                partial_pen=variant.info.get('categoryboolean1', False),
-            )
+        for variant, variant_results in zip(variants, gene_results):
 
             # Flag! If this is a Category 1 (ClinVar) variant, and we are
             # interpreting under a lenient MOI, add flag for analysts
@@ -168,6 +465,98 @@ def apply_moi_to_variants(
     return results
 
 
+def analyse_contig(
+    contig: str,
+    variant_source,
+    moi_lookup: dict[str, MOIRunner],
+    panelapp_data: dict,
+    pedigree: Ped,
+    new_gene_map: dict[str, str],
+    singletons: bool = False,
+    blacklist: set[str] | None = None,
+) -> list[ReportedVariant]:
+    """
+    gather all the variants on one contig, and apply the MOI tests
+
+    Args:
+        contig (str): contig name from VCF header
+        variant_source (cyvcf2.VCFReader): the VCF reader instance
+        moi_lookup (dict): the MOI model runner per MOI string
+        panelapp_data (dict): all panelapp data, inc. metadata
+        pedigree (Ped): the pedigree for this cohort
+        new_gene_map (dict): genes which are new, and for whom
+        singletons (bool): whether this is a singleton analysis
+        blacklist (set): variant strings to skip
+
+    Returns:
+        all the ReportedVariant events on this contig
+    """
+
+    # assemble {gene: [var1, var2, ..]}
+    contig_dict = gather_gene_dict_from_contig(
+        contig=contig,
+        variant_source=variant_source,
+        new_gene_map=new_gene_map,
+        singletons=singletons,
+        blacklist=blacklist,
+    )
+
+    return apply_moi_to_variants(
+        variant_dict=contig_dict,
+        moi_lookup=moi_lookup,
+        panelapp_data=panelapp_data['genes'],
+        pedigree=pedigree,
+    )
+
+
+def init_contig_worker(
+    labelled_vcf: str,
+    pedigree: str,
+    panelapp_data: dict,
+    new_gene_map: dict[str, str],
+    singletons: bool,
+    blacklist: set[str] | None = None,
+):
+    """
+    pool initializer - runs once in each worker process
+    each worker parses its own pedigree, builds its own MOI runners,
+    and opens its own VCF reader for region queries
+
+    Args:
+        labelled_vcf (str): path to the labelled VCF
+        pedigree (str): path to the PED file
+        panelapp_data (dict): all panelapp data, inc. metadata
+        new_gene_map (dict): genes which are new, and for whom
+        singletons (bool): whether this is a singleton analysis
+        blacklist (set): variant strings to skip
+    """
+    pedigree_digest = Ped(pedigree)
+    _WORKER_STATE.update(
+        variant_source=open_labelled_vcf(labelled_vcf),
+        moi_lookup=set_up_moi_filters(
+            panelapp_data=panelapp_data, pedigree=pedigree_digest
+        ),
+        panelapp_data=panelapp_data,
+        pedigree=pedigree_digest,
+        new_gene_map=new_gene_map,
+        singletons=singletons,
+        blacklist=blacklist,
+    )
+
+
+def analyse_contig_in_worker(contig: str) -> list[ReportedVariant]:
+    """
+    run a single contig using the state set up in this worker process
+
+    Args:
+        contig (str): contig name from VCF header
+
+    Returns:
+        all the ReportedVariant events on this contig
+    """
+    return analyse_contig(contig=contig, **_WORKER_STATE)
+
+
 def clean_and_filter(
     results_holder: dict,
     result_list: list[ReportedVariant],
@@ -211,6 +600,14 @@ def clean_and_filter(
 
     gene_details = {}
 
+    # index the retained events by (sample, Coordinates), so that
+    # duplicate events can be found without scanning the output lists
+    event_index: dict[tuple[str, Coordinates], ReportedVariant] = {
+        (sample, event.var_data.coords): event
+        for sample, content in results_holder.items()
+        for event in content['variants']
+    }
+
     for each_event in result_list:
 
         each_event.independent = each_event.is_independent
@@ -268,13 +665,13 @@ def clean_and_filter(
         # If this variant and that variant have same sample/pos, equivalent
         # If either was independent, set that flag to True
         # Add a union of all Support Variants from both events
-        if each_event not in results_holder[sample]['variants']:
+        event_key = (sample, variant.coords)
+        if event_key not in event_index:
             results_holder[sample]['variants'].append(each_event)
+            event_index[event_key] = each_event
 
         else:
-            prev_event = results_holder[sample]['variants'][
-                results_holder[sample]['variants'].index(each_event)
-            ]
+            prev_event = event_index[event_key]
 
             # if this is independent, set independent to True
             if each_event.independent:
@@ -430,7 +827,10 @@ def prepare_results_shell(
 
 
 @click.command
-@click.option('--labelled_vcf', help='Category-labelled VCF')
+@click.option(
+    '--labelled_vcf',
+    help='Category-labelled VCF, a directory of VCF shards, or a Hail Table',
+)
 @click.option('--out_json', help='Prefix to write JSON results to')
 @click.option('--panelapp', help='Path to JSON file of PanelApp data')
 @click.option('--pedigree', help='Path to joint-call PED file')
@@ -438,6 +838,25 @@ def prepare_results_shell(
     '--input_path', help='source data', default='Not supplied', show_default=True
 )
 @click.option('--participant_panels', help='panels per participant', default=None)
+@click.option(
+    '--workers',
+    help='number of processes to fan contigs out across',
+    default=1,
+    type=int,
+    show_default=True,
+)
+@click.option(
+    '--indent',
+    help='indent the results JSON, compact if not set',
+    default=None,
+    type=int,
+)
+@click.option(
+    '--use_orjson',
+    help='write the results JSON using orjson, if installed',
+    is_flag=True,
+    default=False,
+)
 def main(
     labelled_vcf: str,
     out_json: str,
@@ -445,6 +864,9 @@ def main(
     pedigree: str,
     input_path: str,
     participant_panels: str | None = None,
+    workers: int = 1,
+    indent: int | None = None,
+    use_orjson: bool = False,
 ):
     """
     VCFs used here should be small
@@ -454,12 +876,15 @@ def main(
     We expect approximately linear scaling with participants in the joint call
 
     Args:
-        labelled_vcf (str): VCF output from Hail Labelling stage
+        labelled_vcf (str): VCF (shard directory, or Table) from Hail Labelling stage
         out_json (str): location to write output file
         panelapp (str): location of PanelApp data JSON
         pedigree (str): location of PED file
         input_path (str): VCF/MT used as input
         participant_panels (str): json of panels per participant
+        workers (int): number of processes to run contigs in, 1 = serial
+        indent (int): optional indentation for the results JSON
+        use_orjson (bool): use orjson as a faster JSON writer
     """
 
     out_json = to_path(out_json)
@@ -475,34 +900,61 @@ def main(
         panelapp_data=panelapp_data, pedigree=pedigree_digest
     )
 
-    # open the VCF using a cyvcf2 reader
-    vcf_opened = VCFReader(labelled_vcf)
+    # open the VCF (or VCF shards) using cyvcf2 reader(s), or read the Table
+    vcf_opened = open_labelled_vcf(labelled_vcf)
 
     participant_panels = read_json_from_path(participant_panels)
 
     # create the new gene map
     new_gene_map = get_new_gene_map(panelapp_data, participant_panels)
 
+    singletons = bool('singleton' in pedigree)
+
+    # read the variant blacklist once for the whole run
+    blacklist = read_blacklist()
+
     result_list = []
 
     # obtain a set of all contigs with variants
-    for contig in canonical_contigs_from_vcf(vcf_opened):
-        # assemble {gene: [var1, var2, ..]}
-        contig_dict = gather_gene_dict_from_contig(
-            contig=contig,
-            variant_source=vcf_opened,
-            new_gene_map=new_gene_map,
-            singletons=bool('singleton' in pedigree),
-        )
-
-        result_list.extend(
-            apply_moi_to_variants(
-                variant_dict=contig_dict,
-                moi_lookup=moi_lookup,
-                panelapp_data=panelapp_data['genes'],
-                pedigree=pedigree_digest,
+    contigs = canonical_contigs_from_vcf(vcf_opened)
+
+    # Table contigs are queried through this process' Hail session, not per worker
+    if workers > 1 and isinstance(vcf_opened, LabelledTableReader):
+        logging.info('Labelled Hail Table input, processing contigs serially')
+        workers = 1
+
+    if workers > 1:
+        # contigs are independent, fan them out across a process pool
+        logging.info(f'Processing {len(contigs)} contigs using {workers} workers')
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_contig_worker,
+            initargs=(
+                labelled_vcf,
+                pedigree,
+                panelapp_data,
+                new_gene_map,
+                singletons,
+                blacklist,
+            ),
+        ) as executor:
+            for contig_results in executor.map(analyse_contig_in_worker, contigs):
+                result_list.extend(contig_results)
+
+    else:
+        for contig in contigs:
+            result_list.extend(
+                analyse_contig(
+                    contig=contig,
+                    variant_source=vcf_opened,
+                    moi_lookup=moi_lookup,
+                    panelapp_data=panelapp_data,
+                    pedigree=pedigree_digest,
+                    new_gene_map=new_gene_map,
+                    singletons=singletons,
+                    blacklist=blacklist,
+                )
             )
-        )
 
     # create a shell to store results in
     results_shell = prepare_results_shell(
@@ -521,31 +973,29 @@ def main(
     )
 
     # annotate previously seen results using cumulative data file(s)
-    analysis_results = filter_results(
-        analysis_results, singletons=bool('singleton' in pedigree)
-    )
-
-    # create the full final output file
-    final_results = {
-        'results': analysis_results,
-        'metadata': {
-            'input_file': input_path,
-            'cohort': get_config()['workflow']['dataset'],
-            'run_datetime': get_config()['workflow'].get(
-                'fake_date', f'{datetime.now():%Y-%m-%d %H:%M}'
-            ),
-            'family_breakdown': count_families(
-                pedigree_digest, samples=vcf_opened.samples
-            ),
-            'panels': panelapp_data['metadata'],
-            'container': get_config()['workflow']['driver_image'],
-            'categories': get_config()['categories'],
-        },
+    analysis_results = filter_results(analysis_results, singletons=singletons)
+
+    # create the run metadata, written after all sample results
+    metadata = {
+        'input_file': input_path,
+        'cohort': get_config()['workflow']['dataset'],
+        'run_datetime': get_config()['workflow'].get(
+            'fake_date', f'{datetime.now():%Y-%m-%d %H:%M}'
+        ),
+        'family_breakdown': count_families(pedigree_digest, samples=vcf_opened.samples),
+        'panels': panelapp_data['metadata'],
+        'container': get_config()['workflow']['driver_image'],
+        'categories': get_config()['categories'],
     }
 
-    # store results using the custom-encoder to transform sets & DataClasses
-    with out_json.open('w') as fh:
-        json.dump(final_results, fh, cls=CustomEncoder, indent=4)
+    # stream results to file one sample at a time, transforming sets & DataClasses
+    write_results_json(
+        output_path=out_json,
+        results=analysis_results,
+        metadata=metadata,
+        indent=indent,
+        use_orjson=use_orjson,
+    )
 
 
 if __name__ == '__main__':
@@ -4,13 +4,14 @@ A home for common test fixtures
 
 from typing import Any
 import pytest
+import toml
 
 from cyvcf2 import VCFReader
 import hail as hl
 from peddy.peddy import Ped
 
 from cpg_utils import to_path
-from cpg_utils.config import set_config_paths
+from cpg_utils.config import get_config_paths, set_config_paths
 
 from reanalysis.data_model import BaseFields, Entry, TXFields, VepVariant, SneakyTable
 
@@ -66,6 +67,26 @@ def fixture_hail_cleanup():
         filename.unlink()
 
 
+@pytest.fixture(name='extra_config')
+def fixture_extra_config(tmp_path):
+    """
+    a fixture to layer extra config over the test config, within one test
+    each call adds another TOML file, the original paths are restored after
+    """
+    original_paths = list(get_config_paths())
+    extra_paths = []
+
+    def add_config(config: dict):
+        toml_path = str(tmp_path / f'extra_config_{len(extra_paths)}.toml')
+        with open(toml_path, 'w', encoding='utf-8') as handle:
+            toml.dump(config, handle)
+        extra_paths.append(toml_path)
+        set_config_paths(original_paths + extra_paths)
+
+    yield add_config
+    set_config_paths(original_paths)
+
+
 @pytest.fixture(name='make_a_mt', scope='session')
 def fixture_make_a_mt(tmp_path_factory) -> hl.MatrixTable:
     """
@@ -136,6 +157,12 @@ def fixture_peddy_ped() -> Ped:
     return Ped(str(PED_FILE))
 
 
+@pytest.fixture(name='ped_path', scope='session')
+def fixture_ped_path() -> str:
+    """path to the trio PED file"""
+    return str(PED_FILE)
+
+
 @pytest.fixture(name='phased_vcf_path')
 def fixture_phased_trio_vcf_path():
     """path to the phased trio VCF"""
@@ -3,14 +3,26 @@ tests for clinvar manual summaries
 """
 
 
+import gzip
 from copy import deepcopy
 from datetime import datetime
 
+import hail as hl
+
 from reanalysis.summarise_clinvar_entries import (
     acmg_filter_submissions,
     check_stars,
     consequence_decision,
+    dict_list_to_ht,
     get_all_decisions,
+    get_all_decisions_columnar,
+    get_allele_locus_map,
+    get_allele_locus_map_columnar,
+    main,
+    parse_submission_date,
+    read_digests,
+    sort_decisions,
+    submission_digest,
     process_line,
     ACMG_THRESHOLD,
     Consequence,
@@ -18,7 +30,7 @@ from reanalysis.summarise_clinvar_entries import (
 )
 
 
-CURRENT_TIME = datetime.now()
+CURRENT_TIME = datetime.now().toordinal()
 BASIC_SUB = Submission(CURRENT_TIME, 'submitter', Consequence.UNKNOWN, 'review')
 BENIGN_SUB = Submission(CURRENT_TIME, 'submitter', Consequence.BENIGN, 'review')
 PATH_SUB = Submission(CURRENT_TIME, 'submitter', Consequence.PATHOGENIC, 'review')
@@ -82,9 +94,9 @@ def tests_acmg_filter_neutral():
 def tests_acmg_filter_removes():
     """filter submissions against ACMG date threshold"""
     sub1 = deepcopy(BASIC_SUB)
-    sub1.date = datetime(year=1970, month=1, day=1)
+    sub1.date = datetime(year=1970, month=1, day=1).toordinal()
     sub2 = deepcopy(BASIC_SUB)
-    sub2.date = datetime(year=2000, month=1, day=1)
+    sub2.date = datetime(year=2000, month=1, day=1).toordinal()
     subs = [BASIC_SUB, sub1, sub2]
     assert acmg_filter_submissions(subs) == [BASIC_SUB]
 
@@ -92,7 +104,7 @@ def tests_acmg_filter_removes():
 def tests_acmg_filter_gte():
     """filter submissions against ACMG date threshold"""
     sub1 = deepcopy(BASIC_SUB)
-    sub1.date = ACMG_THRESHOLD
+    sub1.date = ACMG_THRESHOLD.toordinal()
     subs = [BASIC_SUB, sub1]
     assert acmg_filter_submissions(subs) == subs
 
@@ -198,7 +210,7 @@ def test_process_line():
     allele, sub = process_line(input_list)
     assert allele == 1
     assert sub.classification == Consequence.PATHOGENIC
-    assert sub.date == datetime(year=2021, month=7, day=13)
+    assert sub.date == datetime(year=2021, month=7, day=13).toordinal()
     assert sub.submitter == 'submitter'
     assert sub.review_status == '6'
 
@@ -221,7 +233,7 @@ def test_process_line_no_date():
     allele, sub = process_line(input_list)
     assert allele == 1
     assert sub.classification == Consequence.BENIGN
-    assert sub.date == datetime(year=1970, month=1, day=1)
+    assert sub.date == datetime(year=1970, month=1, day=1).toordinal()
     assert sub.submitter == 'submitter'
     assert sub.review_status == '6'
 
@@ -247,3 +259,291 @@ def test_get_all_decisions(sub_stub):
         assert each.classification == Consequence.PATHOGENIC
     for each in results[4]:
         assert each.classification == Consequence.UNCERTAIN
+
+
+def test_get_all_decisions_parallel(sub_stub):
+    """
+    parsing blocks of the file in a process pool gives the serial result
+    a tiny block size forces the file to be split across several blocks
+    """
+    allele_ids = {1, 2, 3, 4}
+    threshold = datetime(year=2018, day=1, month=1)
+    serial = get_all_decisions(
+        sub_stub, threshold_date=threshold, allele_ids=allele_ids
+    )
+    parallel = get_all_decisions(
+        sub_stub,
+        threshold_date=threshold,
+        allele_ids=allele_ids,
+        workers=2,
+        chunk_size=100,
+    )
+    assert parallel == serial
+
+
+def test_get_all_decisions_parallel_free_text(sub_stub, tmp_path):
+    """
+    control characters in free-text fields don't split a line in parallel
+    """
+    with gzip.open(sub_stub, 'rt') as handle:
+        lines = handle.read().split('\n')
+    fields = lines[1].split('\t')
+    fields[3] = 'a form\x0cfeed and\x1cseparator'
+    lines[1] = '\t'.join(fields)
+    submissions = tmp_path / 'submissions.txt.gz'
+    submissions.write_bytes(gzip.compress('\n'.join(lines).encode()))
+
+    allele_ids = {1, 2, 3, 4}
+    threshold = datetime(year=2018, day=1, month=1)
+    serial = get_all_decisions(
+        str(submissions), threshold_date=threshold, allele_ids=allele_ids
+    )
+    parallel = get_all_decisions(
+        str(submissions),
+        threshold_date=threshold,
+        allele_ids=allele_ids,
+        workers=2,
+        chunk_size=100,
+    )
+    assert parallel == serial
+
+
+def test_get_all_decisions_columnar(sub_stub):
+    """
+    the vectorised reader retains the same submissions as the line parser
+    """
+    allele_ids = {1, 2, 3, 4}
+    threshold = datetime(year=2018, day=1, month=1)
+    by_line = get_all_decisions(
+        sub_stub, threshold_date=threshold, allele_ids=allele_ids
+    )
+    columnar = get_all_decisions_columnar(
+        sub_stub, threshold_date=threshold, allele_ids=allele_ids
+    )
+    assert columnar == dict(by_line)
+    assert all(type(allele_id) is int for allele_id in columnar)
+
+
+def summary_line(allele, assembly, chrom, var_id, ref, alt, pos=100) -> str:
+    """
+    a variant_summary.txt line, with only the parsed fields populated
+    """
+    fields = ['-'] * 34
+    fields[0] = str(allele)
+    fields[16] = assembly
+    fields[18] = chrom
+    fields[30] = str(var_id)
+    fields[31] = str(pos)
+    fields[32] = ref
+    fields[33] = alt
+    return '\t'.join(fields)
+
+
+def write_summary(path, lines: list[str]):
+    """
+    write a gzipped variant_summary.txt, with a header
+    """
+    with gzip.open(path, 'wt') as handle:
+        for line in ['#AlleleID\tType'] + lines:
+            handle.write(f'{line}\n')
+
+
+def test_get_allele_locus_map_columnar(tmp_path):
+    """
+    the vectorised reader applies the same filters as the line parser
+    """
+
+    summary = tmp_path / 'variant_summary.txt.gz'
+    write_summary(
+        summary,
+        [
+            summary_line(1, 'GRCh38', '1', 11, 'A', 'G'),
+            summary_line(2, 'GRCh37', '1', 12, 'A', 'G'),
+            summary_line(3, 'GRCh38', 'chr2', 13, 'na', 'G'),
+            summary_line(4, 'GRCh38', 'MT', 14, 'A', 'G'),
+            summary_line(5, 'GRCh38', '3', 15, 'A', 'A'),
+            summary_line(6, 'GRCh38', '4', 16, 'A' * 40, 'G'),
+            summary_line(7, 'GRCh38', 'X', 17, 'A', 'R'),
+            summary_line(8, 'GRCh38', '5', 11, 'C', 'T'),
+        ],
+    )
+
+    columnar = get_allele_locus_map_columnar(str(summary))
+    assert columnar == get_allele_locus_map(str(summary))
+    assert columnar == {
+        11: {'allele': 8, 'chrom': 'chr5', 'pos': 100, 'ref': 'C', 'alt': 'T'}
+    }
+
+
+def test_process_line_shares_values():
+    """
+    repeated dates are parsed once, and submitter strings are shared
+    """
+    line = [1, 'Benign', 'Jul 13, 2021', '3', '4', '5', 'Review', '7', '8', 'Lab']
+    _allele, sub1 = process_line(list(line))
+    # distinct, equal string objects
+    _allele, sub2 = process_line([''.join(list(str(each))) for each in line])
+    assert sub1 == sub2
+    assert sub1.submitter is sub2.submitter
+    assert sub1.review_status is sub2.review_status
+    assert parse_submission_date.cache_info().hits > 0
+
+
+def test_submission_digest():
+    """
+    digests change with the submissions, their order, or the locus
+    """
+    locus = {'allele': 1, 'chrom': 'chr1', 'pos': 1, 'ref': 'A', 'alt': 'G'}
+    digest = submission_digest([PATH_SUB, BENIGN_SUB], locus)
+    assert digest == submission_digest([PATH_SUB, BENIGN_SUB], dict(locus))
+    assert digest != submission_digest([BENIGN_SUB, PATH_SUB], locus)
+    assert digest != submission_digest([PATH_SUB], locus)
+    assert digest != submission_digest([PATH_SUB, BENIGN_SUB], {**locus, 'pos': 2})
+
+
+def test_incremental_rebuild(sub_stub, tmp_path):
+    """
+    updating the previous table gives the same result as a full rebuild
+    variant 2 is removed, and variant 3 is moved
+    """
+    date = datetime(year=2030, month=1, day=1)
+    first, second = tmp_path / 'first.txt.gz', tmp_path / 'second.txt.gz'
+    write_summary(
+        first,
+        [
+            summary_line(12, 'GRCh38', '1', 2, 'A', 'G', pos=100),
+            summary_line(13, 'GRCh38', '1', 3, 'C', 'T', pos=200),
+        ],
+    )
+    write_summary(second, [summary_line(13, 'GRCh38', '1', 3, 'C', 'T', pos=300)])
+
+    previous = str(tmp_path / 'previous.ht')
+    main(subs=sub_stub, date=date, variants=str(first), out=previous)
+    assert hl.read_table(previous).count() == 2
+
+    patched = str(tmp_path / 'patched.ht')
+    main(subs=sub_stub, date=date, variants=str(second), out=patched, previous=previous)
+    rebuilt = str(tmp_path / 'rebuilt.ht')
+    main(subs=sub_stub, date=date, variants=str(second), out=rebuilt)
+
+    assert hl.read_table(patched).collect() == hl.read_table(rebuilt).collect()
+    assert [row.locus.position for row in hl.read_table(patched).collect()] == [300]
+    assert read_digests(patched) == read_digests(rebuilt)
+
+
+def test_incremental_rebuild_unchanged(sub_stub, tmp_path):
+    """
+    a rerun with the same inputs has nothing to replace, and copies the table
+    """
+    date = datetime(year=2030, month=1, day=1)
+    summary = tmp_path / 'summary.txt.gz'
+    write_summary(summary, [summary_line(12, 'GRCh38', '1', 2, 'A', 'G', pos=100)])
+
+    previous = str(tmp_path / 'previous.ht')
+    main(subs=sub_stub, date=date, variants=str(summary), out=previous)
+    patched = str(tmp_path / 'patched.ht')
+    main(
+        subs=sub_stub, date=date, variants=str(summary), out=patched, previous=previous
+    )
+
+    assert hl.read_table(patched).collect() == hl.read_table(previous).collect()
+    assert read_digests(patched) == read_digests(previous)
+
+
+def test_main_columnar(sub_stub, tmp_path):
+    """
+    the columnar readers produce the same table and digests as the line parser
+    """
+    date = datetime(year=2030, month=1, day=1)
+    summary = tmp_path / 'summary.txt.gz'
+    write_summary(
+        summary,
+        [
+            summary_line(12, 'GRCh38', '1', 2, 'A', 'G', pos=100),
+            summary_line(13, 'GRCh38', '1', 3, 'C', 'T', pos=200),
+        ],
+    )
+    by_line = str(tmp_path / 'by_line.ht')
+    main(subs=sub_stub, date=date, variants=str(summary), out=by_line)
+    columnar = str(tmp_path / 'columnar.ht')
+    main(subs=sub_stub, date=date, variants=str(summary), out=columnar, columnar=True)
+
+    assert hl.read_table(columnar).collect() == hl.read_table(by_line).collect()
+    assert read_digests(columnar) == read_digests(by_line)
+
+
+def test_digests_from_other_logic(sub_stub, tmp_path, monkeypatch):
+    """
+    digests written by a different version of the decision logic are unused
+    """
+    date = datetime(year=2030, month=1, day=1)
+    summary = tmp_path / 'summary.txt.gz'
+    write_summary(summary, [summary_line(12, 'GRCh38', '1', 2, 'A', 'G', pos=100)])
+    previous = str(tmp_path / 'previous.ht')
+    main(subs=sub_stub, date=date, variants=str(summary), out=previous)
+    assert read_digests(previous)
+
+    monkeypatch.setattr(
+        'reanalysis.summarise_clinvar_entries.decision_logic_version',
+        lambda: 'another_version',
+    )
+    assert read_digests(previous) is None
+
+
+def test_dict_list_to_ht():
+    """
+    sorted decisions are parallelized straight into a keyed table
+    """
+    decisions = sort_decisions(
+        [
+            {
+                'alleles': [ref, alt],
+                'contig': contig,
+                'position': pos,
+                'id': var_id,
+                'clinical_significance': 'Pathogenic',
+                'gold_stars': 1,
+                'allele_id': var_id + 10,
+            }
+            for var_id, contig, pos, ref, alt in [
+                (1, 'chr2', 5, 'A', 'G'),
+                (2, 'chr1', 7, 'C', 'T'),
+                (3, 'chr1', 7, 'C', 'A'),
+            ]
+        ]
+    )
+    ht = dict_list_to_ht(decisions)
+    assert list(ht.key) == ['locus', 'alleles']
+    assert [row.id for row in ht.collect()] == [3, 2, 1]
+    assert ht.collect()[0].locus == hl.Locus('chr1', 7)
+
+
+def test_dict_list_to_ht_unsorted():
+    """
+    unsorted decisions across contigs, positions & alleles are still keyed
+    into the same order as an explicit key_by
+    """
+    decisions = [
+        {
+            'alleles': [ref, alt],
+            'contig': contig,
+            'position': pos,
+            'id': var_id,
+            'clinical_significance': 'Pathogenic',
+            'gold_stars': 1,
+            'allele_id': var_id + 10,
+        }
+        for var_id, contig, pos, ref, alt in [
+            (1, 'chrX', 3, 'G', 'T'),
+            (2, 'chr10', 5, 'A', 'G'),
+            (3, 'chr2', 9, 'C', 'T'),
+            (4, 'chr2', 9, 'C', 'A'),
+            (5, 'chr1', 100, 'T', 'C'),
+            (6, 'chr2', 1, 'A', 'C'),
+        ]
+    ]
+    ht = dict_list_to_ht(decisions)
+    expected = ht.key_by().key_by('locus', 'alleles')
+    assert list(ht.key) == ['locus', 'alleles']
+    assert [row.id for row in ht.collect()] == [row.id for row in expected.collect()]
+    assert [row.id for row in ht.collect()] == [5, 6, 4, 3, 2, 1]
@@ -5,10 +5,21 @@ unit testing collection for the hail MT methods
 import pytest
 import hail as hl
 
+from cpg_utils.config import get_config
+
 from reanalysis.hail_filter_and_label import (
+    annotation_cache_path,
+    checkpoint_and_repartition,
+    log_diagnostic_count,
+    panel_gene_intervals,
+    plan_repartition,
+    subselect_mt_to_pedigree,
     filter_matrix_by_ac,
+    filter_rows_to_candidates,
     filter_on_quality_flags,
     filter_to_well_normalised,
+    vep_struct_to_csq,
+    vep_struct_to_transcripts,
 )
 
 
@@ -82,3 +93,213 @@ def test_filter_to_well_normalised(alleles, length, make_a_mt):
     anno_matrix = anno_matrix.annotate_rows(alleles=alleles)
 
     assert filter_to_well_normalised(anno_matrix).count_rows() == length
+
+
+@pytest.mark.parametrize(
+    'rows,data_bytes,current,expected',
+    [
+        (10, None, 100, (1, False)),
+        (10, 50 * 1024 * 1024, 100, (5, False)),
+        (1000000, None, 100, (5, False)),
+        (1000000, 20 * 1024 * 1024, 1, (1, False)),
+        (0, 0, 4, (1, False)),
+    ],
+)
+def test_plan_repartition(rows, data_bytes, current, expected):
+    """
+    partitions are only reduced (coalesced) without shuffle permission
+    """
+    assert (
+        plan_repartition(
+            row_count=rows, data_bytes=data_bytes, current_partitions=current
+        )
+        == expected
+    )
+
+
+def test_checkpoint_and_repartition(make_a_mt, tmp_path, extra_config):
+    """
+    unplanned stages are passed through, planned stages are written
+    and coalesced down to the planned partition count
+    """
+    assert (
+        checkpoint_and_repartition(
+            make_a_mt, checkpoint_root=str(tmp_path / 'cp'), stage='unplanned'
+        )
+        is make_a_mt
+    )
+
+    extra_config({'checkpoints': {'stages': ['planned']}})
+
+    matrix = make_a_mt.repartition(3)
+    checkpointed = checkpoint_and_repartition(
+        matrix, checkpoint_root=str(tmp_path / 'cp'), stage='planned'
+    )
+    assert (tmp_path / 'cp_planned').exists()
+    assert checkpointed.n_partitions() == 1
+    assert checkpointed.count_rows() == matrix.count_rows()
+
+
+def test_diagnostic_counts_disabled():
+    """
+    diagnostic counts are not triggered unless enabled in config
+    """
+
+    def counter():
+        raise AssertionError('count should not be triggered')
+
+    assert log_diagnostic_count('rows', counter) is None
+
+
+def test_subselect_mt_to_pedigree(make_a_mt, tmp_path):
+    """
+    full overlap returns the same MT, no overlap is a failure
+    """
+    ped_path = tmp_path / 'pedigree.ped'
+    ped_path.write_text('fam\tSAMPLE\t0\t0\t1\t2\nfam\tOTHER\t0\t0\t1\t1\n')
+    assert subselect_mt_to_pedigree(make_a_mt, str(ped_path)) is make_a_mt
+
+    ped_path.write_text('fam\tOTHER\t0\t0\t1\t1\n')
+    with pytest.raises(ValueError):
+        subselect_mt_to_pedigree(make_a_mt, str(ped_path))
+
+
+def test_panel_gene_intervals():
+    """
+    gene locations are padded, sorted by contig, and overlaps merged
+    """
+    intervals = panel_gene_intervals(
+        {
+            'ENSG3': {'location': 'X:500-600'},
+            'ENSG1': {'location': '1:12000-12100'},
+            'ENSG2': {'location': '1:12150-13000'},
+            'ENSG4': {'location': '2:10-20'},
+        },
+        padding=100,
+    )
+    assert [str(interval) for interval in intervals] == [
+        '[chr1:11900-13100]',
+        '[chr2:1-120]',
+        '[chrX:400-700]',
+    ]
+
+
+@pytest.mark.parametrize(
+    'genes',
+    [
+        {'ENSG1': {'location': '1:12000-12100'}, 'ENSG2': {'chrom': '1'}},
+        {'ENSG1': {'location': '1:'}},
+        {'ENSG1': {'location': 'HSCHR6_MHC_COX:1-100'}},
+    ],
+)
+def test_panel_gene_intervals_fallback(genes):
+    """
+    any gene without a usable location means the whole MT is read
+    """
+    assert panel_gene_intervals(genes) is None
+
+
+def test_interval_restricted_read(make_a_mt, tmp_path):
+    """
+    only rows inside the panel intervals are read
+    """
+    mt_path = str(tmp_path / 'intervals.mt')
+    make_a_mt.write(mt_path)
+
+    hit = panel_gene_intervals({'ENSG1': {'location': '1:12000-12100'}}, padding=300)
+    assert hl.read_matrix_table(mt_path, _intervals=hit).count_rows() == 1
+
+    miss = panel_gene_intervals({'ENSG1': {'location': '1:20000-20100'}})
+    assert hl.read_matrix_table(mt_path, _intervals=miss).count_rows() == 0
+
+
+@pytest.mark.parametrize(
+    'green,gnomad_af,rows',
+    [
+        ({'ensga'}, 0.0, 1),
+        ({'ensgb'}, 0.0, 0),
+        ({'ensga'}, 0.5, 0),
+    ],
+)
+def test_filter_rows_to_candidates(green, gnomad_af, rows, make_a_mt):
+    """
+    the row-only phase returns a key-only table of passing rows
+    """
+    matrix = make_a_mt.annotate_rows(
+        geneIds=hl.set(['ensga']),
+        gnomad_genomes=make_a_mt.gnomad_genomes.annotate(AF=gnomad_af),
+    )
+    keys = filter_rows_to_candidates(matrix, hl.literal(green))
+    assert list(keys.row) == ['locus', 'alleles']
+    assert keys.count() == rows
+    assert matrix.semi_join_rows(keys).count_rows() == rows
+
+
+def test_vep_struct_to_transcripts(make_a_mt):
+    """
+    the per-transcript structs hold the same values as the CSQ strings
+    """
+    matrix = make_a_mt.annotate_rows(
+        vep=hl.struct(
+            variant_class='SNV',
+            transcript_consequences=hl.array(
+                [
+                    hl.struct(
+                        consequence_terms=hl.array(['stop_gained', 'NMD']),
+                        transcript_id='tx1',
+                        protein_id='p1',
+                        gene_id='ensga',
+                        gene_symbol='GENEA',
+                        sift_prediction='deleterious',
+                        sift_score=0.01,
+                        polyphen_prediction='benign',
+                        polyphen_score=hl.missing(hl.tfloat64),
+                        mane_select='NM_1',
+                        biotype='protein_coding',
+                    )
+                ]
+            ),
+        )
+    )
+    csq, transcripts = matrix.aggregate_rows(
+        hl.agg.take(
+            (
+                vep_struct_to_csq(matrix.vep),
+                vep_struct_to_transcripts(matrix.vep),
+            ),
+            1,
+        )
+    )[0]
+    fields = get_config()['csq']['csq_string']
+    assert [csq[0].split('|')] == [
+        [transcript[field] for field in fields] for transcript in transcripts
+    ]
+    assert transcripts[0].consequence == 'stop_gained&NMD'
+    assert transcripts[0].feature == 'tx1'
+    assert transcripts[0].exon == ''
+    assert transcripts[0].variant_class == 'SNV'
+
+
+def test_annotation_cache_path(make_a_mt, tmp_path, extra_config, monkeypatch):
+    """
+    no cache unless configured, then a stable path per input, threshold,
+    and version of the annotation code
+    """
+    mt_path = str(tmp_path / 'input.mt')
+    make_a_mt.write(mt_path)
+    assert annotation_cache_path(mt_path) is None
+
+    cache_root = str(tmp_path / 'cache')
+    extra_config({'workflow': {'annotation_cache': cache_root}})
+
+    cache_path = annotation_cache_path(mt_path)
+    assert cache_path.startswith(cache_root)
+    assert cache_path.endswith('.mt')
+    assert annotation_cache_path(mt_path.rstrip('/') + '/') == cache_path
+
+    with monkeypatch.context() as patch:
+        patch.setattr(hl, '__version__', 'another_version')
+        assert annotation_cache_path(mt_path) != cache_path
+
+    extra_config({'filter': {'af_semi_rare': 0.5}})
+    assert annotation_cache_path(mt_path) != cache_path
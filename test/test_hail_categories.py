@@ -10,17 +10,22 @@ import pandas as pd
 
 from cpg_utils.config import _config_paths, get_config, set_config_paths
 
+from reanalysis.data_model import BaseFields, Entry, TXFields, VepVariant, SneakyTable
 from reanalysis.hail_filter_and_label import (
     annotate_aip_clinvar,
     annotate_category_1,
     annotate_category_2,
     annotate_category_3,
+    annotate_category_4,
     annotate_category_5,
     annotate_category_support,
+    annotate_categories,
+    annotate_codon_clinvar,
     green_and_new_from_panelapp,
     filter_to_population_rare,
     split_rows_by_gene_and_filter_to_green,
     filter_to_categorised,
+    filter_to_de_novo_candidates,
 )
 
 category_1_keys = ['locus', 'clinvar_aip_strong']
@@ -463,3 +468,191 @@ def test_annotate_aip_clinvar(
         len([x for x in returned_table.info.clinvar_aip_strong.collect() if x == 1])
         == strong
     )
+
+
+@pytest.mark.parametrize(
+    'clinvar,cadd,splice,mutationtaster,consequences,loftee,sift,polyphen,new',
+    [
+        (0, 0.0, 0.0, 'n', 'missense_variant', 'HC', 1.0, 0.0, True),
+        (1, 0.0, 0.6, 'n', 'frameshift_variant', 'lc', 1.0, 0.0, True),
+        (0, 30.0, 0.0, 'D', 'frameshift_variant', 'HC', 0.0, 1.0, False),
+        (0, 0.0, 0.0, 'D', 'stop_gained', hl.missing(hl.tstr), 0.0, 1.0, True),
+        (1, 30.0, 0.9, 'missing', 'stop_gained', 'lc', 0.0, 0.0, False),
+    ],
+)
+def test_annotate_categories_matches_individual(
+    clinvar,
+    cadd,
+    splice,
+    mutationtaster,
+    consequences,
+    loftee,
+    sift,
+    polyphen,
+    new,
+    make_a_mt,
+):
+    """
+    the fused category projection gives the same flags as the
+    individual category methods applied one after another
+    """
+    anno_matrix = make_a_mt.annotate_rows(
+        geneIds='GREEN',
+        info=make_a_mt.info.annotate(
+            clinvar_aip=clinvar,
+            clinvar_aip_strong=clinvar,
+            cadd=cadd,
+            revel=0.9,
+            splice_ai_delta=splice,
+            mutationtaster=mutationtaster,
+        ),
+        vep=hl.Struct(
+            transcript_consequences=hl.array(
+                [
+                    hl.Struct(
+                        consequence_terms=hl.set([consequences]),
+                        lof=loftee,
+                        sift_score=sift,
+                        polyphen_score=polyphen,
+                    ),
+                    hl.Struct(
+                        consequence_terms=hl.set(['synonymous_variant']),
+                        lof=hl.missing(hl.tstr),
+                        sift_score=1.0,
+                        polyphen_score=0.0,
+                    ),
+                ]
+            ),
+        ),
+    )
+    new_genes = hl.set(['GREEN']) if new else None
+
+    separate = annotate_category_1(anno_matrix)
+    separate = annotate_category_2(separate, new_genes=new_genes)
+    separate = annotate_category_3(separate)
+    separate = annotate_category_5(separate)
+    separate = annotate_category_support(separate)
+    fused = annotate_categories(anno_matrix, new_genes=new_genes)
+
+    fields = [
+        'categoryboolean1',
+        'categoryboolean2',
+        'categoryboolean3',
+        'categoryboolean5',
+        'categorysupport',
+    ]
+    assert fused.info.select(*fields).collect() == (
+        separate.info.select(*fields).collect()
+    )
+
+
+@pytest.fixture(name='trio_mt')
+def fixture_trio_mt(tmp_path) -> hl.MatrixTable:
+    """
+    a trio and an unrelated sample, across three variants
+    1. child het, both parents WT
+    2. child & both parents het
+    3. only the unrelated sample is het
+    """
+    samples = ['PROBAND1', 'MOTHER1', 'FATHER1', 'OTHER']
+    genotypes = [
+        ['0/1', '0/0', '0/0', '0/0'],
+        ['0/1', '0/1', '0/1', '0/0'],
+        ['0/0', '0/0', '0/0', '0/1'],
+    ]
+    variants = [
+        VepVariant(
+            BaseFields(f'chr1:{12345 + index}', alleles=['A', 'G']),
+            [TXFields('a', 'ensga', consequence_terms=['missense_variant'])],
+            sample_data={
+                sample: Entry(call, ad=[15, 15] if call == '0/1' else [30, 0])
+                for sample, call in zip(samples, row_calls)
+            },
+        )
+        for index, row_calls in enumerate(genotypes)
+    ]
+    sample_schema = {sample: Entry.get_schema_entry() for sample in samples}
+    mt = SneakyTable(
+        variants, sample_details=sample_schema, tmp_path=str(tmp_path)
+    ).to_hail()
+    return mt.annotate_rows(info=mt.info.annotate(categoryboolean5=0, gnomad_af=0.0))
+
+
+def test_filter_to_de_novo_candidates(trio_mt, trio_ped):
+    """
+    only trio columns, and rows where the child could be de novo, remain
+    """
+    candidates = filter_to_de_novo_candidates(trio_mt, hl.Pedigree.read(str(trio_ped)))
+    assert set(candidates.s.collect()) == {'PROBAND1', 'MOTHER1', 'FATHER1'}
+    assert [locus.position for locus in candidates.locus.collect()] == [12345]
+
+
+def test_category_4_singletons(trio_mt, tmp_path):
+    """
+    no complete trios, so the de novo search is skipped
+    """
+    ped_path = tmp_path / 'singletons.fam'
+    ped_path.write_text('FAM\tPROBAND1\t0\t0\t1\t2\n')
+    matrix = annotate_category_4(trio_mt, plink_family_file=str(ped_path))
+    assert set(matrix.info.categorysample4.collect()) == {'missing'}
+
+
+def test_category_4_trio(trio_mt, trio_ped):
+    """
+    the trio de novo is found, the inherited het is not
+    """
+    matrix = annotate_category_4(trio_mt, plink_family_file=str(trio_ped))
+    assert matrix.info.categorysample4.collect() == [
+        'PROBAND1',
+        'missing',
+        'missing',
+    ]
+
+
+@pytest.mark.parametrize(
+    'alleles,consequence,expected',
+    [
+        (['A', 'G'], 'missense_variant', '1::1+2::0+3::2'),
+        (['A', 'G'], 'stop_gained', 'missing'),
+        (['A', 'GT'], 'missense_variant', 'missing'),
+    ],
+)
+def test_annotate_codon_clinvar(
+    alleles, consequence, expected, make_a_mt, tmp_path, extra_config
+):
+    """
+    missense SNVs are annotated with all ClinVar alleles at the same residue
+    on any of their transcripts
+    """
+    codon_table = hl.Table.parallelize(
+        [
+            {'newkey': 'ENSP1::5', 'clinvar_alleles': '1::1+2::0'},
+            {'newkey': 'ENSP2::7', 'clinvar_alleles': '3::2'},
+            {'newkey': 'ENSP3::9', 'clinvar_alleles': '4::1'},
+        ],
+        hl.tstruct(newkey=hl.tstr, clinvar_alleles=hl.tstr),
+        key='newkey',
+    )
+    table_path = str(tmp_path / 'codon.ht')
+    codon_table.write(table_path)
+    extra_config({'workflow': {'clinvar_pm5': table_path}})
+
+    matrix = make_a_mt.key_rows_by('locus')
+    matrix = matrix.annotate_rows(
+        alleles=alleles,
+        vep=hl.Struct(
+            transcript_consequences=hl.array(
+                [
+                    hl.Struct(
+                        consequence_terms=hl.set([consequence]),
+                        protein_id=protein,
+                        protein_start=residue,
+                    )
+                    for protein, residue in [('ENSP1', 5), ('ENSP2', 7), ('ENSP3', 8)]
+                ]
+            )
+        ),
+    )
+    matrix = annotate_codon_clinvar(matrix)
+
+    assert matrix.info.categorydetailsPM5.collect() == [expected]
@@ -12,9 +12,11 @@ from reanalysis.moi_tests import (
     check_for_second_hit,
     BaseMoi,
     DominantAutosomal,
+    FamilyIndex,
     MOIRunner,
     RecessiveAutosomalCH,
     RecessiveAutosomalHomo,
+    VariantCarriers,
     XDominant,
     XRecessiveMale,
     XRecessiveFemaleCH,
@@ -834,3 +836,92 @@ def test_genotype_calls(peddy_ped):
         'male': 'WT',
         'mother_1': 'WT',
     }
+
+
+def test_family_index(peddy_ped):
+    """
+    the family index should mirror the peddy pedigree lookups
+    """
+    index = FamilyIndex(peddy_ped)
+    for sample in ['male', 'father_1', 'mother_1', 'female']:
+        ped_entry = peddy_ped[sample]
+        assert index.family_id(sample) == ped_entry.family_id
+        assert index.sex(sample) == ped_entry.sex
+        assert index.is_affected(sample) == (ped_entry.affected is True)
+    assert [index.sample_ids[pos] for pos in index.members('female')] == [
+        'female',
+        'father_2',
+        'mother_2',
+    ]
+    assert {index.sample_ids[pos] for pos in index.parents('male')} == {
+        'mother_1',
+        'father_1',
+    }
+    assert not index.parents('mother_1')
+    assert index.family_call_mask('male', {'male', 'female'}) == (
+        1 << index.ranks[index.positions['male']]
+    )
+    # masks are per family, over member ranks rather than cohort positions
+    assert index.ranks[index.positions['female']] == 0
+    assert index.family_affected[index.family_id('female')] == 0b001
+    with pytest.raises(AttributeError):
+        index.affected = ()
+
+
+def test_moi_runner_shares_family_index(peddy_ped):
+    """
+    a pre-built index is passed to every filter in the runner
+    """
+    index = FamilyIndex(peddy_ped)
+    runner = MOIRunner(pedigree=peddy_ped, target_moi='Unknown', family_index=index)
+    assert all(model.family_index is index for model in runner.filter_list)
+
+
+def test_moi_runner_run_gene(peddy_ped):
+    """
+    gene-level runs return one result list per variant, in input order
+    variants without an affected carrier are dismissed before any model runs
+    """
+    info_dict = {'gnomad_af': 0.0001, 'gnomad_ac': 0, 'gnomad_hom': 0}
+    runner = MOIRunner(pedigree=peddy_ped, target_moi='Monoallelic')
+    passing = SimpleVariant(info=info_dict, het_samples={'male'}, coords=TEST_COORDS)
+    unaffected = SimpleVariant(
+        info=info_dict, het_samples={'father_1'}, coords=TEST_COORDS2
+    )
+    no_calls = SimpleVariant(info=info_dict, coords=TEST_COORDS2)
+
+    with mock.patch.object(DominantAutosomal, 'run', return_value=[]) as patched:
+        assert runner.run_gene([unaffected, no_calls]) == [[], []]
+        patched.assert_not_called()
+
+    results = runner.run_gene([no_calls, passing, unaffected])
+    assert [len(result) for result in results] == [0, 1, 0]
+    assert results[1][0].sample == 'male'
+    assert results[1] == runner.run(passing, partial_pen=True)
+
+
+def test_moi_runner_run_gene_shares_carriers(peddy_ped):
+    """
+    carrier lookups are built once per variant, and shared by every model
+    """
+    info_dict = {'gnomad_af': 0.0001, 'gnomad_ac': 0, 'gnomad_hom': 0}
+    runner = MOIRunner(pedigree=peddy_ped, target_moi='Unknown')
+    variant = SimpleVariant(
+        info=info_dict,
+        het_samples={'male', 'father_1'},
+        hom_samples={'female'},
+        coords=TEST_COORDS,
+    )
+    carriers = VariantCarriers(variant, runner.family_index, minimum_depth=10)
+    assert carriers.carriers == {'male', 'father_1', 'female'}
+    assert carriers.probands == {'male', 'female'}
+
+    with mock.patch.object(
+        DominantAutosomal, 'run', return_value=[]
+    ) as dominant, mock.patch.object(
+        RecessiveAutosomalHomo, 'run', return_value=[]
+    ) as homozygous:
+        runner.run_gene([variant])
+    shared = dominant.call_args.kwargs['carriers']
+    assert homozygous.call_args.kwargs['carriers'] is shared
+    assert shared.probands == carriers.probands
@@ -4,7 +4,9 @@ test class for the utils collection
 
 from copy import deepcopy
 from dataclasses import dataclass
+import json
 from typing import List
+import numpy as np
 import pytest
 from cyvcf2 import VCFReader
 from reanalysis.utils import (
@@ -12,13 +14,19 @@ from reanalysis.utils import (
     Coordinates,
     find_comp_hets,
     gather_gene_dict_from_contig,
+    get_category_fields,
     get_new_gene_map,
     get_non_ref_samples,
+    get_sample_index,
     get_simple_moi,
     identify_file_type,
     FileTypes,
     MinimalVariant,
+    record_has_categories,
     ReportedVariant,
+    CarrierValues,
+    TranscriptConsequences,
+    write_results_json,
 )
 
 
@@ -150,6 +158,29 @@ def test_get_non_ref_samples():
     assert hom == {'d'}
 
 
+def test_carrier_values():
+    """
+    only carrier values are retained, read via the shared index
+    """
+    sample_index = get_sample_index(['a', 'b', 'c', 'd'])
+    assert sample_index == {'a': 0, 'b': 1, 'c': 2, 'd': 3}
+    lookup = CarrierValues(np.array([5, 12, 30, 8]), np.array([1, 3]), sample_index)
+    assert lookup['b'] == 12.0
+    assert lookup['d'] == 8.0
+    assert lookup.get('a', 0.0) == 0.0
+    assert 'c' not in lookup
+    assert dict(lookup) == {'b': 12.0, 'd': 8.0}
+
+    # AB values at the ratio thresholds are held without rounding
+    ratios = CarrierValues(
+        np.array([0.0, 3 / 20, 0.0, 17 / 20]), np.array([1, 3]), sample_index
+    )
+    assert ratios['b'] == 3 / 20 and ratios['b'] <= 0.15
+    assert ratios['d'] == 17 / 20 and ratios['d'] <= 0.85
+    sparse = CarrierValues.from_carriers([3 / 20, 17 / 20], [1, 3], sample_index)
+    assert dict(sparse) == dict(ratios)
+
+
 def test_av_categories(trio_abs_variant: AbstractVariant):
     """
     Cat. 3, and Cat. 4 for PROBAND only:
@@ -189,6 +220,37 @@ def test_gene_dict(two_trio_variants_vcf):
     assert len(var_dict['ENSG00000075043']) == 2
 
 
+def test_gene_dict_blacklist(two_trio_variants_vcf):
+    """
+    a blacklisted variant is dropped before it becomes an AbstractVariant
+    """
+    reader = VCFReader(two_trio_variants_vcf)
+    var_dict = gather_gene_dict_from_contig(
+        contig='chr20',
+        variant_source=reader,
+        new_gene_map={},
+        blacklist={'20-63406931-C-CGG'},
+    )
+    assert len(var_dict['ENSG00000075043']) == 1
+    assert var_dict['ENSG00000075043'][0].coords.string_format == '20-63406991-C-CGG'
+
+
+def test_record_has_categories(two_trio_variants_vcf):
+    """
+    the raw-record check only reads category INFO fields
+    variant 1 is Cat. 3 & 4, so stays classified as a singleton
+    """
+    reader = VCFReader(two_trio_variants_vcf)
+    category_fields = get_category_fields(reader)
+    assert 'categoryboolean1' in category_fields
+    assert 'gene_id' not in category_fields
+    variant = next(reader)
+    assert record_has_categories(variant, category_fields)
+    assert record_has_categories(variant, category_fields, singletons=True)
+    assert not record_has_categories(variant, ['categoryboolean1'])
+    assert not record_has_categories(variant, ['categorysample4'], singletons=True)
+
+
 def test_comp_hets(two_trio_abs_variants: list[AbstractVariant], peddy_ped):
     """
     {
@@ -209,6 +271,31 @@ def test_comp_hets(two_trio_abs_variants: list[AbstractVariant], peddy_ped):
     assert results[key_2][0].coords.string_format == key_1
 
 
+def test_comp_hets_per_sample(peddy_ped):
+    """
+    pairs are only formed within each sample's own het calls
+    'male' is het for all three, 'mother_1' for the first two only
+    'father_1' is het for one variant, so has no pairs
+    """
+
+    @dataclass
+    class HetVariant:
+        """test_fixture"""
+
+        coords: Coordinates
+        het_samples: set[str]
+        phased: dict
+
+    var_1 = HetVariant(Coordinates('1', 1, 'A', 'C'), {'male', 'mother_1'}, {})
+    var_2 = HetVariant(Coordinates('1', 2, 'A', 'C'), {'male', 'mother_1'}, {})
+    var_3 = HetVariant(Coordinates('1', 3, 'A', 'C'), {'male', 'father_1'}, {})
+    ch_dict = find_comp_hets([var_1, var_2, var_3], pedigree=peddy_ped)
+    assert set(ch_dict) == {'male', 'mother_1'}
+    assert ch_dict['male']['1-1-A-C'] == [var_2, var_3]
+    assert ch_dict['male']['1-3-A-C'] == [var_1, var_2]
+    assert ch_dict['mother_1'] == {'1-1-A-C': [var_2], '1-2-A-C': [var_1]}
+
+
 def test_phased_dict(phased_vcf_path):
     """
     gene = ENSG00000075043
@@ -317,9 +404,74 @@ def test_new_gene_map_complex():
     }
 
 
+def test_transcript_consequences():
+    """
+    CSQ fields are held as columns, rows are built as dicts on read
+    """
+    csq = TranscriptConsequences('A|ENSG1|T1,A|ENSG1|T2', ['allele', 'gene', 'feature'])
+    assert len(csq) == 2
+    assert csq.column('feature') == ('T1', 'T2')
+    assert csq.column('missing') == ()
+    assert csq[1] == {'allele': 'A', 'gene': 'ENSG1', 'feature': 'T2'}
+    assert list(csq) == [
+        {'allele': 'A', 'gene': 'ENSG1', 'feature': 'T1'},
+        {'allele': 'A', 'gene': 'ENSG1', 'feature': 'T2'},
+    ]
+
+
+def test_lazy_csq(trio_abs_variant: AbstractVariant):
+    """
+    CSQ is only parsed when transcript consequences are first read
+    """
+    # pylint: disable=protected-access
+    assert trio_abs_variant._transcript_consequences is None
+    consequences = trio_abs_variant.transcript_consequences
+    assert isinstance(consequences, TranscriptConsequences)
+    assert trio_abs_variant._csq_contents is None
+    assert trio_abs_variant.transcript_consequences is consequences
+
+
 def test_minimise(trio_abs_variant: AbstractVariant):
     """
     check the variant minimiser
     """
     minvar = MinimalVariant(trio_abs_variant, 'male')
     assert sorted(minvar.categories) == ['3', '4']
+
+
+@pytest.mark.parametrize('use_orjson', [False, True])
+def test_write_results_json(trio_abs_variant: AbstractVariant, tmp_path, use_orjson):
+    """
+    results are streamed per sample, and read back as a single JSON object
+    """
+    if use_orjson:
+        pytest.importorskip('orjson')
+    report = ReportedVariant(
+        sample='male',
+        family='family_1',
+        gene='ENSG00000075043',
+        var_data=MinimalVariant(trio_abs_variant, 'male'),
+        reasons={'Autosomal Dominant'},
+        genotypes={'male': 'Het'},
+    )
+    results = {
+        'male': {'variants': [report], 'metadata': {'ext_id': 'male'}},
+        'female': {'variants': [], 'metadata': {'ext_id': 'female'}},
+    }
+    output = tmp_path / 'results.json'
+    write_results_json(
+        output, results=results, metadata={'cohort': 'test'}, use_orjson=use_orjson
+    )
+
+    # each sample is consumed as it is written
+    assert not results
+
+    with open(output, encoding='utf-8') as handle:
+        written = json.load(handle)
+    assert written['metadata'] == {'cohort': 'test'}
+    assert list(written['results']) == ['male', 'female']
+    variant = written['results']['male']['variants'][0]
+    assert variant['reasons'] == ['Autosomal Dominant']
+    assert variant['var_data']['coords']['pos'] == 63406931
+    assert sorted(variant['var_data']['categories']) == ['3', '4']
+    assert isinstance(variant['var_data']['transcript_consequences'], list)
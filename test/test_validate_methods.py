@@ -4,10 +4,20 @@ script testing methods within reanalysis/validate_categories.py
 
 from dataclasses import dataclass, field
 
+import hail as hl
+from cpg_utils.config import get_config
+
+from reanalysis.hail_filter_and_label import write_matrix_to_table
+from reanalysis.utils import AbstractVariant, Coordinates
 from reanalysis.validate_categories import (
+    analyse_contig_in_worker,
     clean_and_filter,
     count_families,
+    init_contig_worker,
+    open_labelled_vcf,
+    LabelledTableReader,
     prepare_results_shell,
+    ShardedVCFReader,
 )
 
 
@@ -18,6 +28,7 @@ class PicoVariant:
     """
 
     categories: list
+    coords: Coordinates = field(default_factory=lambda: Coordinates('1', 1, 'A', 'C'))
 
 
 @dataclass
@@ -30,6 +41,7 @@ class PicoReport:
     sample: str
     var_data: PicoVariant
     reasons: set[str] = field(default_factory=set)
+    support_vars: set[str] = field(default_factory=set)
     flags: list[str] = field(default_factory=list)
     panels: dict[str] = field(default_factory=dict)
     independent: bool = False
@@ -37,9 +49,6 @@ class PicoReport:
     def __lt__(self, other):
         return True
 
-    def __eq__(self, other):
-        return False
-
     @property
     def is_independent(self):
         """
@@ -52,12 +61,14 @@ cat_1 = PicoVariant(['1'])
 cat_2 = PicoVariant(['2'])
 cat_none = PicoVariant([])
 
+cat_1_b = PicoVariant(['1'], Coordinates('1', 2, 'A', 'C'))
+
 dirty_data = [
     PicoReport('ENSG1', 'sam1', cat_1),
     PicoReport('ENSG2', 'sam1', cat_none),
     PicoReport('ENSG3', 'sam2', cat_none),
     PicoReport('ENSG4', 'sam3', cat_2),
-    PicoReport('ENSG5', 'sam3', cat_1),
+    PicoReport('ENSG5', 'sam3', cat_1_b),
 ]
 panel_genes = {
     'metadata': [
@@ -173,6 +184,38 @@ def test_gene_clean_results_no_personal():
     assert {x.gene for x in clean['sam3']['variants']} == {'ENSG4', 'ENSG5'}
 
 
+def test_gene_clean_results_merge_duplicates():
+    """
+    events for the same sample & coordinates are merged into one
+    """
+    results_holder = {'sam1': {'variants': []}}
+    duplicates = [
+        PicoReport(
+            'ENSG1',
+            'sam1',
+            PicoVariant(['1']),
+            reasons={'Autosomal Dominant'},
+            flags=['AB Ratio'],
+        ),
+        PicoReport(
+            'ENSG4',
+            'sam1',
+            PicoVariant(['2']),
+            reasons={'Autosomal Recessive Comp-Het'},
+            support_vars={'1-5-A-C'},
+        ),
+    ]
+    clean = clean_and_filter(
+        results_holder=results_holder, result_list=duplicates, panelapp_data=panel_genes
+    )
+    assert len(clean['sam1']['variants']) == 1
+    event = clean['sam1']['variants'][0]
+    assert event.gene == 'ENSG1,ENSG4'
+    assert event.reasons == {'Autosomal Dominant', 'Autosomal Recessive Comp-Het'}
+    assert event.support_vars == {'1-5-A-C'}
+    assert event.flags == ['AB Ratio']
+
+
 def test_gene_clean_results_personal():
     """
     tests the per-participant gene-filtering of results
@@ -242,3 +285,141 @@ def test_update_results_quad(quad_ped):
         pedigree=quad_ped,
         samples=ped_samples,
     ) == {'affected': 1, 'male': 3, 'female': 1, 'quads': 1}
+
+
+def test_contig_worker(two_trio_variants_vcf, ped_path):
+    """
+    run the worker-process path in this process, on the trio variants
+    both variants should be reported as dominant and as a comp-het pair
+    """
+    panelapp = {
+        'metadata': [{'id': 137, 'name': 'Mendeliome'}],
+        'genes': {'ENSG00000075043': {'moi': 'Mono_And_Biallelic', 'panels': [137]}},
+    }
+    init_contig_worker(
+        labelled_vcf=str(two_trio_variants_vcf),
+        pedigree=ped_path,
+        panelapp_data=panelapp,
+        new_gene_map={},
+        singletons=False,
+    )
+    results = analyse_contig_in_worker('chr20')
+    assert len(results) == 4
+    assert {result.sample for result in results} == {'male'}
+    assert {tuple(result.reasons) for result in results} == {
+        ('Autosomal Dominant',),
+        ('Autosomal Recessive Comp-Het',),
+    }
+
+
+def test_contig_worker_sharded_vcf(two_trio_variants_vcf, ped_path, tmp_path):
+    """
+    the same trio variants, exported by hail as one shard per variant
+    the comp-het pair spans both shards, so it is only found if the
+    region queries are chained across the shard directory
+    """
+    shard_dir = str(tmp_path / 'labelled.vcf.bgz')
+    mt = hl.import_vcf(str(two_trio_variants_vcf), force_bgz=True)
+    hl.export_vcf(mt.repartition(2), shard_dir, parallel='header_per_shard', tabix=True)
+    reader = open_labelled_vcf(shard_dir)
+    assert isinstance(reader, ShardedVCFReader)
+    assert len(reader.shards) == 2
+    assert len(list(reader('chr20'))) == 2
+
+    # shards are only opened for regions within their indexed bounds
+    for bounds in reader.bounds:
+        start, end = bounds['chr20']
+        assert start < 63406931 and end > 63406991
+    assert reader.overlapping_shards('chr20:63406931-63406931') == reader.shards
+    assert not reader.overlapping_shards('chr20:1-1000')
+    assert not reader.overlapping_shards('chr1')
+
+    panelapp = {
+        'metadata': [{'id': 137, 'name': 'Mendeliome'}],
+        'genes': {'ENSG00000075043': {'moi': 'Mono_And_Biallelic', 'panels': [137]}},
+    }
+    init_contig_worker(
+        labelled_vcf=shard_dir,
+        pedigree=ped_path,
+        panelapp_data=panelapp,
+        new_gene_map={},
+        singletons=False,
+    )
+    results = analyse_contig_in_worker('chr20')
+    assert len(results) == 4
+    assert 'Autosomal Recessive Comp-Het' in {
+        reason for result in results for reason in result.reasons
+    }
+
+
+def test_contig_worker_hail_table(two_trio_variants_vcf, ped_path, tmp_path):
+    """
+    the same trio variants, handed over as a labelled Hail Table
+    the transcript structs are rebuilt from the VCF's CSQ strings
+    results should match the VCF input, without parsing CSQ in the MOI stage
+    """
+    csq_fields = get_config()['csq']['csq_string']
+    mt = hl.import_vcf(str(two_trio_variants_vcf), force_bgz=True)
+    mt = mt.annotate_rows(
+        info=mt.info.drop('CSQ'),
+        transcripts=mt.info.CSQ.map(
+            lambda csq: hl.rbind(
+                csq.split('\\|'),
+                lambda values: hl.struct(
+                    **{field: values[index] for index, field in enumerate(csq_fields)}
+                ),
+            )
+        ),
+    )
+    table_path = str(tmp_path / 'labelled.ht')
+    write_matrix_to_table(mt, table_out=table_path)
+
+    reader = open_labelled_vcf(table_path)
+    assert isinstance(reader, LabelledTableReader)
+    assert reader.samples == ['male', 'father_1', 'mother_1']
+    assert reader.contigs == ['chr20']
+    assert not list(reader('chr1'))
+
+    # carriers are read sparsely, and match the genotypes read from the VCF
+    vcf_reader = open_labelled_vcf(str(two_trio_variants_vcf))
+    for vcf_record, table_record in zip(vcf_reader('chr20'), reader('chr20')):
+        assert not hasattr(table_record, 'gt_types')
+        vcf_variant = AbstractVariant(vcf_record, vcf_reader.samples)
+        table_variant = AbstractVariant(table_record, reader.samples)
+        assert vcf_variant.het_samples == table_variant.het_samples
+        assert vcf_variant.hom_samples == table_variant.hom_samples
+        assert dict(vcf_variant.depths) == dict(table_variant.depths)
+        assert dict(vcf_variant.ab_ratios) == dict(table_variant.ab_ratios)
+        assert vcf_variant.phased == table_variant.phased
+
+    panelapp = {
+        'metadata': [{'id': 137, 'name': 'Mendeliome'}],
+        'genes': {'ENSG00000075043': {'moi': 'Mono_And_Biallelic', 'panels': [137]}},
+    }
+    init_contig_worker(
+        labelled_vcf=str(two_trio_variants_vcf),
+        pedigree=ped_path,
+        panelapp_data=panelapp,
+        new_gene_map={},
+        singletons=False,
+    )
+    from_vcf = analyse_contig_in_worker('chr20')
+    init_contig_worker(
+        labelled_vcf=table_path,
+        pedigree=ped_path,
+        panelapp_data=panelapp,
+        new_gene_map={},
+        singletons=False,
+    )
+    from_table = analyse_contig_in_worker('chr20')
+
+    assert len(from_table) == 4
+    for vcf_result, table_result in zip(sorted(from_vcf), sorted(from_table)):
+        assert vcf_result.reasons == table_result.reasons
+        assert vcf_result.var_data.coords == table_result.var_data.coords
+        assert vcf_result.var_data.info == table_result.var_data.info
+        assert list(vcf_result.var_data.transcript_consequences) == list(
+            table_result.var_data.transcript_consequences
+        )
+        assert vcf_result.var_data.categories == table_result.var_data.categories
+        assert vcf_result.flags == table_result.flags